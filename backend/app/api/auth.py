@@ -1,15 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from cachetools import TTLCache
 from datetime import datetime, timedelta
 from typing import Optional
 from pydantic import BaseModel
+import threading
+import time
 from ..core.config import settings
+from ..services.user_store import UserStore
 
 router = APIRouter()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
 class Token(BaseModel):
     access_token: str
@@ -20,8 +25,18 @@ class User(BaseModel):
     email: Optional[str] = None
     disabled: Optional[bool] = None
 
-# This is a simple in-memory user store. In production, use a database
-fake_users_db = {}
+# Persistent user store shared by all worker processes
+user_store = UserStore(settings.USER_DB_PATH)
+
+# Verified JWT claims keyed by token, so repeat requests skip signature verification
+_token_cache = TTLCache(maxsize=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL_SECONDS)
+_token_cache_lock = threading.Lock()
+
+credentials_exception = HTTPException(
+    status_code=401,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -30,37 +45,62 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm="HS256")
     return encoded_jwt
 
+def verify_token(token: str) -> dict:
+    """Decode and verify a JWT, serving repeat lookups from the bounded claims cache."""
+    with _token_cache_lock:
+        claims = _token_cache.get(token)
+    # The TTL bounds staleness; the expiry check keeps a cached token from outliving its exp claim
+    if claims is not None and claims.get("exp", 0) > time.time():
+        return claims
+
+    try:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+    except JWTError:
+        raise credentials_exception
+    if not claims.get("sub"):
+        raise credentials_exception
+
+    with _token_cache_lock:
+        _token_cache[token] = claims
+    return claims
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    claims = verify_token(token)
+    return User(username=claims["sub"])
+
 @router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = fake_users_db.get(form_data.username)
+    user = await run_in_threadpool(user_store.get, form_data.username)
     if not user:
         raise HTTPException(
             status_code=401,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    if not pwd_context.verify(form_data.password, user["hashed_password"]):
+
+    # bcrypt takes 100-300 ms of CPU; keep it off the event loop
+    if not await run_in_threadpool(pwd_context.verify, form_data.password, user["hashed_password"]):
         raise HTTPException(
             status_code=401,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+
     access_token = create_access_token(data={"sub": user["username"]})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/register")
 async def register_user(username: str, password: str, email: Optional[str] = None):
-    if username in fake_users_db:
+    if await run_in_threadpool(user_store.exists, username):
+        raise HTTPException(status_code=400, detail="Username already registered")
+
+    hashed_password = await run_in_threadpool(pwd_context.hash, password)
+    # The insert is the source of truth, in case another worker registered the name meanwhile
+    if not await run_in_threadpool(user_store.create, username, hashed_password, email):
         raise HTTPException(status_code=400, detail="Username already registered")
-    
-    hashed_password = pwd_context.hash(password)
-    fake_users_db[username] = {
-        "username": username,
-        "hashed_password": hashed_password,
-        "email": email,
-        "disabled": False
-    }
-    
-    return {"message": "User registered successfully"} 
\ No newline at end of file
+
+    return {"message": "User registered successfully"}
+
+@router.get("/me", response_model=User)
+async def read_current_user(current_user: User = Depends(get_current_user)):
+    return current_user
@@ -1,20 +1,30 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, BackgroundTasks
+from ..core.responses import response_class_for
+from fastapi.concurrency import run_in_threadpool
 from typing import List
+import asyncio
 import uuid
 import os
 import aiofiles
 from ..core.config import settings
-from ..services.document_processor import DocumentProcessor
+from ..services.document_processor import DocumentProcessor, SEARCH_MODES
+from ..services.theme_index import theme_index
+from ..services.digests import digest_store, digest_builder
+from ..services.vector_store import open_collection
 from datetime import datetime
-import chromadb
 import shutil
+import logging
+from ..core.metrics import INGESTION_IN_PROGRESS
 
-router = APIRouter()
+DocumentsResponse = response_class_for("documents")
+router = APIRouter(default_response_class=DocumentsResponse)
+logger = logging.getLogger(__name__)
 
-chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY)
-doc_collection = chroma_client.get_or_create_collection("documents")
+doc_collection = open_collection("documents")
 document_processor = DocumentProcessor(doc_collection)
+# One extraction at a time per worker: IngestBudget measures a job's memory as the worker's
+# growth, and OCR already uses every core. Waiting uploads hold no threadpool thread.
+extraction_slot = asyncio.Semaphore(1)
 
 def get_next_doc_id(counter_path: str) -> str:
     """Get next document ID (e.g., DOC001), scoped to a session (timestamped folder)."""
@@ -34,7 +44,7 @@ def get_next_doc_id(counter_path: str) -> str:
 
 
 @router.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+async def upload_document(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """Upload and process a document."""
     try:
         # Validate file size
@@ -67,22 +77,28 @@ async def upload_document(file: UploadFile = File(...)):
             await out_file.write(content)
         
         # Process document
-        doc_content = document_processor.process_document(file_path)
-        print(doc_content)
+        with INGESTION_IN_PROGRESS.track_inprogress():
+            async with extraction_slot:
+                doc_content = await run_in_threadpool(document_processor.process_document, file_path)
 
-        # Store in vector database
-        document_processor.store_document(doc_id, doc_content) 
-        
-        print("Document stored in vector database")
+            # Store in vector database
+            duplicate = await run_in_threadpool(document_processor.store_document, doc_id, doc_content, timestamp)
+        logger.debug("Stored %s (%d pages) for session %s", doc_id, doc_content["pages"], timestamp)
+        if digest_builder is not None:
+            # Digests are built after the response is sent, off the upload path
+            background_tasks.add_task(digest_builder.build, timestamp, [(doc_id, doc_content)])
         
-        return JSONResponse(
+        return DocumentsResponse(
             content={
                 "message": "Document processed successfully",
                 "document_id": doc_id,
                 "filename": file.filename,
                 "pages": doc_content["pages"],
                 "word_count": doc_content["word_count"],
-                "confidence": doc_content["confidence"]
+                "confidence": doc_content["confidence"],
+                "truncated": doc_content["truncated"],
+                "ingestion": doc_content["ingestion"],
+                "duplicate_of": duplicate["duplicate_of"] if duplicate else None
             },
             status_code=200
         )
@@ -91,7 +107,7 @@ async def upload_document(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/upload_multiple")
-async def upload_multiple_documents(files: List[UploadFile] = File(...)):
+async def upload_multiple_documents(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...)):
     """Upload and process multiple documents at once."""
     try:
         # Generate timestamp folder once per batch
@@ -103,6 +119,7 @@ async def upload_multiple_documents(files: List[UploadFile] = File(...)):
         counter_file = os.path.join(session_dir, "doc_counter.txt")
 
         responses = []
+        processed = []
 
         for file in files:
             content = await file.read()
@@ -123,10 +140,10 @@ async def upload_multiple_documents(files: List[UploadFile] = File(...)):
                 await out_file.write(content)
 
             # Process document
-            doc_content = document_processor.process_document(file_path)
-            
-            # Store in vector database
-            document_processor.store_document(doc_id, doc_content, timestamp)
+            with INGESTION_IN_PROGRESS.track_inprogress():
+                async with extraction_slot:
+                    doc_content = await run_in_threadpool(document_processor.process_document, file_path)
+            processed.append((doc_id, doc_content))
 
             # Append info to responses
             responses.append({
@@ -135,10 +152,20 @@ async def upload_multiple_documents(files: List[UploadFile] = File(...)):
                 "timestamp": timestamp,
                 "pages": doc_content["pages"],
                 "word_count": doc_content["word_count"],
-                "confidence": doc_content["confidence"]
+                "confidence": doc_content["confidence"],
+                "truncated": doc_content["truncated"],
+                "ingestion": doc_content["ingestion"]
             })
 
-        return JSONResponse(
+        # Store the whole batch in the vector database, embedding it in batches
+        duplicates = await run_in_threadpool(document_processor.store_documents, processed, timestamp)
+        for response in responses:
+            duplicate = duplicates.get(response["document_id"])
+            response["duplicate_of"] = duplicate["duplicate_of"] if duplicate else None
+        if digest_builder is not None:
+            background_tasks.add_task(digest_builder.build, timestamp, processed)
+
+        return DocumentsResponse(
             content={
                 "message": "Documents processed successfully",
                 "timestamp_folder": timestamp,
@@ -152,15 +179,43 @@ async def upload_multiple_documents(files: List[UploadFile] = File(...)):
 
         
 @router.post("/query")
-async def query_documents(query: str, n_results: int = 5):
-    """Search documents based on a query."""
+async def query_documents(query: str, n_results: int = 5, mode: str = "hybrid", timestamp: str = Query(None)):
+    """
+    Search documents based on a query.
+    `mode` is one of keyword (BM25), vector or hybrid; optionally filter by comma-separated timestamps.
+    """
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SEARCH_MODES)}")
     try:
-        results = await document_processor.search_documents(query, n_results)
-        return JSONResponse(content=results, status_code=200)
+        timestamps = [t.strip() for t in timestamp.split(",") if t.strip()] if timestamp else None
+        # Vector search runs the embedding model, so keep it off the event loop
+        results = await run_in_threadpool(document_processor.search_documents, query, n_results, mode, timestamps)
+        return DocumentsResponse(content=results, status_code=200)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/embeddings/stats")
+async def embedding_stats():
+    """Embedding cache hit rate and throughput per batch size."""
+    return DocumentsResponse(content=document_processor.embedder.stats(), status_code=200)
+
+@router.get("/digests/{timestamp}")
+async def session_digests(timestamp: str):
+    """Precomputed digests (summary, entities, key sentences with pages) of a session's documents."""
+    if digest_store is None:
+        raise HTTPException(status_code=404, detail="Document digests are disabled")
+    return DocumentsResponse(content={"session": timestamp, "digests": digest_store.for_session(timestamp)},
+                             status_code=200)
+
+@router.post("/digests/{timestamp}/rebuild")
+async def rebuild_digests(timestamp: str, background_tasks: BackgroundTasks):
+    """Rebuild a session's digests in the background, e.g. for documents stored before digests were enabled."""
+    if digest_builder is None:
+        raise HTTPException(status_code=404, detail="Document digests are disabled")
+    background_tasks.add_task(digest_builder.build_session, document_processor.collection, timestamp)
+    return DocumentsResponse(content={"message": f"Rebuilding digests for session {timestamp}"}, status_code=202)
+
 @router.delete("/delete")
 async def delete_document(doc_id: str = Query(...), timestamp: str = Query(...)):
     """
@@ -168,8 +223,10 @@ async def delete_document(doc_id: str = Query(...), timestamp: str = Query(...))
     """
     try:
         # Remove from ChromaDB
-        full_doc_id = f"{timestamp}_{doc_id}"
-        doc_collection.delete(ids=[full_doc_id])
+        document_processor.delete_document(doc_id, timestamp)
+        theme_index.remove_document(f"{timestamp}_{doc_id}")
+        if digest_store is not None:
+            digest_store.delete(f"{timestamp}_{doc_id}")
 
         # Remove file from data folder
         session_dir = os.path.join(settings.UPLOAD_DIRECTORY, timestamp)
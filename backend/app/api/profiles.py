@@ -0,0 +1,25 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from ..core.profiling import profile_store
+
+router = APIRouter()
+
+@router.get("/")
+async def list_profiles():
+    """Recently captured request profiles, newest first."""
+    return profile_store.list()
+
+@router.get("/{profile_id}")
+async def get_profile(profile_id: str, format: str = "json"):
+    """
+    Return a captured profile as a JSON span tree (`format=json`)
+    or as collapsed stacks for flamegraph tools (`format=folded`).
+    """
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return PlainTextResponse("\n".join(profile["folded"]) + "\n")
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be json or folded")
+    return {key: value for key, value in profile.items() if key != "folded"}
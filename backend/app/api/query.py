@@ -1,52 +1,108 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from ..services.query_processor import QueryProcessor
-import chromadb
+from ..services.llm_router import llm_router
+from ..services.llm_scheduler import INTERACTIVE, PRIORITIES
+from ..services.semantic_cache import semantic_cache
+from ..core.pagination import ResultPager, CursorExpired
+from ..core.responses import response_class_for
+from ..services.vector_store import open_collection
 from ..core.config import settings
+from ..core.deadline import Deadline, ClientDisconnected, run_until_disconnected
+from ..core.metrics import REQUESTS_CUT_SHORT
 from typing import List
 import logging
 
-router = APIRouter()
+router = APIRouter(default_response_class=response_class_for("query"))
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY)
-doc_collection = chroma_client.get_or_create_collection("documents")
+doc_collection = open_collection("documents")
 
 # Pass the existing collection from document_processor to QueryProcessor
 query_processor = QueryProcessor(doc_collection)
 
+# Full result sets behind pagination cursors
+result_pager = ResultPager(max_results=settings.RESULT_CURSOR_CACHE_SIZE, ttl_seconds=settings.RESULT_CURSOR_TTL_SECONDS)
+
 @router.get("/query_documents")
-async def query_documents(q: str = Query(...), timestamp: str = Query(None)):
+async def query_documents(request: Request, q: str = Query(None), timestamp: str = Query(None),
+                          page_size: int = Query(None, ge=1), cursor: str = Query(None),
+                          priority: str = Query(INTERACTIVE), deadline: float = Query(None, gt=0)):
     """
     Query each document individually and return answers with citation.
     Optionally filter by multiple timestamps (comma-separated).
     Also return a combined answer synthesized from all document-wise results.
+    With `page_size`, only the first page of `results` is returned along with a `next_cursor`;
+    pass it back as `cursor` to fetch the following page without re-running the query.
+    Bulk callers should pass `priority=batch` so their LLM calls yield to interactive queries.
+    The request stops at `deadline` seconds (capped at QUERY_DEADLINE_SECONDS): documents not yet
+    answered are left out and the response says `truncated: true`. If the client disconnects,
+    all outstanding LLM calls are cancelled.
     """
+    if cursor:
+        try:
+            return result_pager.next_page(cursor, page_size or settings.RESULTS_PAGE_SIZE)
+        except CursorExpired as e:
+            raise HTTPException(status_code=410, detail=str(e))
+    if not q:
+        raise HTTPException(status_code=400, detail="q is required unless a cursor is given")
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of: {', '.join(PRIORITIES)}")
+
     try:
         # Parse timestamps if provided
-        timestamps = timestamp.split(',') if timestamp else None
+        timestamps = [t.strip() for t in timestamp.split(',') if t.strip()] if timestamp else []
+        if not timestamps:
+            raise HTTPException(status_code=400, detail="timestamp is required")
         logger.info(f"Processing query: {q} with timestamps: {timestamps}")
         
-        # Get results for each timestamp
-        all_results = []
-        for ts in timestamps:
-            logger.info(f"Querying documents for timestamp: {ts}")
-            results = await query_processor.process_query(query=q, timestamp=ts)
-            logger.info(f"Found {len(results)} results for timestamp {ts}")
-            all_results.extend(results)
-        logger.info(f"Total results found: {len(all_results)}")
-
-        # --- NEW: Generate a combined answer from all document-wise results ---
-        # Synthesize a single answer using the LLM
-        combined_answer = await query_processor.synthesize_combined_answer(q, all_results)
-
-        return {
+        budget = Deadline.capped(deadline, settings.QUERY_DEADLINE_SECONDS)
+
+        async def answer():
+            # One storage pass and one LLM budget for all requested sessions
+            all_results = await query_processor.process_sessions(q, timestamps, priority, budget)
+            logger.info(f"Total results found: {len(all_results)}")
+
+            # --- NEW: Generate a combined answer from all document-wise results ---
+            # Synthesize a single answer using the LLM
+            combined_answer = await query_processor.synthesize_combined_answer(q, all_results, priority, budget)
+            return all_results, combined_answer
+
+        all_results, combined_answer = await run_until_disconnected(
+            request, answer(), poll_interval=settings.DISCONNECT_POLL_SECONDS)
+        if budget.truncated:
+            REQUESTS_CUT_SHORT.inc(endpoint="query", reason="deadline")
+
+        payload = {
             "query": q,
             "combined_answer": combined_answer,
-            "results": all_results
+            "results": all_results,
+            "truncated": budget.truncated
         }
+        if page_size:
+            return result_pager.first_page(payload, "results", page_size)
+        return payload
+    except ClientDisconnected:
+        REQUESTS_CUT_SHORT.inc(endpoint="query", reason="disconnect")
+        logger.info(f"Client disconnected; cancelled query: {q}")
+        # Nobody is listening; 499 is the conventional "client closed request" status for logs
+        return Response(status_code=499)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+@router.get("/providers")
+async def provider_stats():
+    """Per-provider latency, error rate, health and rate-limit quota as seen by the LLM router."""
+    return llm_router.stats()
+
+@router.get("/cache/stats")
+async def query_cache_stats():
+    """Hit rate and size of the semantic query cache."""
+    if semantic_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **semantic_cache.stats()}
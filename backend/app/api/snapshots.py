@@ -0,0 +1,67 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+import os
+import shutil
+import tempfile
+import logging
+from ..core.responses import response_class_for
+from ..services.snapshot import SessionSnapshotter, SnapshotError, SessionExists, SNAPSHOT_MEDIA_TYPE
+from ..services.digests import digest_store, digest_builder
+from .documents import document_processor
+from .themes import theme_collection
+
+router = APIRouter(default_response_class=response_class_for("snapshots"))
+logger = logging.getLogger(__name__)
+
+# Share the documents router's processor so its keyword and duplicate indexes see imported documents
+snapshotter = SessionSnapshotter(document_processor, theme_collection)
+
+def _temporary_path() -> str:
+    fd, path = tempfile.mkstemp(suffix=".arrow")
+    os.close(fd)
+    return path
+
+@router.get("/{timestamp}")
+async def export_snapshot(timestamp: str):
+    """Download a session (text, metadata, embeddings and its themes) as an Arrow IPC file."""
+    path = _temporary_path()
+    try:
+        await run_in_threadpool(snapshotter.export_session, timestamp, path)
+    except SnapshotError as e:
+        os.remove(path)
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        os.remove(path)
+        raise HTTPException(status_code=500, detail=str(e))
+    return FileResponse(path, media_type=SNAPSHOT_MEDIA_TYPE, filename=f"{timestamp}.arrow",
+                        background=BackgroundTask(os.remove, path))
+
+@router.post("/import")
+async def import_snapshot(background_tasks: BackgroundTasks, file: UploadFile = File(...),
+                          timestamp: str = Query(None), replace: bool = False):
+    """
+    Restore a session from a snapshot without re-extracting or re-embedding it.
+    `timestamp` imports it under a different session; `replace` overwrites a session that already exists.
+    Document digests are not part of the snapshot and are rebuilt in the background.
+    """
+    path = _temporary_path()
+    try:
+        # Spool the upload to disk so the import can memory-map it
+        with open(path, "wb") as out_file:
+            await run_in_threadpool(shutil.copyfileobj, file.file, out_file, 1024 * 1024)
+        result = await run_in_threadpool(snapshotter.import_session, path, timestamp, replace)
+        if digest_builder is not None:
+            digest_store.delete_session(result["session"])
+            background_tasks.add_task(digest_builder.build_session, document_processor.collection, result["session"])
+        return result
+    except SessionExists as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Snapshot import failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        os.remove(path)
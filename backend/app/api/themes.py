@@ -1,18 +1,21 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from ..core.responses import response_class_for
 from typing import List, Dict, Any
 from ..services.theme_identifier import ThemeIdentifier
+from ..services.theme_index import theme_index
 from pydantic import BaseModel
 from ..services.document_processor import DocumentProcessor
-import chromadb
+from ..services.vector_store import open_collection
 from ..core.config import settings
+from ..core.deadline import Deadline, ClientDisconnected, run_until_disconnected
+from ..core.metrics import REQUESTS_CUT_SHORT
 
-router = APIRouter()
+ThemesResponse = response_class_for("themes")
+router = APIRouter(default_response_class=ThemesResponse)
 
-chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY)
-
-doc_collection = chroma_client.get_or_create_collection("documents")
-theme_collection = chroma_client.get_or_create_collection("themes")
+doc_collection = open_collection("documents")
+theme_collection = open_collection("themes")
 
 theme_identifier = ThemeIdentifier(doc_collection, theme_collection)
 
@@ -21,37 +24,55 @@ class ThemeRequest(BaseModel):
     document_ids: List[str]
 
 @router.get("/analyze")
-async def analyze_themes(timestamp: str):
-    """Analyze and identify themes across provided documents. Accepts comma-separated timestamps."""
+async def analyze_themes(request: Request, timestamp: str, deadline: float = Query(None, gt=0)):
+    """
+    Analyze and identify themes across provided documents. Accepts comma-separated timestamps.
+    The analysis stops at `deadline` seconds (capped at THEME_DEADLINE_SECONDS) and returns
+    `truncated: true` without themes; it is cancelled outright if the client disconnects.
+    """
+    budget = Deadline.capped(deadline, settings.THEME_DEADLINE_SECONDS)
     try:
         # Support multiple timestamps (comma-separated)
-        timestamps = [t.strip() for t in timestamp.split(",") if t.strip()]
-        # Gather all documents for all timestamps
-        all_document_texts = []
-        all_document_ids = []
-        for ts in timestamps:
-            docs = theme_identifier.get_documents_by_timestamp(ts)
-            all_document_texts.extend(docs["document_texts"])
-            all_document_ids.extend(docs["document_ids"])
+        timestamps = list(dict.fromkeys(t.strip() for t in timestamp.split(",") if t.strip()))
+        if not timestamps:
+            raise HTTPException(status_code=400, detail="timestamp is required")
+        # All sessions in one storage pass, off the event loop
+        all_documents = await run_in_threadpool(theme_identifier.get_documents_by_timestamps, timestamps)
+        # Near-duplicates are collapsed across sessions, not just within each one
+        if theme_identifier.collapse_duplicates:
+            all_documents = theme_identifier.collapse_duplicate_documents(all_documents)
         # Run theme analysis on the combined set
-        themes = await theme_identifier.identify_themes_for_documents(all_document_texts, all_document_ids, timestamps)
-        return JSONResponse(
+        themes = await run_until_disconnected(request, theme_identifier.identify_themes_for_documents(
+            all_documents["document_texts"], all_documents["document_ids"], timestamps,
+            document_keys=all_documents["document_keys"], document_sessions=all_documents["document_sessions"],
+            deadline=budget
+        ), poll_interval=settings.DISCONNECT_POLL_SECONDS)
+        if budget.truncated:
+            REQUESTS_CUT_SHORT.inc(endpoint="themes", reason="deadline")
+        return ThemesResponse(
             content={
                 "themes": themes["themes"],
                 "model_used": themes["model"],
-                "theme_count": len(themes["themes"])
+                "theme_count": len(themes["themes"]),
+                "truncated": budget.truncated
             },
             status_code=200
         )
+    except ClientDisconnected:
+        REQUESTS_CUT_SHORT.inc(endpoint="themes", reason="disconnect")
+        # Nobody is listening; 499 is the conventional "client closed request" status for logs
+        return Response(status_code=499)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/summary/{theme_id}")
 async def get_theme_summary(theme_id: str):
-    theme = theme_collection.get(theme_id)
-    if not theme:
+    theme = theme_collection.get(ids=[theme_id])
+    if not theme["ids"]:
         raise HTTPException(status_code=404, detail="Theme not found")
-    return JSONResponse(
+    return ThemesResponse(
         content={
             "theme_uuuid": theme_id,
             'theme_data': theme['metadatas'][0]
@@ -60,3 +81,37 @@ async def get_theme_summary(theme_id: str):
     )
 
 
+
+@router.get("/index/stats")
+async def theme_index_stats():
+    """Size of the persisted document x theme index."""
+    return theme_index.stats()
+
+@router.get("/index/documents/{document_id}")
+async def themes_for_document(document_id: str):
+    """Themes a stored document (`<timestamp>_<doc_id>`) belongs to, across every analysis run."""
+    return {"document_id": document_id, "themes": theme_index.themes_for_document(document_id)}
+
+@router.get("/index/{theme_id}/documents")
+async def documents_for_theme(theme_id: str):
+    """Documents that share a theme."""
+    documents = theme_index.documents_for_theme(theme_id)
+    if documents is None:
+        raise HTTPException(status_code=404, detail="Theme not found")
+    return {"theme": theme_index.get_theme(theme_id), "documents": documents}
+
+@router.get("/index/{theme_id}/cooccurring")
+async def cooccurring_themes(theme_id: str, n: int = Query(10, ge=1, le=100)):
+    """Themes whose documents overlap this theme's, ranked by Jaccard similarity of the document sets."""
+    themes = theme_index.cooccurring_themes(theme_id, n)
+    if themes is None:
+        raise HTTPException(status_code=404, detail="Theme not found")
+    return {"theme_id": theme_id, "themes": themes}
+
+@router.get("/index/{theme_id}/similar")
+async def similar_themes(theme_id: str, n: int = Query(5, ge=1, le=100), other_runs_only: bool = True):
+    """Nearest themes by embedding similarity, by default only from analyses of other sessions."""
+    themes = theme_index.similar_themes(theme_id, n, other_runs_only)
+    if themes is None:
+        raise HTTPException(status_code=404, detail="Theme not found")
+    return {"theme_id": theme_id, "themes": themes}
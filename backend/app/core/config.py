@@ -13,20 +13,121 @@ class Settings(BaseSettings):
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 8 days
+    USER_DB_PATH: str = os.getenv("USER_DB_PATH", os.path.join("data", "users.db"))  # Shared by all workers
+    TOKEN_CACHE_SIZE: int = 10000  # Verified JWT claims kept per worker
+    TOKEN_CACHE_TTL_SECONDS: int = 300
     
     # AI Models
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
     GOOGLE_API_KEY: Optional[str] = os.getenv("GOOGLE_API_KEY")
     GROQ_API_KEY: Optional[str] = os.getenv("GROQ_API_KEY")
+    OPENAI_MODEL: str = "gpt-4"
+    GEMINI_MODEL: str = "gemini-pro"
+    GROQ_MODEL: str = "llama-3.3-70b-versatile"
+
+    # LLM Routing
+    LLM_PROVIDER_ORDER: str = "openai,gemini,groq"  # Preference order when latencies are unknown or tied
+    LLM_TIMEOUT_SECONDS: float = 60.0
+    LLM_HEDGING_ENABLED: bool = False  # Send a duplicate request to the next provider once the first exceeds its p95
+    LLM_FAILURE_THRESHOLD: int = 3  # Consecutive failures before a provider is put in cooldown
+    LLM_COOLDOWN_SECONDS: float = 30.0
+    QUERY_LLM_CONCURRENCY: int = 8  # Concurrent per-document LLM calls per query, across all its sessions
+    QUERY_DEADLINE_SECONDS: float = 60.0  # Per-request budget; answers still pending are dropped and flagged truncated. 0 = none
+    THEME_DEADLINE_SECONDS: float = 180.0  # 0 = none; a client-supplied deadline still applies
+    DISCONNECT_POLL_SECONDS: float = 0.5  # How often a running query or analysis checks that its client is still there
+    LLM_RATE_LIMITS: str = ""  # Per-provider "requests:tokens" per minute, e.g. "openai=500:30000,groq=30:6000"
+    LLM_BATCH_RESERVE: float = 0.2  # Share of each rate limit that batch work (theme analyses) leaves for interactive queries
+    LLM_RETRY_AFTER_DEFAULT_SECONDS: float = 10.0  # Hold after a 429 that carries no Retry-After header
+    LLM_RATE_LIMIT_RETRIES: int = 2  # Times a rate-limited provider is retried once its hold has passed
+    # Bucket levels and Retry-After holds, shared by all workers so the limits above apply to them together
+    LLM_RATE_STATE_PATH: str = os.getenv("LLM_RATE_STATE_PATH", os.path.join("data", "llm_rate_limits.db"))
+    # e.g. http://localhost:9000/v1 - routes every LLM call to the local simulator instead of real providers
+    LLM_SIMULATOR_URL: Optional[str] = os.getenv("LLM_SIMULATOR_URL")
 
 
     # Vector Database
     CHROMA_PERSIST_DIRECTORY: str = r"C:\Users\Lenovo\OneDrive\Desktop\theme-weaver-chatbot\backend\data\chroma"
-    
+    VECTOR_STORE_BACKEND: str = os.getenv("VECTOR_STORE_BACKEND", "chroma")  # "chroma", "numpy" (exact) or "hnsw"
+    VECTOR_STORE_DIRECTORY: str = os.path.join("data", "vectors")  # numpy / hnsw backends, shared by all workers
+    HNSW_M: int = 16  # Graph degree: higher raises recall, memory and insert time
+    HNSW_EF_CONSTRUCTION: int = 200
+    HNSW_EF_SEARCH: int = 64  # Candidates examined per query: the main recall/latency knob
+    HNSW_BRUTE_FORCE_LIMIT: int = 2048  # Filtered searches over at most this many vectors are answered exactly
+
+    # Keyword / Hybrid Search
+    BM25_K1: float = 1.5
+    BM25_B: float = 0.75
+    SEARCH_RRF_K: int = 60  # Reciprocal rank fusion constant for hybrid search
+    # Adds and deletes replayed by every worker into its in-memory keyword and duplicate indexes
+    DOCUMENT_CHANGES_PATH: str = os.getenv("DOCUMENT_CHANGES_PATH", os.path.join("data", "document_changes.db"))
+
+    # Embeddings
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "onnx")  # "onnx" or "sentence-transformers"
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")  # onnx only provides all-MiniLM-L6-v2
+    EMBEDDING_QUANTIZE: bool = False  # int8 dynamic quantization (sentence-transformers only)
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_CACHE_SIZE: int = 10000  # In-memory entries
+    EMBEDDING_CACHE_PATH: Optional[str] = os.getenv("EMBEDDING_CACHE_PATH")  # SQLite file for a persistent cache
+
+    # Near-Duplicate Detection
+    DEDUP_ENABLED: bool = True
+    DEDUP_THRESHOLD: float = 0.85  # Estimated Jaccard similarity of word shingles to flag a duplicate
+    DEDUP_NUM_PERM: int = 128  # MinHash permutations
+    DEDUP_BANDS: int = 16  # LSH bands; DEDUP_NUM_PERM must be a multiple
+    DEDUP_SHINGLE_SIZE: int = 5  # Words per shingle
+    DEDUP_COLLAPSE: bool = False  # Answer and analyze only the earliest copy per cluster; amended copies are then hidden
+
+    # Semantic Query Cache
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.9  # Cosine similarity above which a prior answer is reused
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 256  # Recent queries kept per session
+    SEMANTIC_CACHE_MAX_SESSIONS: int = 1000
+
+    # Theme Index
+    THEME_INDEX_PATH: str = os.getenv("THEME_INDEX_PATH", os.path.join("data", "themes.db"))  # Shared by all workers
+
+    # Document Digests
+    DIGEST_ENABLED: bool = False  # Build a digest per document after upload; theme analysis reads digests
+    DIGEST_PATH: str = os.getenv("DIGEST_PATH", os.path.join("data", "digests.db"))  # Shared by all workers
+    DIGEST_KEY_SENTENCES: int = 5
+    DIGEST_ENTITIES: int = 10
+    DIGEST_MAX_SENTENCES: int = 300  # Candidate sentences embedded per document, sampled evenly
+    DIGEST_SUMMARY_CHARS: int = 600
+    DIGEST_LLM_SUMMARY: bool = False  # Have the LLM (batch priority) rewrite the summary from the key sentences
+    SYNTHESIS_ANSWER_CHARS: int = 1200  # Per-document answer length read by cross-document synthesis
+
     # Document Storage
     UPLOAD_DIRECTORY: str = r"C:\Users\Lenovo\OneDrive\Desktop\theme-weaver-chatbot\backend\data\uploads"
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
+
+    # Ingestion Budgets
+    INGEST_MEMORY_BUDGET_MB: int = 1024  # Memory one extraction job may grow a worker by; OCR resolution drops to fit
+    INGEST_MAX_PAGES: int = 500  # Pages extracted per document; later pages are skipped and the document flagged
+    INGEST_MAX_TEXT_CHARS: int = 5_000_000  # Extracted text kept per document
+    INGEST_TEXT_MEMORY_MB: int = 8  # Extracted text held in memory before it spills to a temporary file
+    OCR_DPI: int = 200  # Scanned-page rendering resolution when the budget allows
+    OCR_MIN_DPI: int = 100  # Pages that would need a lower resolution to fit are skipped
     
+    # Session Snapshots
+    SNAPSHOT_BATCH_SIZE: int = 1000  # Documents per Arrow record batch (and per vector store write on import)
+    SNAPSHOT_COMPRESSION: Optional[str] = "zstd"  # None keeps embeddings zero-copy under memory mapping
+
+    # Responses
+    GZIP_MINIMUM_SIZE: int = 4096  # Bytes; smaller responses are sent uncompressed
+    GZIP_COMPRESS_LEVEL: int = 5
+    RESULTS_PAGE_SIZE: int = 20  # Default page size when following a cursor
+    RESULT_CURSOR_CACHE_SIZE: int = 256  # Paginated result sets kept per worker
+    RESULT_CURSOR_TTL_SECONDS: int = 600
+
+    # Logging
+    LOG_SAMPLE_RATE: float = 0.01  # Fraction of per-document debug lines emitted when DEBUG is enabled
+
+    # Request Profiling
+    PROFILE_SAMPLE_RATE: float = 0.0  # Fraction of requests profiled without the X-Profile header
+    PROFILE_SLOW_REQUEST_SECONDS: float = 0.0  # Keep a profile for any request slower than this; profiles every request (0 disables)
+    PROFILE_STORE_SIZE: int = 100  # Recent profiles kept in memory
+    PROFILE_DIRECTORY: Optional[str] = os.getenv("PROFILE_DIRECTORY")  # Also write slow-request profiles here
+
     # OCR Configuration
     TESSERACT_CMD: str = os.getenv("TESSERACT_CMD", "tesseract")
     
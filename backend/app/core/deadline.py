@@ -0,0 +1,60 @@
+from typing import Any, Awaitable, Optional
+import asyncio
+import time
+
+from starlette.requests import Request
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the response was ready."""
+
+
+class Deadline:
+    """A per-request time budget shared by every stage of the request.
+
+    Stages ask for `remaining()` seconds and, when they have to stop early, call `truncate()`
+    so the endpoint can flag its response as partial.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.truncated = False
+
+    @classmethod
+    def capped(cls, requested: Optional[float], limit: Optional[float]) -> "Deadline":
+        """A client-requested budget capped at the server's `limit`; a `limit` of 0 or None sets no cap."""
+        if not limit:
+            return cls(requested)
+        if requested is None:
+            return cls(limit)
+        return cls(min(requested, limit))
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None without a budget."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def truncate(self) -> None:
+        self.truncated = True
+
+
+async def run_until_disconnected(request: Request, awaitable: Awaitable, poll_interval: float = 0.5) -> Any:
+    """Await `awaitable`, cancelling it (and every LLM call under it) if the client disconnects first."""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+            # Let the cancellation unwind (queued calls leave the scheduler, in-flight ones abort)
+            await asyncio.gather(task, return_exceptions=True)
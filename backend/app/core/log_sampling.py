@@ -0,0 +1,16 @@
+import logging
+import random
+
+from .config import settings
+
+
+def log_sampled(logger: logging.Logger, level: int, message: str, *args, rate: float = None) -> None:
+    """Log `message` for a random fraction of calls, and only when `level` is enabled.
+
+    The level check comes first so disabled debug output costs no formatting and no random draw.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if random.random() >= (settings.LOG_SAMPLE_RATE if rate is None else rate):
+        return
+    logger.log(level, message, *args)
@@ -0,0 +1,204 @@
+"""Low-overhead in-process metrics with Prometheus text exposition.
+
+Metrics are process-local: with several uvicorn workers each worker exposes its own
+values on /metrics, and the scraper aggregates them.
+"""
+from typing import Dict, List, Tuple, Sequence, Optional
+from contextlib import contextmanager
+import bisect
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (non-cumulative, last is +Inf), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Ingestion
+OCR_PAGE_SECONDS = REGISTRY.register(Histogram(
+    "ocr_page_seconds", "OCR time per page", ["source"]))
+EXTRACTION_TOTAL = REGISTRY.register(Counter(
+    "document_extraction_total", "Documents processed by extraction method", ["method"]))
+INGESTION_IN_PROGRESS = REGISTRY.register(Gauge(
+    "ingestion_in_progress", "Uploads currently being processed"))
+DUPLICATES_TOTAL = REGISTRY.register(Counter(
+    "document_duplicates_total", "Near-duplicate documents flagged at ingestion", ["scope"]))
+INGESTION_PEAK_MEMORY_BYTES = REGISTRY.register(Histogram(
+    "ingestion_peak_memory_bytes", "Peak worker memory growth per extraction job",
+    buckets=[2 ** power for power in range(24, 33)]))  # 16 MiB .. 4 GiB
+INGESTION_DEGRADED_TOTAL = REGISTRY.register(Counter(
+    "ingestion_degraded_total", "Extraction jobs cut short or rendered at reduced resolution", ["reason"]))
+DIGESTS_TOTAL = REGISTRY.register(Counter(
+    "document_digests_total", "Document digests built in the background", ["outcome"]))
+
+# Embeddings and vector store
+EMBEDDING_BATCH_SECONDS = REGISTRY.register(Histogram(
+    "embedding_batch_seconds", "Time to embed one batch", ["backend"]))
+EMBEDDING_TEXTS_TOTAL = REGISTRY.register(Counter(
+    "embedding_texts_total", "Texts looked up in the embedding stage", ["result"]))
+VECTOR_STORE_SECONDS = REGISTRY.register(Histogram(
+    "vector_store_seconds", "Vector store call latency", ["operation"]))
+
+# LLM providers
+LLM_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "llm_request_seconds", "LLM request latency", ["provider", "outcome"]))
+LLM_TOKENS_TOTAL = REGISTRY.register(Counter(
+    "llm_tokens_total", "LLM tokens by provider and direction", ["provider", "direction"]))
+LLM_IN_FLIGHT = REGISTRY.register(Gauge(
+    "llm_requests_in_flight", "LLM requests awaiting a provider response", ["provider"]))
+LLM_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    "llm_queue_seconds", "Time LLM calls waited for rate-limit quota", ["provider", "priority"]))
+LLM_RATE_LIMITED_TOTAL = REGISTRY.register(Counter(
+    "llm_rate_limited_total", "LLM calls rejected by a provider rate limit", ["provider"]))
+
+# Query cache
+SEMANTIC_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "semantic_cache_lookups_total", "Semantic query cache lookups by result", ["result"]))
+
+# Request budgets
+REQUESTS_CUT_SHORT = REGISTRY.register(Counter(
+    "requests_cut_short_total", "Query and theme requests stopped before finishing", ["endpoint", "reason"]))
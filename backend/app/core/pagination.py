@@ -0,0 +1,65 @@
+from typing import Any, Dict, List, Optional, Tuple
+import base64
+import json
+import threading
+import uuid
+
+from cachetools import TTLCache
+
+
+class CursorExpired(Exception):
+    """The cursor is malformed or its result set has been evicted."""
+
+
+class ResultPager:
+    """Serves a large result list in pages without recomputing it.
+
+    The full list is kept in a bounded TTL cache under a result id; cursors encode that id and
+    an offset. The cache is per worker, so a cursor must come back to the worker that issued it
+    (or the client re-runs the request once it expires).
+    """
+
+    def __init__(self, max_results: int = 256, ttl_seconds: int = 600):
+        self._results = TTLCache(maxsize=max_results, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _encode(result_id: str, offset: int) -> str:
+        raw = json.dumps({"r": result_id, "o": offset}, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @staticmethod
+    def _decode(cursor: str) -> Tuple[str, int]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            data = json.loads(raw)
+            return data["r"], int(data["o"])
+        except (ValueError, KeyError, TypeError):
+            raise CursorExpired("Invalid cursor")
+
+    def first_page(self, payload: Dict[str, Any], key: str, page_size: int) -> Dict[str, Any]:
+        """Store `payload[key]` and return `payload` with only the first page of it."""
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            self._results[result_id] = (payload, key)
+        return self._page(result_id, payload, key, 0, page_size)
+
+    def next_page(self, cursor: str, page_size: int) -> Dict[str, Any]:
+        result_id, offset = self._decode(cursor)
+        with self._lock:
+            entry = self._results.get(result_id)
+        if entry is None:
+            raise CursorExpired("Cursor expired")
+        payload, key = entry
+        return self._page(result_id, payload, key, offset, page_size)
+
+    def _page(self, result_id: str, payload: Dict[str, Any], key: str, offset: int, page_size: int) -> Dict[str, Any]:
+        items: List[Any] = payload[key]
+        end = offset + page_size
+        next_cursor: Optional[str] = self._encode(result_id, end) if end < len(items) else None
+        return {
+            **payload,
+            key: items[offset:end],
+            "total_results": len(items),
+            "next_cursor": next_cursor,
+        }
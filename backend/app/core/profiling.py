@@ -0,0 +1,174 @@
+"""Per-request span-tree profiling.
+
+A request is profiled when it sends `X-Profile: 1` or is picked by PROFILE_SAMPLE_RATE. Setting
+PROFILE_SLOW_REQUEST_SECONDS (off by default) profiles every request and keeps the profile only
+when the request turns out to be slow, so each `span` then allocates a node. Code marks
+interesting regions with `span("name")`; outside a profiled request `span` is a no-op costing
+one context-variable lookup. Spans follow the context into `run_in_threadpool` calls, but not
+into bare `loop.run_in_executor`, which does not copy it.
+"""
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+from fastapi import Request
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+
+class Span:
+    __slots__ = ("name", "attributes", "start", "end", "children")
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List["Span"] = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        origin = self.start if origin is None else origin
+        return {
+            "name": self.name,
+            "start_ms": round(1000 * (self.start - origin), 3),
+            "duration_ms": round(1000 * self.duration, 3),
+            "attributes": self.attributes,
+            "children": [child.to_dict(origin) for child in self.children],
+        }
+
+    def folded(self, prefix: str = "") -> List[str]:
+        """Collapsed-stack lines (`a;b;c <self microseconds>`) for flamegraph tools."""
+        path = f"{prefix};{self.name}" if prefix else self.name
+        # Children can overlap when they run concurrently, so self time never goes negative
+        self_time = max(0.0, self.duration - sum(child.duration for child in self.children))
+        lines = [f"{path} {int(self_time * 1e6)}"]
+        for child in self.children:
+            lines.extend(child.folded(path))
+        return lines
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a child span of the current one, if this request is being profiled."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, attributes)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+class ProfileStore:
+    """Bounded in-memory store of recent profiles, newest last."""
+
+    def __init__(self, max_profiles: int = 100):
+        self.max_profiles = max_profiles
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: Dict[str, Any]) -> None:
+        with self._lock:
+            self._profiles[profile["id"]] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {key: profile[key] for key in ("id", "method", "path", "status", "duration_ms", "reason", "created")}
+                for profile in reversed(self._profiles.values())
+            ]
+
+
+profile_store = ProfileStore(settings.PROFILE_STORE_SIZE)
+
+
+def _profile_reason(request: Request) -> Optional[str]:
+    if request.headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes"):
+        return "header"
+    if settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE:
+        return "sampled"
+    if settings.PROFILE_SLOW_REQUEST_SECONDS:
+        return "slow"
+    return None
+
+
+def _write_slow_profile(profile: Dict[str, Any]) -> None:
+    os.makedirs(settings.PROFILE_DIRECTORY, exist_ok=True)
+    path = os.path.join(settings.PROFILE_DIRECTORY, f"{profile['id']}.json")
+    with open(path, "w") as f:
+        json.dump(profile, f)
+
+
+async def profiling_middleware(request: Request, call_next):
+    reason = _profile_reason(request)
+    if reason is None:
+        return await call_next(request)
+
+    root = Span(f"{request.method} {request.url.path}")
+    token = _current_span.set(root)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        root.end = time.perf_counter()
+        _current_span.reset(token)
+
+    slow = bool(settings.PROFILE_SLOW_REQUEST_SECONDS) and root.duration >= settings.PROFILE_SLOW_REQUEST_SECONDS
+    if reason == "slow" and not slow:
+        return response
+
+    profile = {
+        "id": uuid.uuid4().hex,
+        "method": request.method,
+        "path": request.url.path,
+        "query": str(request.url.query),
+        "status": status,
+        "duration_ms": round(1000 * root.duration, 3),
+        "reason": "slow" if slow else reason,
+        "created": time.time(),
+        "root": root.to_dict(),
+        "folded": root.folded(),
+    }
+    profile_store.add(profile)
+    response.headers[PROFILE_ID_HEADER] = profile["id"]
+
+    if slow:
+        logger.warning(f"Slow request {request.method} {request.url.path} took {root.duration:.2f}s "
+                       f"(profile {profile['id']})")
+        if settings.PROFILE_DIRECTORY:
+            try:
+                _write_slow_profile(profile)
+            except OSError as e:
+                logger.error(f"Could not write slow-request profile: {e}")
+    return response
@@ -0,0 +1,32 @@
+from typing import Any, Type
+import time
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+from .metrics import REGISTRY, Histogram
+
+RESPONSE_ENCODE_SECONDS = REGISTRY.register(Histogram(
+    "response_encode_seconds", "JSON response serialization time", ["router"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)))
+RESPONSE_BYTES = REGISTRY.register(Histogram(
+    "response_bytes", "Uncompressed JSON response size", ["router"],
+    buckets=(1e3, 1e4, 1e5, 1e6, 1e7, 1e8)))
+
+
+class MeasuredORJSONResponse(ORJSONResponse):
+    """orjson-encoded response that records encode time and payload size per router."""
+
+    router_name = "default"
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter()
+        body = orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        RESPONSE_ENCODE_SECONDS.observe(time.perf_counter() - start, router=self.router_name)
+        RESPONSE_BYTES.observe(len(body), router=self.router_name)
+        return body
+
+
+def response_class_for(router_name: str) -> Type[MeasuredORJSONResponse]:
+    """A MeasuredORJSONResponse subclass whose metrics are labelled with `router_name`."""
+    return type(f"{router_name.title()}Response", (MeasuredORJSONResponse,), {"router_name": router_name})
@@ -1,7 +1,11 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .api import documents, themes, auth, query
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
+from .api import documents, themes, auth, query, profiles, snapshots
 from .core.config import settings
+from .core.metrics import REGISTRY
+from .core.profiling import profiling_middleware
 
 app = FastAPI(
     title="Document Research & Theme Identification Chatbot",
@@ -16,17 +20,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile-Id"],
 )
 
+# Compress large result payloads
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE, compresslevel=settings.GZIP_COMPRESS_LEVEL)
+
+# Opt-in per-request profiling (X-Profile header, sampling, or slow-request capture)
+app.middleware("http")(profiling_middleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(documents.router, prefix="/api/documents", tags=["Documents"])
 app.include_router(themes.router, prefix="/api/themes", tags=["Themes"])
 app.include_router(query.router, prefix="/api/query", tags=["Query"])
+app.include_router(snapshots.router, prefix="/api/snapshots", tags=["Snapshots"])
+app.include_router(profiles.router, prefix="/api/profiles", tags=["Profiling"])
 
 @app.get("/")
 async def root():
     return {
         "message": "Welcome to Document Research & Theme Identification Chatbot API",
         "version": "1.0.0"
-    } 
\ No newline at end of file
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
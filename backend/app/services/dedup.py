@@ -0,0 +1,159 @@
+from typing import List, Dict, Optional, Tuple, Set
+from collections import defaultdict, OrderedDict
+import re
+import threading
+import zlib
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+")
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+# Shingle hashes are permuted in chunks so a long document never materializes a huge matrix
+_CHUNK = 2048
+
+
+class MinHasher:
+    """MinHash signatures over word shingles.
+
+    Shingles are hashed with CRC32 and the permutations come from a fixed seed, so signatures
+    are stable across processes and restarts.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> Set[str]:
+        words = WORD_PATTERN.findall(text.lower())
+        size = min(self.shingle_size, len(words))
+        return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)} if size else set()
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of `text`, or None if it has no words (e.g. a page OCR could not read)."""
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64,
+                             count=len(shingles))
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        for i in range(0, len(hashes), _CHUNK):
+            permuted = ((np.outer(hashes[i:i + _CHUNK], self._a) + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+            np.minimum(signature, permuted.min(axis=0), out=signature)
+        return signature.astype(np.uint32)
+
+
+def estimated_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard similarity of two documents' shingle sets, estimated from their signatures."""
+    return float(np.mean(a == b))
+
+
+class NearDuplicateIndex:
+    """LSH index over MinHash signatures for flagging near-duplicate documents.
+
+    Signatures are split into `bands` bands; documents sharing any band bucket become candidates,
+    and a candidate is a duplicate when its estimated Jaccard similarity reaches `threshold`.
+    Every duplicate points at one representative (the earliest copy still indexed), so a cluster
+    of re-scans and amended versions can be collapsed to a single document.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, threshold: float = 0.85, shingle_size: int = 5):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = defaultdict(set)
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._representatives: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _best_match(self, signature: np.ndarray) -> Optional[Tuple[str, float]]:
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self._buckets.get(band_key, ()))
+        best = None
+        for candidate in candidates:
+            similarity = estimated_similarity(signature, self._signatures[candidate])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        return best
+
+    def add(self, key: str, text: str) -> Optional[Tuple[str, float]]:
+        """Index a document; returns (representative key, similarity) if it duplicates one already indexed."""
+        signature = self.hasher.signature(text)
+        with self._lock:
+            self._remove(key)
+            if signature is None:
+                return None
+            match = self._best_match(signature)
+            self._signatures[key] = signature
+            for band_key in self._band_keys(signature):
+                self._buckets[band_key].add(key)
+            if match is None:
+                return None
+            representative = self._representatives.get(match[0], match[0])
+            if representative not in self._signatures:
+                representative = match[0]
+            self._representatives[key] = representative
+            return representative, match[1]
+
+    def load(self, key: str, text: str, representative: Optional[str] = None) -> None:
+        """Index a stored document with its recorded representative, without re-matching it."""
+        signature = self.hasher.signature(text)
+        with self._lock:
+            self._remove(key)
+            if signature is None:
+                return
+            self._signatures[key] = signature
+            for band_key in self._band_keys(signature):
+                self._buckets[band_key].add(key)
+            if representative:
+                self._representatives[key] = representative
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        signature = self._signatures.pop(key, None)
+        self._representatives.pop(key, None)
+        if signature is None:
+            return
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._signatures
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+
+def group_duplicates(keys: List[str], duplicate_of: List[Optional[str]]) -> "OrderedDict[str, List[str]]":
+    """Group `keys` into duplicate clusters: representative key -> keys of its duplicates.
+
+    A document whose representative is not among `keys` (deleted, or in a session that was
+    not requested) stands for its own cluster.
+    """
+    present = set(keys)
+    groups: "OrderedDict[str, List[str]]" = OrderedDict()
+    for key, representative in zip(keys, duplicate_of):
+        if representative and representative in present and representative != key:
+            groups.setdefault(representative, []).append(key)
+        else:
+            groups.setdefault(key, [])
+    return groups
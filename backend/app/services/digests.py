@@ -0,0 +1,281 @@
+"""Ingest-time document digests: a short summary, key entities and key sentences with page references.
+
+Digests are built in the background after an upload is stored and kept in a SQLite file shared
+by all workers. Theme analysis prompts are assembled from them instead of raw document text,
+so prompt size no longer grows with document length.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from bisect import bisect_right
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..core.config import settings
+from ..core.metrics import DIGESTS_TOTAL, VECTOR_STORE_SECONDS
+from .embeddings import embedding_service
+from .llm_router import llm_router
+from .llm_scheduler import BATCH
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]*")
+ENTITY_PATTERN = re.compile(r"\b[A-Z][\w&'-]*(?:\s+(?:(?:of|for|de|&)\s+)?[A-Z][\w&'-]*)*")
+# Capitalized words that are almost never names on their own
+ENTITY_STOPWORDS = {
+    "The", "This", "That", "These", "Those", "It", "In", "On", "At", "For", "And", "But", "Or", "If", "As",
+    "A", "An", "We", "I", "He", "She", "They", "Our", "Its", "By", "To", "Of", "With", "From", "Page",
+}
+DIGEST_SYSTEM_PROMPT = "You write short, factual document summaries."
+
+_MIN_SENTENCE_WORDS = 6
+_MAX_SENTENCE_WORDS = 80
+_MMR_DIVERSITY = 0.3
+
+
+def parse_page_offsets(value: Optional[str]) -> List[int]:
+    """Page start offsets as stored in document metadata ("0,1523,3310")."""
+    return [int(offset) for offset in value.split(",") if offset] if value else []
+
+
+def split_sentences(text: str) -> List[Tuple[int, str]]:
+    """(character offset, sentence) pairs; line breaks end a sentence as well as punctuation."""
+    sentences = []
+    for match in SENTENCE_PATTERN.finditer(text):
+        sentence = match.group().strip()
+        if sentence:
+            sentences.append((match.start() + len(match.group()) - len(match.group().lstrip()), sentence))
+    return sentences
+
+
+def extract_entities(sentences: List[Tuple[int, str]], limit: int) -> List[str]:
+    """Most frequent capitalized phrases and acronyms, skipping lone sentence-initial words."""
+    counts = Counter()
+    for _, sentence in sentences:
+        for match in ENTITY_PATTERN.finditer(sentence):
+            words = match.group().split()
+            at_start = match.start() == 0
+            if words[0] in ENTITY_STOPWORDS:
+                words, at_start = words[1:], False
+            if not words or (len(words) == 1 and (at_start or words[0] in ENTITY_STOPWORDS)):
+                continue
+            counts[" ".join(words)] += 1
+    return [entity for entity, _ in counts.most_common(limit)]
+
+
+class DigestStore:
+    """SQLite-backed digests keyed by stored document ID."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._transaction() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS digests ("
+                "document_id TEXT PRIMARY KEY, session TEXT, digest TEXT NOT NULL, created_at TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS digests_session ON digests (session)")
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            with self._conn:  # commits on success, rolls back on error
+                yield self._conn
+
+    def put(self, document_id: str, session: str, digest: Dict[str, Any]) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO digests (document_id, session, digest, created_at) VALUES (?, ?, ?, ?)",
+                (document_id, session, json.dumps(digest), datetime.utcnow().isoformat())
+            )
+
+    def get_many(self, document_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not document_ids:
+            return {}
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(document_ids), 500):
+                chunk = document_ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT document_id, digest FROM digests WHERE document_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                found.update((document_id, json.loads(digest)) for document_id, digest in rows)
+        return found
+
+    def for_session(self, session: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT document_id, digest FROM digests WHERE session = ? ORDER BY document_id", (session,)
+            ).fetchall()
+        return {document_id: json.loads(digest) for document_id, digest in rows}
+
+    def delete(self, document_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM digests WHERE document_id = ?", (document_id,))
+
+    def delete_session(self, session: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM digests WHERE session = ?", (session,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            documents, sessions = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT session) FROM digests"
+            ).fetchone()
+        return {"documents": documents, "sessions": sessions}
+
+
+class DigestBuilder:
+    """Builds digests extractively, optionally with an LLM-written summary.
+
+    Key sentences are picked by maximal marginal relevance against the document's embedding
+    centroid, so they cover the document rather than repeat its most typical sentence. Each one
+    carries the page it starts on when the extractor recorded page offsets.
+    """
+
+    def __init__(self, store: DigestStore, embedder=embedding_service, llm=llm_router,
+                 key_sentences: int = 5, entities: int = 10, max_sentences: int = 300,
+                 summary_chars: int = 600, llm_summary: bool = False):
+        self.store = store
+        self.embedder = embedder
+        self.llm = llm
+        self.key_sentences = key_sentences
+        self.entities = entities
+        self.max_sentences = max_sentences
+        self.summary_chars = summary_chars
+        self.llm_summary = llm_summary
+
+    def extract(self, text: str, page_offsets: Optional[List[int]] = None, pages: int = 1) -> Dict[str, Any]:
+        """Extractive digest of one document; CPU-bound (runs the embedding model)."""
+        sentences = split_sentences(text)
+        candidates = [(offset, sentence) for offset, sentence in sentences
+                      if _MIN_SENTENCE_WORDS <= len(sentence.split()) <= _MAX_SENTENCE_WORDS]
+        if len(candidates) > self.max_sentences:
+            # Sample evenly so long documents are covered end to end at a fixed embedding cost
+            picks = np.linspace(0, len(candidates) - 1, self.max_sentences).astype(int)
+            candidates = [candidates[i] for i in picks]
+
+        selected = self._select(candidates) if candidates else []
+        if not page_offsets and pages == 1:
+            page_offsets = [0]
+        key_sentences = [
+            {"text": sentence, "page": bisect_right(page_offsets, offset) if page_offsets else None}
+            for offset, sentence in (candidates[i] for i in selected)
+        ]
+        # The summary reads the top sentences in document order
+        lead = sorted(selected[:3])
+        summary = " ".join(candidates[i][1] for i in lead) or text.strip()
+        return {
+            "summary": summary[:self.summary_chars],
+            "entities": extract_entities(sentences, self.entities),
+            "key_sentences": key_sentences,
+            "pages": pages,
+            "model": None,
+        }
+
+    def _select(self, candidates: List[Tuple[int, str]]) -> List[int]:
+        vectors = np.asarray(self.embedder.embed([sentence for _, sentence in candidates]), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        centroid = vectors.mean(axis=0)
+        centroid /= max(np.linalg.norm(centroid), 1e-12)
+        relevance = vectors @ centroid
+
+        selected: List[int] = []
+        redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+        for _ in range(min(self.key_sentences, len(candidates))):
+            scores = relevance - _MMR_DIVERSITY * np.maximum(redundancy, 0.0)
+            scores[selected] = -np.inf
+            best = int(np.argmax(scores))
+            selected.append(best)
+            redundancy = np.maximum(redundancy, vectors @ vectors[best])
+        return selected
+
+    async def _summarize(self, digest: Dict[str, Any]) -> None:
+        """Replace the extractive summary with an LLM one written from the digest, not the raw text."""
+        prompt = (
+            "Summarize the document described by these key sentences in at most three sentences.\n\n"
+            + "\n".join(f"- {sentence['text']}" for sentence in digest["key_sentences"])
+            + (f"\n\nKey entities: {', '.join(digest['entities'])}" if digest["entities"] else "")
+        )
+        summary, model = await self.llm.complete(DIGEST_SYSTEM_PROMPT, prompt, temperature=0.2, max_tokens=200,
+                                                 priority=BATCH)
+        digest["summary"] = summary[:self.summary_chars]
+        digest["model"] = model
+
+    async def build(self, timestamp: str, items: List[tuple]) -> int:
+        """Digest (doc_id, content) pairs from one upload; meant to run as a background task."""
+        built = 0
+        for doc_id, content in items:
+            document_id = f"{timestamp}_{doc_id}"
+            try:
+                digest = await run_in_threadpool(
+                    self.extract, content["text"], content.get("page_offsets"), content.get("pages", 1))
+                if self.llm_summary and digest["key_sentences"] and self.llm.providers:
+                    try:
+                        await self._summarize(digest)
+                    except Exception as e:
+                        logger.warning(f"LLM digest summary failed for {document_id}, keeping extractive: {str(e)}")
+                await run_in_threadpool(self.store.put, document_id, timestamp, digest)
+                DIGESTS_TOTAL.inc(outcome="built")
+                built += 1
+            except Exception as e:
+                DIGESTS_TOTAL.inc(outcome="error")
+                logger.error(f"Could not build a digest for {document_id}: {str(e)}")
+        logger.debug("Built %d digests for session %s", built, timestamp)
+        return built
+
+    async def build_session(self, collection, timestamp: str) -> int:
+        """(Re)build digests for every stored document of a session, e.g. after a snapshot import."""
+        with VECTOR_STORE_SECONDS.time(operation="get"):
+            stored = await run_in_threadpool(collection.get, where={"timestamp": timestamp},
+                                             include=["documents", "metadatas"])
+        items = [
+            (meta.get("doc_id") or key[len(timestamp) + 1:],
+             {"text": text, "pages": meta.get("pages", 1), "page_offsets": parse_page_offsets(meta.get("page_offsets"))})
+            for key, text, meta in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        ]
+        return await self.build(timestamp, items)
+
+
+def format_digest(digest: Dict[str, Any]) -> str:
+    """Compact prompt block for one document's digest."""
+    lines = [f"Summary: {digest['summary']}"]
+    if digest.get("entities"):
+        lines.append(f"Key entities: {', '.join(digest['entities'])}")
+    if digest.get("key_sentences"):
+        lines.append("Key sentences:")
+        for sentence in digest["key_sentences"]:
+            page = f"(page {sentence['page']}) " if sentence.get("page") else ""
+            lines.append(f"- {page}{sentence['text']}")
+    return "\n".join(lines)
+
+
+def _build_digests() -> Tuple[Optional[DigestStore], Optional[DigestBuilder]]:
+    if not settings.DIGEST_ENABLED:
+        return None, None
+    store = DigestStore(settings.DIGEST_PATH)
+    return store, DigestBuilder(
+        store,
+        key_sentences=settings.DIGEST_KEY_SENTENCES,
+        entities=settings.DIGEST_ENTITIES,
+        max_sentences=settings.DIGEST_MAX_SENTENCES,
+        summary_chars=settings.DIGEST_SUMMARY_CHARS,
+        llm_summary=settings.DIGEST_LLM_SUMMARY
+    )
+
+
+digest_store, digest_builder = _build_digests()
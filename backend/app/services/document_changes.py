@@ -0,0 +1,92 @@
+"""Shared log of document adds and deletes, so per-worker in-memory indexes stay in step.
+
+Every worker keeps its own keyword (BM25) and near-duplicate index. Writes go to the shared
+vector store, and each one is also appended here. Before using its indexes, a worker replays
+the entries other workers have written since it last looked, re-reading only those documents.
+"""
+from typing import List, Tuple, Optional
+from contextlib import contextmanager
+import os
+import sqlite3
+import threading
+import uuid
+
+from ..core.config import settings
+
+ADD = "add"
+DELETE = "delete"
+
+
+class DocumentChangeLog:
+    """Append-only SQLite log of (sequence, operation, document id, session, writer) rows.
+
+    `PRAGMA data_version` tells a worker cheaply whether anyone else has written since its last
+    check, so an idle log costs one pragma per search. The log keeps the last `retain` entries;
+    a worker that has fallen further behind rebuilds its indexes from the vector store.
+    """
+
+    def __init__(self, path: str, retain: int = 100000):
+        self.path = path
+        self.retain = retain
+        # Identifies this process's own entries, which its indexes already reflect
+        self.writer = uuid.uuid4().hex
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._transaction() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS changes ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, document_id TEXT NOT NULL, "
+                "session TEXT, writer TEXT NOT NULL)"
+            )
+        self._data_version = None
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            with self._conn:  # commits on success, rolls back on error
+                yield self._conn
+
+    def record(self, op: str, document_ids: List[str], session: Optional[str]) -> None:
+        if not document_ids:
+            return
+        with self._transaction() as conn:
+            cursor = conn.executemany(
+                "INSERT INTO changes (op, document_id, session, writer) VALUES (?, ?, ?, ?)",
+                [(op, document_id, session, self.writer) for document_id in document_ids]
+            )
+            latest = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0]
+            if latest % 1000 < cursor.rowcount:
+                # Crossed a multiple of 1000: trim the log to its retained tail
+                conn.execute("DELETE FROM changes WHERE seq <= ?", (latest - self.retain,))
+
+    def latest(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def changed(self) -> bool:
+        """Whether another connection has written the log since the last call."""
+        with self._lock:
+            # data_version only moves for commits made through other connections
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            changed, self._data_version = version != self._data_version, version
+            return changed
+
+    def since(self, seq: int) -> Tuple[Optional[List[Tuple[int, str, str, Optional[str]]]], int]:
+        """Other writers' (seq, op, document id, session) entries after `seq`, and the new position.
+
+        Entries are None when some of them have already been trimmed from the log.
+        """
+        with self._lock:
+            oldest = self._conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT seq, op, document_id, session, writer FROM changes WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+        position = rows[-1][0] if rows else seq
+        if oldest is not None and oldest > seq + 1:
+            return None, position
+        return [(row[0], row[1], row[2], row[3]) for row in rows if row[4] != self.writer], position
+
+
+document_changes = DocumentChangeLog(settings.DOCUMENT_CHANGES_PATH)
@@ -1,14 +1,24 @@
 import pytesseract
-from pdf2image import convert_from_path
 from PIL import Image
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from paddleocr import PaddleOCR
-import tempfile
 
 from paddleocr import PaddleOCR
 import numpy as np
+import logging
+import threading
+
+from ..core.config import settings
+from ..core.profiling import span
+from ..core.metrics import OCR_PAGE_SECONDS, EXTRACTION_TOTAL, VECTOR_STORE_SECONDS, DUPLICATES_TOTAL
+from .search_index import BM25Index
+from .dedup import NearDuplicateIndex
+from .embeddings import embedding_service
+from .semantic_cache import semantic_cache
+from .ingest_budget import IngestBudget
+from .document_changes import document_changes, ADD, DELETE
 
 
 # Initialize once (consider placing this outside class)
@@ -76,26 +86,59 @@ import numpy as np
 
 ocr_model = PaddleOCR(use_angle_cls=True, lang='en')
 
+logger = logging.getLogger(__name__)
+
+SEARCH_MODES = ("keyword", "vector", "hybrid")
+
 class DocumentProcessor:
 
-    def __init__(self, collection):
+    def __init__(self, collection, embedder=embedding_service, query_cache=semantic_cache, changes=document_changes):
         self.collection = collection
+        self.embedder = embedder
+        self.query_cache = query_cache
+        self.changes = changes
+        self._changes_seen = 0
+        self._reset_indexes()
+        self._indexes_loaded = False
+        self._indexes_lock = threading.Lock()
 
     def process_document(self, file_path: str) -> Dict[str, Any]:
         file_ext = os.path.splitext(file_path)[1].lower()
+        budget = IngestBudget.from_settings()
 
         if file_ext in ['.jpg', '.jpeg', '.png', '.bmp']:
-            return self._process_image(file_path)
+            result = self._process_image(file_path, budget)
         elif file_ext == '.pdf':
-            return self._process_pdf(file_path)
+            result = self._process_pdf(file_path, budget)
         else:
             raise ValueError(f"Unsupported file type: {file_ext}")
 
-    def _process_image(self, image_path: str) -> Dict[str, Any]:
-        result = ocr_model.ocr(image_path, cls=True)
+        report = result["ingestion"]
+        if report["degraded"]:
+            logger.warning(
+                f"Extraction of {file_path} degraded ({', '.join(report['degraded'])}): "
+                f"{report['pages_extracted']} of {result['pages']} pages, dpi {report['dpi']}, "
+                f"peak {(report['peak_memory_bytes'] or 0) / 2 ** 20:.0f} MiB"
+            )
+        return result
+
+    def _process_image(self, image_path: str, budget: IngestBudget) -> Dict[str, Any]:
+        EXTRACTION_TOTAL.inc(method="ocr_image")
+        source = image_path
+        # Only the header is read here; oversized scans are downscaled before OCR sees them
+        with Image.open(image_path) as image:
+            scale = budget.fit_pixels(*image.size)
+            if scale < 1.0:
+                size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+                image.draft("RGB", size)  # JPEGs decode straight at a reduced scale
+                source = np.array(image.convert("RGB").resize(size))
+        with OCR_PAGE_SECONDS.time(source="image"):
+            result = ocr_model.ocr(source, cls=True)
+        del source
 
         if not result or not result[0]:
-            return {"text": "", "pages": 1, "confidence": 0.0, "word_count": 0}
+            return {"text": "", "pages": 1, "confidence": 0.0, "word_count": 0, "truncated": False,
+                    "ingestion": budget.report(1, 1, False)}
 
         text_lines, confidences = [], []
         for line in result[0]:
@@ -110,93 +153,350 @@ class DocumentProcessor:
             "text": combined_text,
             "pages": 1,
             "confidence": avg_conf,
-            "word_count": len(combined_text.split())
+            "word_count": len(combined_text.split()),
+            "truncated": False,
+            "ingestion": budget.report(1, 1, False)
         }
         
-    def _process_pdf(self, pdf_path: str) -> dict:
+    def _process_pdf(self, pdf_path: str, budget: IngestBudget) -> dict:
         """Try direct text extraction first; fallback to OCR on images if text too short."""
         import fitz  # PyMuPDF
         
-        doc = fitz.open(pdf_path)
-        full_text = ""
-        for page in doc:
-            full_text += page.get_text()
-
-        if len(full_text.strip()) >= 20:
-            # Return text-based PDF data
-            word_count = len(full_text.split())
+        with fitz.open(pdf_path) as doc:
             pages = len(doc)
-            confidence = 1.0  # Assume confidence is high for direct text extraction
+            limit = min(pages, budget.max_pages)
+            with budget.text_buffer() as buffer:
+                page_offsets, word_count, visible = [], 0, 0
+                for number in range(limit):
+                    page_offsets.append(buffer.length)
+                    text = buffer.write(doc[number].get_text())
+                    word_count += len(text.split())
+                    visible += len(text.strip())
+                    budget.sample()
+                    if buffer.truncated:
+                        break
+
+                if visible >= 20:
+                    # Return text-based PDF data
+                    EXTRACTION_TOTAL.inc(method="pdf_text")
+                    report = budget.report(pages, len(page_offsets), buffer.truncated)
+                    return {
+                        "text": buffer.getvalue(),
+                        "pages": pages,
+                        "confidence": 1.0,  # Assume confidence is high for direct text extraction
+                        "word_count": word_count,
+                        "page_offsets": page_offsets,
+                        "truncated": buffer.truncated or report["pages_skipped"] > 0,
+                        "ingestion": report
+                    }
+
+            # Fallback to OCR on the pages of the already open document
+            return self._process_pdf_as_images(doc, pdf_path, pages, limit, budget)
+
+
+    def _process_pdf_as_images(self, doc, pdf_path: str, pages: int, limit: int,
+                               budget: IngestBudget) -> Dict[str, Any]:
+        """OCR scanned pages one at a time, each rendered at the highest resolution the budget allows."""
+        EXTRACTION_TOTAL.inc(method="pdf_ocr")
+        conf_total, conf_count, word_count, extracted = 0.0, 0, 0, 0
+        page_offsets = []
+
+        with budget.text_buffer() as buffer:
+            for number in range(limit):
+                page = doc[number]
+                # Lines are joined with single spaces, so a page starts one past the previous text
+                page_offsets.append(buffer.length + 1 if buffer.length else 0)
+                dpi = budget.render_dpi(page.rect.width, page.rect.height)
+                if dpi is None:
+                    logger.warning(f"Skipping page {number + 1} of {pdf_path}: it does not fit the ingestion memory budget")
+                    continue
+
+                # Rendered in-process from the open document, straight into an RGB array
+                pixmap = page.get_pixmap(dpi=dpi, alpha=False)
+                image = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width, pixmap.n)
+                del pixmap
+                with OCR_PAGE_SECONDS.time(source="pdf"):
+                    result = ocr_model.ocr(image, cls=True)
+                del image
+                extracted += 1
+
+                for line in (result[0] or []) if result else []:
+                    text, conf = line[1][0], line[1][1]
+                    if buffer.length:
+                        buffer.write(" ")
+                    text = buffer.write(text)
+                    word_count += len(text.split())
+                    conf_total += conf
+                    conf_count += 1
+                    if buffer.truncated:
+                        break
+                budget.sample()
+                if buffer.truncated:
+                    break
+
+            report = budget.report(pages, extracted, buffer.truncated)
             return {
-                "text": full_text,
+                "text": buffer.getvalue(),
                 "pages": pages,
-                "confidence": confidence,
-                "word_count": word_count
+                "confidence": conf_total / conf_count if conf_count else 0.0,
+                "word_count": word_count,
+                "page_offsets": page_offsets,
+                "truncated": buffer.truncated or report["pages_skipped"] > 0,
+                "ingestion": report
             }
-        else:
-            # Fallback to OCR on PDF pages
-            return self._process_pdf_as_images(pdf_path)
 
 
-    def _process_pdf_as_images(self, pdf_path: str) -> Dict[str, Any]:
-        pages = convert_from_path(pdf_path)
-        all_text, all_conf = [], []
-
-        for page in pages:
-            
-            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
-                tmp_path = tmp.name
-                page.save(tmp_path, "JPEG")
-
-            # Reopen image to ensure it's fully closed from temp creation
-            image = Image.open(tmp_path)
-            result = ocr_model.ocr(np.array(image), cls=True)
-            image.close()  # <-- Important to release handle
-
-            # Now it's safe to delete
-            os.unlink(tmp_path)
-
-            if result and result[0]:
-                for line in result[0]:
-                    text, conf = line[1][0], line[1][1]
-                    all_text.append(text)
-                    all_conf.append(conf)
-
-        combined_text = " ".join(all_text)
-        avg_conf = sum(all_conf) / len(all_conf)
+    def store_document(self, doc_id: str, content: dict, timestamp: str) -> Optional[Dict[str, Any]]:
+        """Store document in vector database with timestamp metadata and namespacing."""
+        return self.store_documents([(doc_id, content)], timestamp).get(doc_id)
 
-        return {
-            "text": combined_text,
-            "pages": len(pages),
-            "confidence": avg_conf,
-            "word_count": len(combined_text.split())
-        }
+    def store_documents(self, items: List[tuple], timestamp: str) -> Dict[str, Dict[str, Any]]:
+        """Embed and store a batch of (doc_id, content) pairs from one session in a single write.
 
+        Returns the near-duplicates found, as doc_id -> {"duplicate_of", "similarity"}.
+        """
+        if not items:
+            return {}
 
-    def store_document(self, doc_id: str, content: dict, timestamp: str) -> None:
-        """Store document in vector database with timestamp metadata and namespacing."""
-    
         # Prefix doc ID to ensure uniqueness per session
+        full_doc_ids = [f"{timestamp}_{doc_id}" for doc_id, _ in items]
+        texts = [content["text"] for _, content in items]
+
+        metadatas = [{
+            "pages": content["pages"],
+            "confidence": content["confidence"],
+            "word_count": content["word_count"],
+            "timestamp": timestamp,
+            "doc_id": doc_id,  # Optional: store original short ID too
+            # Where each page starts in the text, for page references in digests
+            "page_offsets": ",".join(str(offset) for offset in content.get("page_offsets", [])),
+            # Extraction stopped at the page, text or memory budget
+            "truncated": content.get("truncated", False)
+        } for doc_id, content in items]
+        duplicates = self._flag_duplicates(items, full_doc_ids, texts, metadatas, timestamp)
+
+        try:
+            with span("embedding", texts=len(texts)):
+                embeddings = self.embedder.embed(texts)
+            self._add_to_store(full_doc_ids, texts, embeddings, metadatas, timestamp)
+        except Exception:
+            if self.duplicate_index is not None:
+                for full_doc_id in full_doc_ids:
+                    self.duplicate_index.remove(full_doc_id)
+            raise
+        logger.debug("Stored %d documents for session %s", len(items), timestamp)
+        return duplicates
+
+    def add_stored_documents(self, full_doc_ids: List[str], texts: List[str], embeddings: List[List[float]],
+                             metadatas: List[Dict[str, Any]], timestamp: str) -> None:
+        """Bulk-load already extracted and embedded documents (e.g. from a snapshot) into one session."""
+        self._add_to_store(full_doc_ids, texts, embeddings, metadatas, timestamp)
+        if self.duplicate_index is not None and self._indexes_loaded:
+            for full_doc_id, text, meta in zip(full_doc_ids, texts, metadatas):
+                self.duplicate_index.load(full_doc_id, text, meta.get("duplicate_of"))
+
+    def _add_to_store(self, full_doc_ids: List[str], texts: List[str], embeddings: List[List[float]],
+                      metadatas: List[Dict[str, Any]], timestamp: str) -> None:
+        with VECTOR_STORE_SECONDS.time(operation="add"), span("storage.add"):
+            self.collection.add(
+                documents=texts,
+                embeddings=embeddings,
+                metadatas=metadatas,
+                ids=full_doc_ids
+            )
+        # Keep the keyword index in step with the vector store, here and (via the change log) in other workers
+        for full_doc_id, text in zip(full_doc_ids, texts):
+            self.keyword_index.add(full_doc_id, text, session=timestamp)
+        if self.changes is not None:
+            self.changes.record(ADD, full_doc_ids, timestamp)
+        # Cached answers for this session no longer cover all of its documents
+        if self.query_cache is not None:
+            self.query_cache.invalidate(timestamp)
+
+    def _flag_duplicates(self, items: List[tuple], full_doc_ids: List[str], texts: List[str],
+                         metadatas: List[Dict[str, Any]], timestamp: str) -> Dict[str, Dict[str, Any]]:
+        """Match each new document against everything indexed so far, including earlier ones in the batch."""
+        if self.duplicate_index is None:
+            return {}
+        self._ensure_indexes()
+        duplicates = {}
+        with span("dedup", texts=len(texts)):
+            for (doc_id, _), full_doc_id, text, meta in zip(items, full_doc_ids, texts, metadatas):
+                match = self.duplicate_index.add(full_doc_id, text)
+                if match is None:
+                    continue
+                representative, similarity = match
+                meta["duplicate_of"] = representative
+                meta["duplicate_similarity"] = round(similarity, 3)
+                duplicates[doc_id] = {"duplicate_of": representative, "similarity": round(similarity, 3)}
+                scope = "same_session" if representative.startswith(f"{timestamp}_") else "cross_session"
+                DUPLICATES_TOTAL.inc(scope=scope)
+        if duplicates:
+            logger.info(f"Session {timestamp}: {len(duplicates)} of {len(items)} documents are near-duplicates")
+        return duplicates
+
+    def delete_document(self, doc_id: str, timestamp: str) -> None:
+        """Remove a document from the vector database and the keyword index."""
         full_doc_id = f"{timestamp}_{doc_id}"
-        
-        self.collection.add(
-            documents=[content["text"]],
-            metadatas=[{
-                "pages": content["pages"],
-                "confidence": content["confidence"],
-                "word_count": content["word_count"],
+        with VECTOR_STORE_SECONDS.time(operation="delete"), span("storage.delete"):
+            self.collection.delete(ids=[full_doc_id])
+        self.keyword_index.remove(full_doc_id)
+        if self.duplicate_index is not None:
+            self.duplicate_index.remove(full_doc_id)
+        if self.changes is not None:
+            self.changes.record(DELETE, [full_doc_id], timestamp)
+        if self.query_cache is not None:
+            self.query_cache.invalidate(timestamp)
+
+    def delete_session(self, timestamp: str) -> int:
+        """Remove every document of a session; returns how many were removed."""
+        with VECTOR_STORE_SECONDS.time(operation="get"), span("storage.get"):
+            full_doc_ids = self.collection.get(where={"timestamp": timestamp}, include=[])["ids"]
+        if not full_doc_ids:
+            return 0
+        with VECTOR_STORE_SECONDS.time(operation="delete"), span("storage.delete"):
+            self.collection.delete(ids=full_doc_ids)
+        for full_doc_id in full_doc_ids:
+            self.keyword_index.remove(full_doc_id)
+            if self.duplicate_index is not None:
+                self.duplicate_index.remove(full_doc_id)
+        if self.changes is not None:
+            self.changes.record(DELETE, full_doc_ids, timestamp)
+        if self.query_cache is not None:
+            self.query_cache.invalidate(timestamp)
+        return len(full_doc_ids)
+
+    def _ensure_indexes(self) -> None:
+        """Build the keyword and duplicate indexes from the vector store on first use, and from then
+        on replay the adds and deletes other workers have made since the last call."""
+        if self._indexes_loaded:
+            self._sync_indexes()
+            return
+        with self._indexes_lock:
+            if self._indexes_loaded:
+                return
+            # Take the log position first; changes made during the load are replayed (idempotently) later
+            self._changes_seen = self.changes.latest() if self.changes is not None else 0
+            self._load_indexes()
+            self._indexes_loaded = True
+
+    def _reset_indexes(self) -> None:
+        self.keyword_index = BM25Index(k1=settings.BM25_K1, b=settings.BM25_B)
+        self.duplicate_index = NearDuplicateIndex(
+            num_perm=settings.DEDUP_NUM_PERM,
+            bands=settings.DEDUP_BANDS,
+            threshold=settings.DEDUP_THRESHOLD,
+            shingle_size=settings.DEDUP_SHINGLE_SIZE
+        ) if settings.DEDUP_ENABLED else None
+
+    def _load_indexes(self) -> None:
+        with VECTOR_STORE_SECONDS.time(operation="get"), span("storage.get"):
+            stored = self.collection.get(include=["documents", "metadatas"])
+        for full_doc_id, text, meta in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+            meta = meta or {}
+            if full_doc_id not in self.keyword_index:
+                self.keyword_index.add(full_doc_id, text or "", session=meta.get("timestamp"))
+            if self.duplicate_index is not None and full_doc_id not in self.duplicate_index:
+                self.duplicate_index.load(full_doc_id, text or "", meta.get("duplicate_of"))
+
+    def _sync_indexes(self) -> None:
+        # One pragma when nobody else has written since the last check
+        if self.changes is None or not self.changes.changed():
+            return
+        with self._indexes_lock:
+            entries, position = self.changes.since(self._changes_seen)
+            if entries is None:
+                logger.info("Document change log was trimmed past this worker's position; reloading indexes")
+                self._reset_indexes()
+                self._load_indexes()
+            elif entries:
+                self._apply_changes(entries)
+            self._changes_seen = position
+
+    def _apply_changes(self, entries: List[tuple]) -> None:
+        """Bring the indexes up to date with other workers' (seq, op, document id, session) log entries."""
+        latest: Dict[str, str] = {}
+        for _, op, full_doc_id, _ in entries:
+            latest[full_doc_id] = op  # the last operation on a document wins
+        added = [full_doc_id for full_doc_id, op in latest.items() if op == ADD]
+        for full_doc_id, op in latest.items():
+            if op == DELETE:
+                self.keyword_index.remove(full_doc_id)
+                if self.duplicate_index is not None:
+                    # Also stops a deleted document from representing its cluster here
+                    self.duplicate_index.remove(full_doc_id)
+        # Re-read only the added documents; any deleted since are simply not returned
+        for start in range(0, len(added), 500):
+            with VECTOR_STORE_SECONDS.time(operation="get"), span("storage.get"):
+                stored = self.collection.get(ids=added[start:start + 500], include=["documents", "metadatas"])
+            for full_doc_id, text, meta in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+                meta = meta or {}
+                self.keyword_index.add(full_doc_id, text or "", session=meta.get("timestamp"))
+                if self.duplicate_index is not None:
+                    # Matched on the worker that stored it; keep its recorded representative
+                    self.duplicate_index.load(full_doc_id, text or "", meta.get("duplicate_of"))
+        logger.debug("Applied %d document changes from other workers", len(latest))
+
+    def search_documents(self, query: str, n_results: int = 5, mode: str = "hybrid",
+                         timestamps: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Search documents by keyword (BM25), vector similarity, or both fused with reciprocal rank fusion.
+
+        Keyword search is served from the in-memory index and never touches the embedding model.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unsupported search mode: {mode}")
+
+        # Fetch a deeper candidate list for fusion so either ranker can promote a document
+        depth = n_results if mode != "hybrid" else max(n_results * 4, 20)
+        keyword_hits, vector_hits = [], []
+
+        if mode in ("keyword", "hybrid"):
+            self._ensure_indexes()
+            with span("search.keyword"):
+                keyword_hits = self.keyword_index.search(query, depth, sessions=timestamps)
+        if mode in ("vector", "hybrid"):
+            vector_hits = self._vector_search(query, depth, timestamps)
+
+        if mode == "keyword":
+            ranked = [(hit["id"], hit["score"]) for hit in keyword_hits]
+        elif mode == "vector":
+            ranked = [(hit["id"], hit["score"]) for hit in vector_hits]
+        else:
+            fused: Dict[str, float] = {}
+            for hits in (keyword_hits, vector_hits):
+                for rank, hit in enumerate(hits, 1):
+                    fused[hit["id"]] = fused.get(hit["id"], 0.0) + 1.0 / (settings.SEARCH_RRF_K + rank)
+            ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:n_results]
+
+        sessions = {hit["id"]: hit.get("timestamp") for hit in vector_hits}
+        results = []
+        for full_doc_id, score in ranked:
+            timestamp = sessions.get(full_doc_id) or self.keyword_index.session_of(full_doc_id)
+            doc_id = full_doc_id[len(timestamp) + 1:] if timestamp else full_doc_id
+            results.append({
+                "id": full_doc_id,
+                "doc_id": doc_id,
                 "timestamp": timestamp,
-                "doc_id": doc_id  # Optional: store original short ID too
-            }],
-                ids=[full_doc_id]
+                "score": score
+            })
+        return results
+
+    def _vector_search(self, query: str, n_results: int, timestamps: Optional[List[str]]) -> List[Dict[str, Any]]:
+        where = None
+        if timestamps:
+            where = {"timestamp": timestamps[0]} if len(timestamps) == 1 else {"timestamp": {"$in": list(timestamps)}}
+
+        with span("embedding", texts=1):
+            query_embedding = self.embedder.embed_query(query)
+        with VECTOR_STORE_SECONDS.time(operation="query"), span("storage.query"):
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where,
+                include=["metadatas", "distances"]
             )
-        print('ChromaDB: ',self.collection.get(ids=[full_doc_id]))
-        return
-
-    def search_documents(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]:
-        """Search for relevant documents using vector similarity."""
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results
-        )
-        return results
\ No newline at end of file
+        return [
+            # Convert distance into a similarity-like score so higher is better in every mode
+            {"id": full_doc_id, "score": 1.0 / (1.0 + distance), "timestamp": (meta or {}).get("timestamp")}
+            for full_doc_id, meta, distance in zip(results["ids"][0], results["metadatas"][0], results["distances"][0])
+        ]
@@ -0,0 +1,219 @@
+from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from ..core.config import settings
+from ..core.metrics import EMBEDDING_BATCH_SECONDS, EMBEDDING_TEXTS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("onnx", "sentence-transformers")
+ONNX_MODEL = "all-MiniLM-L6-v2"  # the only model the onnx backend ships with
+
+
+def text_hash(text: str, namespace: str = "") -> str:
+    """Cache key for `text`; `namespace` keeps vectors from different models apart."""
+    return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-level embedding cache: a bounded in-memory LRU backed by an optional SQLite file.
+
+    Keys are content hashes scoped to the embedding backend and model, so identical text is
+    embedded once no matter how often it is uploaded or queried, and a persistent cache never
+    returns vectors from a model the server no longer uses.
+    """
+
+    def __init__(self, max_items: int = 10000, path: Optional[str] = None):
+        self.max_items = max_items
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            self._db.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                else:
+                    missing.append(key)
+
+            if self._db is not None and missing:
+                placeholders = ",".join("?" * len(missing))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", missing
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vector
+                    self._remember(key, vector)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            if self._db is not None and items:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+
+class EmbeddingService:
+    """Explicit, batched embedding stage in front of the vector store.
+
+    Backends:
+    - "onnx": Chroma's bundled all-MiniLM-L6-v2 ONNX model on the CPU execution provider
+      (the same model Chroma uses by default, so existing collections stay compatible).
+    - "sentence-transformers": any sentence-transformers model on CPU, optionally with
+      dynamic int8 quantization of its linear layers.
+    """
+
+    def __init__(self, backend: str = "onnx", model_name: str = "all-MiniLM-L6-v2", batch_size: int = 32,
+                 quantize: bool = False, cache: Optional[EmbeddingCache] = None):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unsupported embedding backend: {backend}")
+        if backend == "onnx" and model_name.split("/")[-1] != ONNX_MODEL:
+            raise ValueError(f"The onnx embedding backend only provides {ONNX_MODEL}, not {model_name}; "
+                             f"use the sentence-transformers backend for other models")
+        if backend == "onnx" and quantize:
+            logger.warning("EMBEDDING_QUANTIZE only applies to the sentence-transformers backend; ignoring it")
+        self.backend = backend
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.quantize = quantize and backend == "sentence-transformers"
+        self.cache_namespace = f"{backend}/{model_name}/{'int8' if self.quantize else 'fp32'}"
+        self.cache = cache or EmbeddingCache()
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # batch size -> {"batches", "texts", "seconds"}
+        self._batch_stats: Dict[int, Dict[str, float]] = {}
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+    def _load_model(self):
+        if self._model is not None:
+            return self._model
+        with self._model_lock:
+            if self._model is not None:
+                return self._model
+            if self.backend == "onnx":
+                from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+                self._model = ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+            else:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(self.model_name, device="cpu")
+                if self.quantize:
+                    import torch
+                    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                self._model = model
+            logger.info(f"Loaded {self.backend} embedding model {self.model_name}")
+        return self._model
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        model = self._load_model()
+        start = time.perf_counter()
+        if self.backend == "onnx":
+            vectors = np.asarray(model(texts), dtype=np.float32)
+        else:
+            vectors = model.encode(texts, batch_size=len(texts), convert_to_numpy=True,
+                                   normalize_embeddings=True).astype(np.float32)
+        elapsed = time.perf_counter() - start
+        EMBEDDING_BATCH_SECONDS.observe(elapsed, backend=self.backend)
+
+        with self._stats_lock:
+            stats = self._batch_stats.setdefault(len(texts), {"batches": 0, "texts": 0, "seconds": 0.0})
+            stats["batches"] += 1
+            stats["texts"] += len(texts)
+            stats["seconds"] += elapsed
+        logger.debug("Embedded batch of %d in %.3fs", len(texts), elapsed)
+        return vectors
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in batches, reusing cached vectors for any text seen before."""
+        if not texts:
+            return []
+        keys = [text_hash(text, self.cache_namespace) for text in texts]
+        cached = self.cache.get_many(list(set(keys)))
+
+        # Embed each distinct uncached text once, even if it repeats within the call
+        pending: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in pending:
+                pending[key] = text
+
+        with self._stats_lock:
+            self._cache_hits += len(texts) - len(pending)
+            self._cache_misses += len(pending)
+        EMBEDDING_TEXTS_TOTAL.inc(len(texts) - len(pending), result="cache_hit")
+        EMBEDDING_TEXTS_TOTAL.inc(len(pending), result="embedded")
+
+        if pending:
+            pending_keys = list(pending)
+            computed = {}
+            for i in range(0, len(pending_keys), self.batch_size):
+                batch_keys = pending_keys[i:i + self.batch_size]
+                vectors = self._embed_batch([pending[key] for key in batch_keys])
+                computed.update(zip(batch_keys, vectors))
+            self.cache.put_many(computed)
+            cached.update(computed)
+
+        return [cached[key].tolist() for key in keys]
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.embed([query])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache hit rate and measured throughput (texts/sec) per batch size."""
+        with self._stats_lock:
+            lookups = self._cache_hits + self._cache_misses
+            return {
+                "backend": self.backend,
+                "model": self.model_name,
+                "quantized": self.quantize,
+                "cache_hits": self._cache_hits,
+                "cache_misses": self._cache_misses,
+                "cache_hit_rate": self._cache_hits / lookups if lookups else 0.0,
+                "throughput": {
+                    str(size): {
+                        "batches": int(stats["batches"]),
+                        "texts": int(stats["texts"]),
+                        "texts_per_second": stats["texts"] / stats["seconds"] if stats["seconds"] else 0.0
+                    }
+                    for size, stats in sorted(self._batch_stats.items())
+                }
+            }
+
+
+embedding_service = EmbeddingService(
+    backend=settings.EMBEDDING_BACKEND,
+    model_name=settings.EMBEDDING_MODEL,
+    batch_size=settings.EMBEDDING_BATCH_SIZE,
+    quantize=settings.EMBEDDING_QUANTIZE,
+    cache=EmbeddingCache(max_items=settings.EMBEDDING_CACHE_SIZE, path=settings.EMBEDDING_CACHE_PATH)
+)
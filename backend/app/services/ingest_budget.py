@@ -0,0 +1,173 @@
+"""Memory and page budgets for document extraction jobs.
+
+A job measures the worker's resident memory against the level it started at, picks the OCR
+rendering resolution so that one page fits in what is left, and accumulates extracted text in
+a buffer that spills to a temporary file. Documents that do not fit are cut short and flagged
+instead of growing the worker until it is OOM-killed along with every other request it serves.
+
+The upload endpoints run extraction off the event loop but hold `extraction_slot` (in
+`app.api.documents`) while they do, so each worker extracts one document at a time and the growth
+measured over a job is that job's own; anything else the worker does meanwhile (background
+digests, queries) is counted against it.
+"""
+from typing import Dict, Any, Optional
+import math
+import os
+import tempfile
+
+from ..core.config import settings
+from ..core.metrics import INGESTION_PEAK_MEMORY_BYTES, INGESTION_DEGRADED_TOTAL
+
+POINTS_PER_INCH = 72.0
+# A rendered page is held as a pixmap and a numpy copy while the OCR model builds its own
+# resized and normalized tensors from it; together roughly this many times the raw RGB size
+_RENDER_WORKING_SET = 4
+_BYTES_PER_PIXEL = 3
+# Measured growth past this share of the budget lowers the resolution of the remaining pages
+_DPI_BACKOFF_THRESHOLD = 0.8
+_DPI_BACKOFF = 0.75
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident memory of this process, or None where it cannot be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class TextBuffer:
+    """Append-only text accumulator holding at most `memory_bytes` in memory.
+
+    Replaces repeated string concatenation, which copies everything extracted so far on every
+    page. Past `memory_bytes` the text moves to a temporary file; past `max_chars` further
+    writes are cut and `truncated` is set.
+    """
+
+    def __init__(self, memory_bytes: int, max_chars: int):
+        # newline="" keeps "\r\n" intact so recorded page offsets stay valid on read-back
+        self._file = tempfile.SpooledTemporaryFile(max_size=memory_bytes, mode="w+", encoding="utf-8", newline="")
+        self.max_chars = max_chars
+        self.length = 0
+        self.truncated = False
+
+    def write(self, text: str) -> str:
+        """Append `text`; returns the part that was kept."""
+        room = self.max_chars - self.length
+        if len(text) > room:
+            text = text[:max(room, 0)]
+            self.truncated = True
+        if text:
+            self._file.write(text)
+            self.length += len(text)
+        return text
+
+    def getvalue(self) -> str:
+        self._file.seek(0)
+        return self._file.read()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "TextBuffer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class IngestBudget:
+    """Budget for one extraction job: memory growth, pages and text.
+
+    `render_dpi` sizes each scanned page from its dimensions and the memory left: the preferred
+    `dpi` when it fits, less down to `min_dpi` when it does not, and None (skip the page) below
+    that. When measured growth nears the budget anyway, the remaining pages are rendered at a
+    lower resolution.
+    """
+
+    def __init__(self, memory_bytes: int, max_pages: int, max_chars: int, text_memory_bytes: int,
+                 dpi: int = 200, min_dpi: int = 100):
+        self.memory_bytes = memory_bytes
+        self.max_pages = max_pages
+        self.max_chars = max_chars
+        self.text_memory_bytes = text_memory_bytes
+        self.dpi = dpi
+        self.min_dpi = min_dpi
+        self._scale = 1.0
+        self._baseline = current_rss_bytes()
+        self.peak_bytes = 0
+        self.dpi_used: Optional[int] = None
+        self.degraded = set()
+
+    @classmethod
+    def from_settings(cls) -> "IngestBudget":
+        return cls(
+            memory_bytes=settings.INGEST_MEMORY_BUDGET_MB * 1024 * 1024,
+            max_pages=settings.INGEST_MAX_PAGES,
+            max_chars=settings.INGEST_MAX_TEXT_CHARS,
+            text_memory_bytes=settings.INGEST_TEXT_MEMORY_MB * 1024 * 1024,
+            dpi=settings.OCR_DPI,
+            min_dpi=settings.OCR_MIN_DPI
+        )
+
+    def text_buffer(self) -> TextBuffer:
+        return TextBuffer(self.text_memory_bytes, self.max_chars)
+
+    def sample(self) -> int:
+        """Bytes the worker has grown by since the job started; also tracks the peak."""
+        if self._baseline is None:
+            return 0
+        used = max(0, (current_rss_bytes() or self._baseline) - self._baseline)
+        self.peak_bytes = max(self.peak_bytes, used)
+        return used
+
+    def render_dpi(self, width_points: float, height_points: float) -> Optional[int]:
+        """Resolution to render a page of the given size (in PDF points) at, or None to skip it."""
+        used = self.sample()
+        if used > self.memory_bytes * _DPI_BACKOFF_THRESHOLD:
+            self._scale *= _DPI_BACKOFF
+            self.degraded.add("memory")
+        headroom = self.memory_bytes - used
+        area = max(width_points * height_points, 1.0) / (POINTS_PER_INCH * POINTS_PER_INCH)
+        fitting = math.sqrt(max(headroom, 0) / (_RENDER_WORKING_SET * _BYTES_PER_PIXEL * area))
+        dpi = int(min(self.dpi * self._scale, fitting))
+        if dpi < self.min_dpi:
+            self.degraded.add("memory")
+            return None
+        if dpi < self.dpi:
+            self.degraded.add("dpi")
+        self.dpi_used = dpi if self.dpi_used is None else min(self.dpi_used, dpi)
+        return dpi
+
+    def fit_pixels(self, width: int, height: int) -> float:
+        """Downscale factor (at most 1) that fits an image of the given pixel size in the budget."""
+        headroom = self.memory_bytes - self.sample()
+        scale = math.sqrt(max(headroom, 0) / (_RENDER_WORKING_SET * _BYTES_PER_PIXEL * max(width * height, 1)))
+        if scale < 1.0:
+            self.degraded.add("dpi")
+        return min(scale, 1.0)
+
+    def report(self, pages: int, pages_extracted: int, text_truncated: bool) -> Dict[str, Any]:
+        """Per-job summary returned with the extraction result; also records metrics."""
+        self.sample()
+        if pages > self.max_pages:
+            self.degraded.add("pages")
+        if text_truncated:
+            self.degraded.add("text")
+        INGESTION_PEAK_MEMORY_BYTES.observe(self.peak_bytes)
+        for reason in self.degraded:
+            INGESTION_DEGRADED_TOTAL.inc(reason=reason)
+        return {
+            "peak_memory_bytes": self.peak_bytes if self._baseline is not None else None,
+            "memory_budget_bytes": self.memory_bytes,
+            "pages_extracted": pages_extracted,
+            "pages_skipped": pages - pages_extracted,
+            "dpi": self.dpi_used,
+            "degraded": sorted(self.degraded),
+        }
@@ -0,0 +1,351 @@
+from typing import List, Dict, Any, Optional, Tuple
+from collections import deque
+from types import SimpleNamespace
+import asyncio
+import logging
+import time
+
+from ..core.config import settings
+from ..core.profiling import span
+from ..core.metrics import LLM_REQUEST_SECONDS, LLM_TOKENS_TOTAL, LLM_IN_FLIGHT
+from .llm_scheduler import (
+    LLMScheduler, RateLimitState, INTERACTIVE, parse_rate_limits, estimate_tokens, retry_after_seconds
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LLMProvider:
+    """A chat-completion backend. Subclasses implement `complete`."""
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    async def complete(self, system: str, prompt: str, temperature: float, max_tokens: Optional[int]) -> str:
+        raise NotImplementedError
+
+    def _record_usage(self, usage, system: str, prompt: str, text: str) -> None:
+        """Count tokens from the provider's usage block, estimating at ~4 chars/token when absent."""
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or (len(system) + len(prompt)) // 4
+        completion_tokens = getattr(usage, "completion_tokens", None) or len(text) // 4
+        LLM_TOKENS_TOTAL.inc(prompt_tokens, provider=self.name, direction="prompt")
+        LLM_TOKENS_TOTAL.inc(completion_tokens, provider=self.name, direction="completion")
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str, base_url: Optional[str] = None):
+        super().__init__(model)
+        from openai import AsyncOpenAI
+        # Rate limits are retried by the router once the scheduler has waited out Retry-After
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+    async def complete(self, system: str, prompt: str, temperature: float, max_tokens: Optional[int]) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        text = response.choices[0].message.content.strip()
+        self._record_usage(response.usage, system, prompt, text)
+        return text
+
+
+class SimulatorProvider(OpenAIProvider):
+    """OpenAI-compatible local stand-in (see loadtest/sim_llm_server.py) for offline load tests."""
+
+    name = "simulator"
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, api_key: str, model: str):
+        super().__init__(model)
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.client = genai.GenerativeModel(model)
+
+    async def complete(self, system: str, prompt: str, temperature: float, max_tokens: Optional[int]) -> str:
+        config = {"temperature": temperature}
+        if max_tokens:
+            config["max_output_tokens"] = max_tokens
+        # google-generativeai 0.3 has no system instruction, so it leads the prompt instead
+        contents = f"{system}\n\n{prompt}" if system else prompt
+        response = await self.client.generate_content_async(contents, generation_config=config)
+        text = response.text.strip()
+        usage = getattr(response, "usage_metadata", None)
+        self._record_usage(
+            SimpleNamespace(prompt_tokens=getattr(usage, "prompt_token_count", None),
+                            completion_tokens=getattr(usage, "candidates_token_count", None)),
+            system, prompt, text
+        )
+        return text
+
+
+class GroqProvider(LLMProvider):
+    name = "groq"
+
+    def __init__(self, api_key: str, model: str):
+        super().__init__(model)
+        from groq import AsyncGroq
+        self.client = AsyncGroq(api_key=api_key, max_retries=0)
+
+    async def complete(self, system: str, prompt: str, temperature: float, max_tokens: Optional[int]) -> str:
+        response = await self.client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            model=self.model,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        text = response.choices[0].message.content.strip()
+        self._record_usage(response.usage, system, prompt, text)
+        return text
+
+
+class ProviderStats:
+    """Rolling latency and error statistics for one provider."""
+
+    def __init__(self, window: int = 100, alpha: float = 0.2):
+        self.latencies = deque(maxlen=window)
+        self.alpha = alpha
+        self.ewma_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def record_success(self, latency: float) -> None:
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.latencies.append(latency)
+        self.ewma_latency = latency if self.ewma_latency is None else (
+            self.alpha * latency + (1 - self.alpha) * self.ewma_latency
+        )
+        self.error_rate = (1 - self.alpha) * self.error_rate
+
+    def record_failure(self, failure_threshold: int, cooldown: float) -> None:
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+        if self.consecutive_failures >= failure_threshold:
+            self.cooldown_until = time.monotonic() + cooldown
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def p95(self) -> Optional[float]:
+        """95th percentile latency, or None until enough samples have been seen."""
+        if len(self.latencies) < 10:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def score(self) -> float:
+        # Untried providers score 0 so they get explored; errors inflate the expected latency
+        if self.ewma_latency is None:
+            return float("inf") if self.failures else 0.0
+        return self.ewma_latency * (1 + 4 * self.error_rate)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy(),
+            "requests": self.requests,
+            "failures": self.failures,
+            "error_rate": round(self.error_rate, 4),
+            "ewma_latency_seconds": self.ewma_latency,
+            "p95_latency_seconds": self.p95(),
+        }
+
+
+class LLMRouter:
+    """Routes completions to the fastest healthy provider.
+
+    Providers are ranked by EWMA latency weighted by their recent error rate. A failed or
+    timed-out call fails over to the next provider, and providers that fail repeatedly are
+    put in a cooldown. With hedging enabled, a duplicate request is sent to the next provider
+    once the first has been running longer than its own p95 latency, and whichever answers
+    first wins.
+
+    With a scheduler, every call first waits for its priority class's turn and its share of the
+    provider's request and token rate limits. A rate-limited call does not count against the
+    provider's health: the provider is held for its Retry-After period and the call is retried.
+    """
+
+    def __init__(self, providers: List[LLMProvider], timeout: float = 60.0, hedging: bool = False,
+                 failure_threshold: int = 3, cooldown: float = 30.0,
+                 scheduler: Optional[LLMScheduler] = None, rate_limit_retries: int = 2,
+                 retry_after_default: float = 10.0):
+        self.providers = providers
+        self.timeout = timeout
+        self.hedging = hedging
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.scheduler = scheduler
+        self.rate_limit_retries = rate_limit_retries
+        self.retry_after_default = retry_after_default
+        self._stats = {provider.name: ProviderStats() for provider in providers}
+
+    @classmethod
+    def from_settings(cls) -> "LLMRouter":
+        scheduling = dict(
+            scheduler=LLMScheduler(parse_rate_limits(settings.LLM_RATE_LIMITS), settings.LLM_BATCH_RESERVE,
+                                   RateLimitState(settings.LLM_RATE_STATE_PATH)),
+            rate_limit_retries=settings.LLM_RATE_LIMIT_RETRIES,
+            retry_after_default=settings.LLM_RETRY_AFTER_DEFAULT_SECONDS
+        )
+        if settings.LLM_SIMULATOR_URL:
+            # Load tests must never reach a paid provider, so the simulator replaces them all
+            providers = [SimulatorProvider("simulator", settings.OPENAI_MODEL, base_url=settings.LLM_SIMULATOR_URL)]
+            return cls(providers, timeout=settings.LLM_TIMEOUT_SECONDS, hedging=False,
+                       failure_threshold=settings.LLM_FAILURE_THRESHOLD, cooldown=settings.LLM_COOLDOWN_SECONDS,
+                       **scheduling)
+
+        available = {}
+        if settings.OPENAI_API_KEY:
+            available["openai"] = lambda: OpenAIProvider(settings.OPENAI_API_KEY, settings.OPENAI_MODEL)
+        if settings.GOOGLE_API_KEY:
+            available["gemini"] = lambda: GeminiProvider(settings.GOOGLE_API_KEY, settings.GEMINI_MODEL)
+        if settings.GROQ_API_KEY:
+            available["groq"] = lambda: GroqProvider(settings.GROQ_API_KEY, settings.GROQ_MODEL)
+
+        order = [name.strip() for name in settings.LLM_PROVIDER_ORDER.split(",") if name.strip()]
+        providers = [available[name]() for name in order if name in available]
+        return cls(
+            providers,
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+            hedging=settings.LLM_HEDGING_ENABLED,
+            failure_threshold=settings.LLM_FAILURE_THRESHOLD,
+            cooldown=settings.LLM_COOLDOWN_SECONDS,
+            **scheduling
+        )
+
+    def ranked_providers(self, tokens: int = 0, priority: str = INTERACTIVE) -> List[LLMProvider]:
+        healthy = [p for p in self.providers if self._stats[p.name].healthy()]
+        # If everything is cooling down, try anyway rather than failing outright
+        candidates = healthy or list(self.providers)
+
+        def expected_seconds(provider: LLMProvider) -> float:
+            # Time spent waiting for rate-limit quota counts like extra latency
+            delay = self.scheduler.delay(provider.name, tokens, priority) if self.scheduler is not None else 0.0
+            return self._stats[provider.name].score() + delay
+
+        # sorted() is stable, so ties keep the configured preference order
+        return sorted(candidates, key=expected_seconds)
+
+    async def complete(self, system: str, prompt: str, temperature: float = 0.2,
+                       max_tokens: Optional[int] = 800, priority: str = INTERACTIVE) -> Tuple[str, str]:
+        """Return `(text, model)` from the first provider that answers successfully.
+
+        `priority` is the scheduler class: interactive for user-facing requests, batch for bulk work.
+        """
+        tokens = estimate_tokens(system, prompt, max_tokens)
+        candidates = self.ranked_providers(tokens, priority)
+        if not candidates:
+            raise ValueError("No LLM API key configured")
+
+        last_error: Optional[Exception] = None
+        attempted = set()
+        rate_limited: Dict[str, int] = {}
+        while candidates:
+            provider = candidates.pop(0)
+            if provider.name in attempted:
+                continue
+            attempted.add(provider.name)
+            backup = next((p for p in candidates if p.name not in attempted), None)
+            try:
+                if self.hedging and backup is not None and self._stats[provider.name].p95() is not None:
+                    return await self._hedged_call(provider, backup, system, prompt, temperature, max_tokens,
+                                                   priority, attempted)
+                return await self._call(provider, system, prompt, temperature, max_tokens, priority)
+            except Exception as e:
+                logger.warning(f"LLM provider {provider.name} failed: {e!r}")
+                last_error = e
+                # Retry a rate-limited provider after the others; its queue waits out Retry-After
+                if (self.scheduler is not None and self._is_rate_limited(e)
+                        and rate_limited.get(provider.name, 0) < self.rate_limit_retries):
+                    rate_limited[provider.name] = rate_limited.get(provider.name, 0) + 1
+                    attempted.discard(provider.name)
+                    candidates.append(provider)
+        raise last_error
+
+    def _is_rate_limited(self, error: Exception) -> bool:
+        return retry_after_seconds(error, self.retry_after_default) is not None
+
+    async def _call(self, provider: LLMProvider, system: str, prompt: str, temperature: float,
+                    max_tokens: Optional[int], priority: str = INTERACTIVE) -> Tuple[str, str]:
+        stats = self._stats[provider.name]
+        if self.scheduler is not None:
+            with span("llm.queue", provider=provider.name, priority=priority):
+                await self.scheduler.acquire(provider.name, estimate_tokens(system, prompt, max_tokens), priority)
+        start = time.perf_counter()
+        try:
+            with LLM_IN_FLIGHT.track_inprogress(provider=provider.name), span(f"llm.{provider.name}"):
+                text = await asyncio.wait_for(provider.complete(system, prompt, temperature, max_tokens), self.timeout)
+        except asyncio.CancelledError:
+            # Lost a hedge race or the caller went away; not the provider's fault
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, provider=provider.name, outcome="cancelled")
+            raise
+        except Exception as e:
+            retry_after = retry_after_seconds(e, self.retry_after_default)
+            if retry_after is not None and self.scheduler is not None:
+                # Over quota, not unhealthy: hold the provider instead of cooling it down
+                self.scheduler.penalize(provider.name, retry_after)
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, provider=provider.name,
+                                            outcome="rate_limited")
+                raise
+            stats.record_failure(self.failure_threshold, self.cooldown)
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, provider=provider.name, outcome="error")
+            raise
+        latency = time.perf_counter() - start
+        stats.record_success(latency)
+        LLM_REQUEST_SECONDS.observe(latency, provider=provider.name, outcome="success")
+        return text, provider.model
+
+    async def _hedged_call(self, primary: LLMProvider, backup: LLMProvider, system: str, prompt: str,
+                           temperature: float, max_tokens: Optional[int], priority: str,
+                           attempted: set) -> Tuple[str, str]:
+        tasks = [asyncio.create_task(self._call(primary, system, prompt, temperature, max_tokens, priority))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self._stats[primary.name].p95())
+            if done:
+                return tasks[0].result()
+
+            logger.info(f"Hedging slow {primary.name} request with {backup.name}")
+            attempted.add(backup.name)
+            tasks.append(asyncio.create_task(self._call(backup, system, prompt, temperature, max_tokens, priority)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedging": self.hedging,
+            "providers": {p.name: {"model": p.model, **self._stats[p.name].to_dict()} for p in self.providers},
+            "scheduler": self.scheduler.stats() if self.scheduler is not None else None
+        }
+
+
+llm_router = LLMRouter.from_settings()
@@ -0,0 +1,280 @@
+"""Admission control for LLM calls: per-provider rate limits shared by all workers.
+
+Bucket levels and Retry-After holds live in a SQLite file (`LLM_RATE_STATE_PATH`), so a
+provider limit is enforced across every worker that opens the same file, and a 429 seen by one
+worker holds the others too. The priority queue in front of each provider is per worker.
+"""
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from contextlib import contextmanager
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from ..core.metrics import LLM_QUEUE_SECONDS, LLM_RATE_LIMITED_TOTAL
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+_PRIORITY_RANK = {INTERACTIVE: 0, BATCH: 1}
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "openai=500:30000,groq=30:6000" into {provider: (requests/min, tokens/min)}; 0 means unlimited."""
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, values = item.partition("=")
+        requests, _, tokens = values.partition(":")
+        limits[name.strip()] = (float(requests or 0), float(tokens or 0))
+    return limits
+
+
+def estimate_tokens(system: str, prompt: str, max_tokens: Optional[int]) -> int:
+    """Tokens a call counts against a TPM limit: the prompt at ~4 chars/token plus the completion budget."""
+    return (len(system) + len(prompt)) // 4 + (max_tokens or 0)
+
+
+def retry_after_seconds(error: Exception, default: float) -> Optional[float]:
+    """Back-off requested by a provider rate-limit error (HTTP 429), or None for any other error."""
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status != 429 and type(error).__name__ not in ("RateLimitError", "ResourceExhausted"):
+        return None
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                pass  # HTTP-date form; fall back to the default
+    return default
+
+
+class TokenBucket:
+    """Continuously refilled bucket holding up to one minute's allowance."""
+
+    def __init__(self, per_minute: float, now: float, level: Optional[float] = None):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute if level is None else min(level, per_minute)
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        # Workers' clocks can disagree slightly; time never runs backwards for a bucket
+        self.level = min(self.capacity, self.level + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+
+    def wait_time(self, amount: float, reserve: float, now: float) -> float:
+        """Seconds until `amount` can be taken while leaving `reserve` (a fraction of capacity) untouched."""
+        self._refill(now)
+        # A request larger than the whole allowance waits for a full bucket and runs into debt
+        needed = min(amount + reserve * self.capacity, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= amount
+
+
+class RateLimitState:
+    """Token bucket levels and Retry-After holds per provider, in SQLite.
+
+    Each admission is one write transaction (refill for the time elapsed, check, draw), so
+    workers sharing the file never admit more than the limit between them. ":memory:" keeps
+    the state private to one process. Times are wall-clock seconds, comparable across workers.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "provider TEXT NOT NULL, kind TEXT NOT NULL, level REAL NOT NULL, updated REAL NOT NULL, "
+                "PRIMARY KEY (provider, kind))"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS holds (provider TEXT PRIMARY KEY, until REAL NOT NULL)")
+
+    @contextmanager
+    def _write_transaction(self):
+        with self._lock:
+            # IMMEDIATE takes the database write lock up front, serializing admissions across workers
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _buckets(self, conn, provider: str, limits: Tuple[float, float], now: float) -> Dict[str, TokenBucket]:
+        stored = {kind: (level, updated) for kind, level, updated in conn.execute(
+            "SELECT kind, level, updated FROM buckets WHERE provider = ?", (provider,))}
+        buckets = {}
+        for kind, per_minute in zip(("requests", "tokens"), limits):
+            if per_minute:
+                level, updated = stored.get(kind, (None, now))
+                buckets[kind] = TokenBucket(per_minute, updated, level)
+        return buckets
+
+    def _wait(self, conn, provider: str, limits: Tuple[float, float], tokens: int, reserve: float,
+              now: float) -> Tuple[float, Dict[str, TokenBucket]]:
+        hold = conn.execute("SELECT until FROM holds WHERE provider = ?", (provider,)).fetchone()
+        buckets = self._buckets(conn, provider, limits, now)
+        amounts = {"requests": 1, "tokens": tokens}
+        waits = [hold[0] - now if hold else 0.0]
+        waits.extend(bucket.wait_time(amounts[kind], reserve, now) for kind, bucket in buckets.items())
+        return max(0.0, *waits), buckets
+
+    def wait_time(self, provider: str, limits: Tuple[float, float], tokens: int, reserve: float,
+                  now: float) -> float:
+        """Seconds before a call of `tokens` could be admitted on `provider`."""
+        with self._lock:
+            return self._wait(self._conn, provider, limits, tokens, reserve, now)[0]
+
+    def try_take(self, provider: str, limits: Tuple[float, float], tokens: int, reserve: float,
+                 now: float) -> float:
+        """Draw one request and `tokens` if they are available; returns 0 then, else the seconds to wait."""
+        with self._write_transaction() as conn:
+            wait, buckets = self._wait(conn, provider, limits, tokens, reserve, now)
+            if wait > 0:
+                return wait
+            amounts = {"requests": 1, "tokens": tokens}
+            for kind, bucket in buckets.items():
+                bucket.take(amounts[kind], now)
+                conn.execute("INSERT OR REPLACE INTO buckets (provider, kind, level, updated) VALUES (?, ?, ?, ?)",
+                             (provider, kind, bucket.level, bucket.updated))
+            return 0.0
+
+    def hold(self, provider: str, until: float) -> None:
+        """Admit nothing on `provider` before `until`; an existing longer hold is kept."""
+        with self._write_transaction() as conn:
+            current = conn.execute("SELECT until FROM holds WHERE provider = ?", (provider,)).fetchone()
+            conn.execute("INSERT OR REPLACE INTO holds (provider, until) VALUES (?, ?)",
+                         (provider, max(until, current[0]) if current else until))
+
+    def snapshot(self, provider: str, limits: Tuple[float, float], now: float) -> Dict[str, Any]:
+        """Current bucket levels and hold of `provider`."""
+        with self._lock:
+            hold = self._conn.execute("SELECT until FROM holds WHERE provider = ?", (provider,)).fetchone()
+            buckets = self._buckets(self._conn, provider, limits, now)
+        for bucket in buckets.values():
+            bucket.wait_time(0, 0.0, now)  # refill to the current level
+        return {
+            "requests_available": round(buckets["requests"].level, 1) if "requests" in buckets else None,
+            "tokens_available": round(buckets["tokens"].level) if "tokens" in buckets else None,
+            "blocked_for_seconds": round(max(0.0, hold[0] - now), 3) if hold else 0.0,
+        }
+
+
+class _ProviderQueue:
+    def __init__(self, limits: Tuple[float, float]):
+        self.limits = limits
+        self.waiters: List[Tuple[int, int, int]] = []  # heap of (priority rank, arrival, tokens)
+        self.condition: Optional[asyncio.Condition] = None
+
+
+class LLMScheduler:
+    """Token-bucket admission control for LLM calls, per provider and per priority class.
+
+    Each provider has a requests/min and a tokens/min bucket in `state`. Calls wait in a
+    per-provider priority queue: interactive calls always go ahead of batch calls, and batch
+    calls may only draw a bucket down to `batch_reserve` of its capacity, so interactive traffic
+    keeps headroom while batch work soaks up the rest. A rate-limit response blocks the provider
+    for its Retry-After period. The head of a queue re-checks at least every `poll_seconds`,
+    since other workers' draws and holds on a shared state are not signalled to this one.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None, batch_reserve: float = 0.2,
+                 state: Optional[RateLimitState] = None, clock: Callable[[], float] = time.time,
+                 poll_seconds: float = 1.0):
+        self.limits = limits or {}
+        self.batch_reserve = batch_reserve
+        self.state = state if state is not None else RateLimitState()
+        self.clock = clock
+        self.poll_seconds = poll_seconds
+        self._queues: Dict[str, _ProviderQueue] = {}
+        self._arrivals = itertools.count()
+
+    def _queue(self, provider: str) -> _ProviderQueue:
+        queue = self._queues.get(provider)
+        if queue is None:
+            queue = self._queues[provider] = _ProviderQueue(self.limits.get(provider, (0, 0)))
+        return queue
+
+    def _reserve(self, priority: str) -> float:
+        return self.batch_reserve if priority == BATCH else 0.0
+
+    def delay(self, provider: str, tokens: int, priority: str = INTERACTIVE) -> float:
+        """Estimated seconds before a call could start on `provider`, ignoring calls already queued."""
+        return self.state.wait_time(provider, self._queue(provider).limits, tokens, self._reserve(priority),
+                                    self.clock())
+
+    async def acquire(self, provider: str, tokens: int, priority: str = INTERACTIVE) -> float:
+        """Wait for this call's turn and quota on `provider`; returns the seconds spent waiting."""
+        queue = self._queue(provider)
+        if queue.condition is None:
+            queue.condition = asyncio.Condition()
+        entry = (_PRIORITY_RANK[priority], next(self._arrivals), tokens)
+        reserve = self._reserve(priority)
+        start = self.clock()
+
+        async with queue.condition:
+            heapq.heappush(queue.waiters, entry)
+            try:
+                while True:
+                    delay = None  # not at the head: sleep until the queue changes
+                    if queue.waiters[0] is entry:
+                        delay = self.state.try_take(provider, queue.limits, tokens, reserve, self.clock())
+                        if delay <= 0:
+                            heapq.heappop(queue.waiters)
+                            break
+                        delay = min(delay, self.poll_seconds)
+                    try:
+                        await asyncio.wait_for(queue.condition.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                # Cancelled while queued (e.g. the client disconnected); give up the place in line
+                if entry in queue.waiters:
+                    queue.waiters.remove(entry)
+                    heapq.heapify(queue.waiters)
+                raise
+            finally:
+                queue.condition.notify_all()
+
+        waited = max(0.0, self.clock() - start)
+        LLM_QUEUE_SECONDS.observe(waited, provider=provider, priority=priority)
+        return waited
+
+    def penalize(self, provider: str, seconds: float) -> None:
+        """Hold every call to `provider`, in every worker, for `seconds` after a rate-limit error."""
+        self.state.hold(provider, self.clock() + seconds)
+        LLM_RATE_LIMITED_TOTAL.inc(provider=provider)
+        logger.warning(f"LLM provider {provider} rate-limited; holding calls for {seconds:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        now = self.clock()
+        stats = {}
+        for name, queue in self._queues.items():
+            requests_per_minute, tokens_per_minute = queue.limits
+            stats[name] = {
+                "requests_per_minute": requests_per_minute or None,
+                "tokens_per_minute": tokens_per_minute or None,
+                **self.state.snapshot(name, queue.limits, now),
+                "queued": {priority: sum(1 for entry in queue.waiters if entry[0] == _PRIORITY_RANK[priority])
+                           for priority in PRIORITIES},
+            }
+        return {"batch_reserve": self.batch_reserve, "providers": stats}
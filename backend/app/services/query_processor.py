@@ -1,107 +1,181 @@
-from typing import List, Dict, Any
-import openai
-import google.generativeai as genai
-from groq import Groq
+from typing import List, Dict, Any, Optional
+from fastapi.concurrency import run_in_threadpool
+from .llm_router import llm_router
+from .llm_scheduler import INTERACTIVE
+from .semantic_cache import semantic_cache
+from .dedup import group_duplicates
 from ..core.config import settings
-import chromadb
+from ..core.deadline import Deadline
+from ..core.log_sampling import log_sampled
+from ..core.profiling import span
+from ..core.metrics import VECTOR_STORE_SECONDS
+import asyncio
+import hashlib
 import logging
 import re
 
 logger = logging.getLogger(__name__)
 
+QUERY_SYSTEM_PROMPT = (
+    "You answer document-based questions with accurate citations. Always cite sources in the format "
+    "(page X, para Y) where X is the page number and Y is the paragraph number."
+)
+SYNTHESIS_SYSTEM_PROMPT = "You synthesize research findings into a single, clear answer."
+
 class QueryProcessor:
-    def __init__(self, doc_collection):
+    def __init__(self, doc_collection, llm=llm_router, cache=semantic_cache,
+                 collapse_duplicates: bool = settings.DEDUP_COLLAPSE):
         self.doc_collection = doc_collection
+        self.llm = llm
+        self.cache = cache
+        self.collapse_duplicates = collapse_duplicates
 
-        if settings.OPENAI_API_KEY:
-            openai.api_key = settings.OPENAI_API_KEY
-
-        if settings.GOOGLE_API_KEY:
-            genai.configure(api_key=settings.GOOGLE_API_KEY)
+    async def process_query(self, query: str, timestamp: str) -> List[Dict[str, Any]]:
+        return await self.process_sessions(query, [timestamp])
 
-        if settings.GROQ_API_KEY:
-            self.groq_client = Groq(api_key=settings.GROQ_API_KEY)
+    async def process_sessions(self, query: str, timestamps: List[str], priority: str = INTERACTIVE,
+                               deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """Answer `query` against every document of the given sessions.
 
-    async def process_query(self, query: str, timestamp: str) -> List[Dict[str, str]]:
-        try:
-            documents = self._get_documents_by_timestamp(timestamp)
-            logger.info(f"Retrieved {len(documents)} documents for timestamp {timestamp}")
-            
+        All sessions are fetched in one storage call and their per-document LLM calls share one
+        concurrency budget; answers are cached for the session set as a whole. `priority` is the
+        LLM scheduler class the calls queue under. When `deadline` runs out, documents not yet
+        answered are left out and the deadline is marked truncated.
+        """
+        timestamps = list(dict.fromkeys(timestamps))  # a session named twice is answered once
+        with span("QueryProcessor.process_sessions", sessions=len(timestamps)):
+            # Every requested session's full text in one read; kept off the event loop
+            documents = await run_in_threadpool(self._get_documents, timestamps)
+            logger.info(f"Retrieved {len(documents)} documents for timestamps {timestamps}")
             if not documents:
-                logger.warning(f"No documents found for timestamp {timestamp}")
+                logger.warning(f"No documents found for timestamps {timestamps}")
                 return []
 
-            responses = []
+            scope = ",".join(sorted(timestamps))
+            vector = None
+            if self.cache is not None:
+                try:
+                    with span("cache.lookup"):
+                        # Embedding is CPU-bound; keep it off the event loop
+                        vector = await run_in_threadpool(self.cache.embed, query)
+                        fingerprint = self._fingerprint(documents)
+                        cached = self.cache.lookup(scope, vector, fingerprint)
+                except Exception as e:
+                    logger.warning(f"Semantic cache unavailable, answering without it: {str(e)}")
+                    vector, cached = None, None
+                if cached is not None:
+                    return [dict(result, cached=True) for result in cached]
+
+            results = await self._answer_documents(query, documents, priority, deadline)
+            # Partial answers, and answers that failed on every provider, are not worth replaying
+            truncated = deadline is not None and deadline.truncated
+            if vector is not None and not truncated and all(result["model"] != "None" for result in results):
+                self.cache.store(scope, vector, fingerprint, results)
+            return results
 
-            for doc in documents:
-                context = self._prepare_prompt(query, doc["document"])
+    def _fingerprint(self, documents: List[Dict[str, Any]]) -> str:
+        """Hash of the document IDs, so cached answers die with any add or delete in the sessions."""
+        return hashlib.sha256("\n".join(sorted(doc["key"] for doc in documents)).encode("utf-8")).hexdigest()
+
+    async def _answer_documents(self, query: str, documents: List[Dict[str, Any]], priority: str = INTERACTIVE,
+                                deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        if self.collapse_duplicates:
+            documents = self._collapse_duplicates(documents)
+
+        prompts = []
+        for doc in documents:
+            with span("prompt.build", doc_id=doc["key"]):
+                prompts.append(self._prepare_prompt(query, doc["document"]))
+
+        # Identical prompts (the same text stored in several sessions) cost one LLM call
+        unique_prompts = {}
+        for doc, prompt in zip(documents, prompts):
+            unique_prompts.setdefault(prompt, doc["key"])
+        semaphore = asyncio.Semaphore(settings.QUERY_LLM_CONCURRENCY)
+
+        async def answer(prompt: str, key: str):
+            async with semaphore:
                 try:
-                    if settings.OPENAI_API_KEY:
-                        answer = await self._query_openai(context)
-                        model = "gpt-4"
-                    elif settings.GOOGLE_API_KEY:
-                        answer = await self._query_gemini(context)
-                        model = "gemini-pro"
-                    elif settings.GROQ_API_KEY:
-                        answer = await self._query_groq(context)
-                        model = "llama-3.3-70b-versatile"
-                    else:
-                        raise ValueError("No LLM API key configured")
+                    return await self.llm.complete(QUERY_SYSTEM_PROMPT, prompt, temperature=0.2, max_tokens=800,
+                                                   priority=priority)
                 except Exception as e:
-                    logger.error(f"Error processing document {doc['id']}: {str(e)}")
-                    answer = f"Error: {str(e)}"
-                    model = "None"
+                    logger.error(f"Error processing document {key}: {str(e)}")
+                    return f"Error: {str(e)}", "None"
+
+        tasks = {asyncio.ensure_future(answer(prompt, key)): prompt for prompt, key in unique_prompts.items()}
+        try:
+            with span("llm.fanout", prompts=len(unique_prompts)):
+                done, pending = await asyncio.wait(tasks, timeout=deadline.remaining() if deadline else None)
+        finally:
+            # Out of time, or the caller was cancelled: abort calls in flight and drop queued ones
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        if pending:
+            deadline.truncate()
+            logger.info(f"Deadline reached with {len(pending)} of {len(tasks)} document answers outstanding")
+        answers = {tasks[task]: task.result() for task in done}
 
-                # Extract citations from the answer
+        responses = []
+        for doc, prompt in zip(documents, prompts):
+            if prompt not in answers:
+                continue
+            answer, model = answers[prompt]
+            # Extract citations from the answer
+            with span("parse.citations"):
                 citations = self._extract_citations(answer)
-                
-                responses.append({
-                    "doc_id": doc["id"],
-                    "response": answer,
-                    "citations": citations,
-                    "model": model
-                })
-
-            return responses
-        except Exception as e:
-            logger.error(f"Error in process_query: {str(e)}")
-            raise
 
-    def _get_documents_by_timestamp(self, timestamp: str) -> List[Dict[str, Any]]:
+            responses.append({
+                "doc_id": doc["id"],
+                "timestamp": doc["metadata"].get("timestamp"),
+                "response": answer,
+                "citations": citations,
+                "model": model,
+                "duplicates": doc.get("duplicates", [])
+            })
+        return responses
+
+    def _get_documents(self, timestamps: List[str]) -> List[Dict[str, Any]]:
+        """Every document of the given sessions in one filtered read, ordered by session."""
         try:
-            logger.info(f"Fetching documents for timestamp: {timestamp}")
-            # Log all available documents and their timestamps for debugging
-            all_docs = self.doc_collection.get()
-            if all_docs and all_docs["metadatas"]:
-                logger.info("Available documents in ChromaDB:")
-                for meta in all_docs["metadatas"]:
-                    logger.info(f"Document ID: {meta.get('doc_id')}, Timestamp: {meta.get('timestamp')}")
-                    # Log if this document matches our search timestamp
-                    if meta.get('timestamp') == timestamp:
-                        logger.info(f"✓ Found matching document: {meta.get('doc_id')}")
-                    else:
-                        logger.info(f"✗ No match for document: {meta.get('doc_id')}")
-            
-            results = self.doc_collection.get(
-                where={"timestamp": timestamp},
-                include=["documents", "metadatas"]
-            )
+            where = {"timestamp": timestamps[0]} if len(timestamps) == 1 else {"timestamp": {"$in": timestamps}}
+            with VECTOR_STORE_SECONDS.time(operation="get"), span("storage.get", sessions=len(timestamps)):
+                results = self.doc_collection.get(
+                    where=where,
+                    include=["documents", "metadatas"]
+                )
             
             if not results["documents"]:
-                logger.warning(f"No documents found in ChromaDB for timestamp {timestamp}")
+                logger.warning(f"No documents found in ChromaDB for timestamps {timestamps}")
                 return []
 
+            session_order = {timestamp: i for i, timestamp in enumerate(timestamps)}
             documents = [
-                {"id": meta.get("doc_id"), "document": doc, "metadata": meta}
-                for doc, meta in zip(results["documents"], results["metadatas"])
+                {"id": meta.get("doc_id"), "key": key, "document": doc, "metadata": meta}
+                for key, doc, meta in zip(results["ids"], results["documents"], results["metadatas"])
             ]
-            
-            logger.info(f"Retrieved {len(documents)} documents from ChromaDB")
+            documents.sort(key=lambda doc: session_order.get(doc["metadata"].get("timestamp"), len(timestamps)))
+            log_sampled(logger, logging.DEBUG, "Sessions %s matched documents %s",
+                        timestamps, [doc["key"] for doc in documents])
             return documents
         except Exception as e:
             logger.error(f"Error fetching documents: {str(e)}")
             raise
 
+    def _collapse_duplicates(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep one representative per near-duplicate cluster, listing the others under `duplicates`."""
+        by_key = {doc["key"]: doc for doc in documents}
+        groups = group_duplicates([doc["key"] for doc in documents],
+                                  [doc["metadata"].get("duplicate_of") for doc in documents])
+        collapsed = []
+        for key, duplicate_keys in groups.items():
+            collapsed.append(dict(by_key[key], duplicates=duplicate_keys))
+        if len(collapsed) < len(documents):
+            logger.info(f"Collapsed {len(documents)} documents into {len(collapsed)} near-duplicate clusters")
+        return collapsed
+
     def _prepare_prompt(self, query: str, document_text: str) -> str:
         return (
             f"You are an assistant answering user questions based on a document.\n\n"
@@ -124,23 +198,6 @@ class QueryProcessor:
             "Please ensure all citations follow these exact formats."
         )
 
-    async def _query_openai(self, prompt: str) -> str:
-        response = await openai.ChatCompletion.acreate(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You answer document-based questions with accurate citations."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-            max_tokens=800
-        )
-        return response.choices[0].message.content.strip()
-
-    async def _query_gemini(self, prompt: str) -> str:
-        model = genai.GenerativeModel('gemini-pro')
-        response = await model.generate_content_async(prompt)
-        return response.text.strip()
-
     def _extract_citations(self, text: str) -> List[Dict[str, str]]:
         """Extract citations from text in various formats:
         - (page X, para Y)
@@ -193,22 +250,15 @@ class QueryProcessor:
         
         return citations
 
-    async def _query_groq(self, prompt: str) -> str:
-        response = self.groq_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You answer document-based questions with accurate citations. Always cite sources in the format (page X, para Y) where X is the page number and Y is the paragraph number."},
-                {"role": "user", "content": prompt}
-            ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.2,
-        )
-        return response.choices[0].message.content.strip()
-
-    async def synthesize_combined_answer(self, user_query: str, doc_results: list) -> str:
+    async def synthesize_combined_answer(self, user_query: str, doc_results: list, priority: str = INTERACTIVE,
+                                         deadline: Optional[Deadline] = None) -> Optional[str]:
         """
         Given the user query and a list of document-wise results, synthesize a single, comprehensive answer using the LLM.
+        Returns None if `deadline` runs out first.
         """
         if not doc_results or len(doc_results) == 0:
+            if deadline is not None and deadline.truncated:
+                return None  # ran out of time before any document was answered
             return "No relevant information found in the uploaded documents."
 
         # Prepare a summary context
@@ -217,35 +267,37 @@ class QueryProcessor:
         context += "Document-wise Answers:\n"
         for idx, res in enumerate(doc_results, 1):
             doc_name = res.get('doc_id', f'Document {idx}')
-            answer = res.get('response', '')
+            answer = self._clip_answer(res.get('response', ''))
             context += f"- {doc_name}: {answer}\n"
         context += ("\nPlease provide a single, well-structured answer that combines the key points from all the above document-wise answers. Do not repeat the same information. Cite only if necessary.")
 
-        # Use the same LLM as for document-wise answers
-        if settings.OPENAI_API_KEY:
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You synthesize research findings into a single, clear answer."},
-                    {"role": "user", "content": context}
-                ],
-                temperature=0.3,
-                max_tokens=800
-            )
-            return response.choices[0].message.content.strip()
-        elif settings.GOOGLE_API_KEY:
-            model = genai.GenerativeModel('gemini-pro')
-            response = await model.generate_content_async(context)
-            return response.text.strip()
-        elif settings.GROQ_API_KEY:
-            response = self.groq_client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": "You synthesize research findings into a single, clear answer."},
-                    {"role": "user", "content": context}
-                ],
-                model="llama-3.3-70b-versatile",
-                temperature=0.3,
-            )
-            return response.choices[0].message.content.strip()
-        else:
-            return "No LLM API key configured for synthesis."
\ No newline at end of file
+        # Use the same provider router as for document-wise answers
+        if not self.llm.providers:
+            return "No LLM API key configured for synthesis."
+        if deadline is not None and deadline.expired:
+            deadline.truncate()
+            return None
+        try:
+            with span("QueryProcessor.synthesize", documents=len(doc_results)):
+                answer, _ = await asyncio.wait_for(
+                    self.llm.complete(SYNTHESIS_SYSTEM_PROMPT, context, temperature=0.3, max_tokens=800,
+                                      priority=priority),
+                    deadline.remaining() if deadline else None
+                )
+        except asyncio.TimeoutError:
+            # A provider timeout re-raised by the router is a failure, not the request's deadline
+            if deadline is None or not deadline.expired:
+                raise
+            deadline.truncate()
+            logger.info("Deadline reached during answer synthesis")
+            return None
+        return answer
+
+    def _clip_answer(self, answer: str) -> str:
+        """Cut a per-document answer to `SYNTHESIS_ANSWER_CHARS` at a sentence boundary where possible."""
+        limit = settings.SYNTHESIS_ANSWER_CHARS
+        if len(answer) <= limit:
+            return answer
+        clipped = answer[:limit]
+        end = max(clipped.rfind(". "), clipped.rfind(".\n"))
+        return clipped[:end + 1] if end > limit // 2 else clipped + "..."
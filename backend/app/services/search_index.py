@@ -0,0 +1,106 @@
+from typing import List, Dict, Any, Optional, Iterable
+from collections import Counter
+import heapq
+import math
+import re
+import threading
+
+# Keep identifiers such as "2021/00123", "s.12(3)" or "CR-45-2019" together as a
+# single token; their pieces are indexed as well so partial ids still match.
+TOKEN_PATTERN = re.compile(r"\w+(?:[-/.:]\w+)*")
+TOKEN_SPLIT_PATTERN = re.compile(r"[-/.:]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokenizer that keeps compound identifiers and their parts."""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group(0)
+        tokens.append(token)
+        if TOKEN_SPLIT_PATTERN.search(token):
+            tokens.extend(part for part in TOKEN_SPLIT_PATTERN.split(token) if part)
+    return tokens
+
+
+class BM25Index:
+    """In-memory inverted index scored with Okapi BM25.
+
+    Documents are keyed by their full vector-store id and tagged with the session
+    timestamp so that searches can be restricted to one or more sessions.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._doc_sessions: Dict[str, str] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._doc_lengths
+
+    def session_of(self, key: str) -> Optional[str]:
+        return self._doc_sessions.get(key)
+
+    def add(self, key: str, text: str, session: Optional[str] = None) -> None:
+        """Index a document, replacing any previous version stored under the same key."""
+        terms = Counter(tokenize(text))
+        with self._lock:
+            self._remove_locked(key)
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[key] = tf
+            length = sum(terms.values())
+            self._doc_terms[key] = terms
+            self._doc_lengths[key] = length
+            self._doc_sessions[key] = session
+            self._total_length += length
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._remove_locked(key)
+
+    def _remove_locked(self, key: str) -> None:
+        terms = self._doc_terms.pop(key, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(key)
+        self._doc_sessions.pop(key, None)
+
+    def search(self, query: str, n_results: int = 5, sessions: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Return the top `n_results` documents as dicts with `id` and `score`."""
+        query_terms = set(tokenize(query))
+        allowed = set(sessions) if sessions else None
+
+        with self._lock:
+            n_docs = len(self._doc_lengths)
+            if not n_docs or not query_terms:
+                return []
+            avg_length = self._total_length / n_docs
+            scores: Dict[str, float] = {}
+
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for key, tf in postings.items():
+                    if allowed is not None and self._doc_sessions.get(key) not in allowed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[key] / avg_length)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        top = heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+        return [{"id": key, "score": score} for key, score in top]
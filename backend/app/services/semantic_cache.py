@@ -0,0 +1,115 @@
+from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+import threading
+
+import numpy as np
+
+from ..core.config import settings
+from ..core.metrics import SEMANTIC_CACHE_LOOKUPS
+
+
+class _SessionEntries:
+    """Ring buffer of recent query embeddings and their answers for one session."""
+
+    def __init__(self, capacity: int, dim: int, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.answers: List[Any] = [None] * capacity
+        self.size = 0
+        self.next = 0
+
+    def add(self, vector: np.ndarray, answer: Any) -> None:
+        self.vectors[self.next] = vector
+        self.answers[self.next] = answer
+        self.next = (self.next + 1) % len(self.answers)
+        self.size = min(self.size + 1, len(self.answers))
+
+
+class SemanticQueryCache:
+    """Cache of query answers per session set, matched by embedding similarity.
+
+    Keys are comma-joined session timestamps. Each key keeps its most recent queries as a
+    normalized float32 matrix, so a lookup is one matrix-vector product. Entries are tied to a
+    fingerprint of the sessions' documents: if the documents change (in this worker or another),
+    the fingerprint differs and the entries are dropped. `invalidate` clears every key that
+    includes a session immediately on local changes.
+    """
+
+    def __init__(self, embedder, threshold: float = 0.9, max_entries: int = 256, max_sessions: int = 1000):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionEntries]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embedder.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, session: str, vector: np.ndarray, fingerprint: str) -> Optional[Any]:
+        with self._lock:
+            entries = self._sessions.get(session)
+            if entries is not None and entries.fingerprint != fingerprint:
+                del self._sessions[session]
+                entries = None
+
+            answer = None
+            if entries is not None and entries.size:
+                similarities = entries.vectors[:entries.size] @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    answer = entries.answers[best]
+                    self._sessions.move_to_end(session)
+
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        SEMANTIC_CACHE_LOOKUPS.inc(result="miss" if answer is None else "hit")
+        return answer
+
+    def store(self, session: str, vector: np.ndarray, fingerprint: str, answer: Any) -> None:
+        with self._lock:
+            entries = self._sessions.get(session)
+            if entries is None or entries.fingerprint != fingerprint or entries.vectors.shape[1] != len(vector):
+                entries = self._sessions[session] = _SessionEntries(self.max_entries, len(vector), fingerprint)
+            entries.add(vector, answer)
+            self._sessions.move_to_end(session)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def invalidate(self, session: str) -> None:
+        with self._lock:
+            for key in [key for key in self._sessions if session in key.split(",")]:
+                del self._sessions[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "threshold": self.threshold,
+                "sessions": len(self._sessions),
+                "entries": sum(entries.size for entries in self._sessions.values()),
+            }
+
+
+def _build_cache() -> Optional[SemanticQueryCache]:
+    if not settings.SEMANTIC_CACHE_ENABLED:
+        return None
+    from .embeddings import embedding_service
+    return SemanticQueryCache(
+        embedding_service,
+        threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+        max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+        max_sessions=settings.SEMANTIC_CACHE_MAX_SESSIONS
+    )
+
+
+semantic_cache = _build_cache()
@@ -0,0 +1,220 @@
+"""Session snapshots: a whole session in one Arrow IPC file.
+
+Documents are written in record batches of `SNAPSHOT_BATCH_SIZE` rows with the extracted text,
+stored metadata and the embedding as a fixed-size float32 list (one contiguous block per batch).
+Themes, their embeddings and document memberships are small and travel as JSON in the schema
+metadata. Importing memory-maps the file and bulk-loads one batch at a time, without re-running
+OCR or the embedding model.
+"""
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+import json
+import logging
+
+import numpy as np
+import pyarrow as pa
+
+from ..core.config import settings
+from ..core.metrics import VECTOR_STORE_SECONDS
+from ..core.profiling import span
+from .embeddings import embedding_service
+from .theme_index import theme_index
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = "theme-weaver-session"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_MEDIA_TYPE = "application/vnd.apache.arrow.file"
+
+
+class SnapshotError(Exception):
+    """The snapshot cannot be exported or imported as requested."""
+
+
+class SessionExists(SnapshotError):
+    """The target session already has documents and `replace` was not set."""
+
+
+def _describe_embedding(backend: str, model: str, quantized: bool) -> str:
+    return f"{backend}/{model}{' (int8)' if quantized else ''}"
+
+
+class SessionSnapshotter:
+    def __init__(self, document_processor, theme_collection, index=theme_index, embedder=embedding_service):
+        self.documents = document_processor
+        self.theme_collection = theme_collection
+        self.index = index
+        self.embedder = embedder
+
+    # --- Export ---
+
+    def export_session(self, timestamp: str, path: str) -> Dict[str, Any]:
+        collection = self.documents.collection
+        with VECTOR_STORE_SECONDS.time(operation="get"), span("storage.get"):
+            full_doc_ids = collection.get(where={"timestamp": timestamp}, include=[])["ids"]
+        if not full_doc_ids:
+            raise SnapshotError(f"No documents found for session {timestamp}")
+
+        writer = None
+        with pa.OSFile(path, "wb") as sink:
+            for start in range(0, len(full_doc_ids), settings.SNAPSHOT_BATCH_SIZE):
+                chunk = full_doc_ids[start:start + settings.SNAPSHOT_BATCH_SIZE]
+                with VECTOR_STORE_SECONDS.time(operation="get"), span("storage.get", documents=len(chunk)):
+                    stored = collection.get(ids=chunk, include=["documents", "metadatas", "embeddings"])
+                embeddings = np.asarray(stored["embeddings"], dtype=np.float32)
+                if writer is None:
+                    # The first batch fixes the embedding width recorded in the schema
+                    dim = embeddings.shape[1]
+                    schema = self._schema(dim, self._header(timestamp, len(full_doc_ids), dim))
+                    options = pa.ipc.IpcWriteOptions(compression=settings.SNAPSHOT_COMPRESSION or None)
+                    writer = pa.ipc.new_file(sink, schema, options=options)
+                writer.write_batch(pa.record_batch([
+                    pa.array(stored["ids"], pa.string()),
+                    pa.array([(meta or {}).get("doc_id") for meta in stored["metadatas"]], pa.string()),
+                    pa.array(stored["documents"], pa.large_string()),
+                    pa.array([json.dumps(meta or {}) for meta in stored["metadatas"]], pa.string()),
+                    pa.FixedSizeListArray.from_arrays(pa.array(embeddings.ravel(), pa.float32()), dim),
+                ], schema=schema))
+            writer.close()
+
+        logger.info(f"Exported session {timestamp}: {len(full_doc_ids)} documents to {path}")
+        return {"session": timestamp, "documents": len(full_doc_ids), "dimensions": dim}
+
+    def _schema(self, dim: int, header: Dict[str, Any]) -> pa.Schema:
+        return pa.schema([
+            ("id", pa.string()),
+            ("doc_id", pa.string()),
+            ("text", pa.large_string()),
+            ("metadata", pa.string()),
+            ("embedding", pa.list_(pa.float32(), dim)),
+        ], metadata={"snapshot": json.dumps(header)})
+
+    def _header(self, timestamp: str, documents: int, dim: int) -> Dict[str, Any]:
+        # Only themes from analyses of this session alone; multi-session runs reference other sessions
+        themes = self.index.export_run(timestamp) if self.index is not None else {"themes": [], "memberships": []}
+        if themes["themes"]:
+            stored = self.theme_collection.get(ids=[theme["theme_id"] for theme in themes["themes"]],
+                                               include=["metadatas"])
+            evidence = {theme_id: (meta or {}).get("evidence", "")
+                        for theme_id, meta in zip(stored["ids"], stored["metadatas"])}
+            for theme in themes["themes"]:
+                theme["evidence"] = evidence.get(theme["theme_id"], "")
+        return {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "session": timestamp,
+            "exported_at": datetime.utcnow().isoformat(),
+            "documents": documents,
+            "embedding": {"backend": self.embedder.backend, "model": self.embedder.model_name,
+                          "quantized": self.embedder.quantize, "dimensions": dim},
+            "themes": themes["themes"],
+            "memberships": themes["memberships"],
+        }
+
+    # --- Import ---
+
+    def import_session(self, path: str, timestamp: Optional[str] = None, replace: bool = False) -> Dict[str, Any]:
+        """Load a snapshot into `timestamp` (default: the session it was exported from)."""
+        with pa.memory_map(path, "r") as source:
+            try:
+                reader = pa.ipc.open_file(source)
+            except pa.ArrowInvalid as e:
+                raise SnapshotError(f"Not an Arrow snapshot file: {e}")
+            header = self._read_header(reader.schema)
+            source_session = header["session"]
+            target = timestamp or source_session
+
+            def rename(key: str) -> str:
+                prefix = f"{source_session}_"
+                return f"{target}_{key[len(prefix):]}" if key.startswith(prefix) else key
+
+            collection = self.documents.collection
+            dim = header["embedding"]["dimensions"]
+            # Checked before anything is replaced, so a refused import leaves the target session intact
+            self._check_dimensions(collection, dim)
+            replaced = bool(collection.get(where={"timestamp": target}, include=[], limit=1)["ids"])
+            if replaced:
+                if not replace:
+                    raise SessionExists(f"Session {target} already has documents")
+                removed = self.documents.delete_session(target)
+                logger.info(f"Replacing session {target}: removed {removed} documents")
+
+            imported = 0
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                with span("snapshot.batch", documents=batch.num_rows):
+                    full_doc_ids = [rename(key) for key in batch.column("id").to_pylist()]
+                    metadatas = [json.loads(raw) for raw in batch.column("metadata").to_pylist()]
+                    for meta in metadatas:
+                        meta["timestamp"] = target
+                        if meta.get("duplicate_of"):
+                            meta["duplicate_of"] = rename(meta["duplicate_of"])
+                    # Zero-copy view of the batch's float32 block when the file is uncompressed
+                    embeddings = batch.column("embedding").flatten().to_numpy(zero_copy_only=False)
+                    self.documents.add_stored_documents(
+                        full_doc_ids,
+                        batch.column("text").to_pylist(),
+                        embeddings.reshape(batch.num_rows, dim).tolist(),
+                        metadatas,
+                        target
+                    )
+                imported += batch.num_rows
+
+        if replaced:
+            # The old analysis run points at the replaced documents, whether or not the snapshot has themes
+            self._clear_themes(target)
+        themes = self._import_themes(header, target, rename)
+        logger.info(f"Imported session {target} from {source_session}: {imported} documents, {themes} themes")
+        return {"session": target, "source_session": source_session, "documents": imported, "themes": themes}
+
+    def _read_header(self, schema: pa.Schema) -> Dict[str, Any]:
+        raw = (schema.metadata or {}).get(b"snapshot")
+        if raw is None:
+            raise SnapshotError("File has no session snapshot header")
+        header = json.loads(raw)
+        if header.get("format") != SNAPSHOT_FORMAT or header.get("version") != SNAPSHOT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot format {header.get('format')} v{header.get('version')}")
+        embedding = header["embedding"]
+        # Vectors from another model (or its int8 variant) live in a different space; mixing them
+        # would break vector search. Snapshots that predate the flag were taken unquantized.
+        source = (embedding["backend"], embedding["model"], bool(embedding.get("quantized", False)))
+        server = (self.embedder.backend, self.embedder.model_name, bool(self.embedder.quantize))
+        if source != server:
+            raise SnapshotError(
+                f"Snapshot embeddings come from {_describe_embedding(*source)}, "
+                f"but this server uses {_describe_embedding(*server)}"
+            )
+        return header
+
+    def _check_dimensions(self, collection, dim: int) -> None:
+        sample = collection.get(limit=1, include=["embeddings"])
+        if sample["ids"] and len(sample["embeddings"][0]) != dim:
+            raise SnapshotError(f"Snapshot embeddings have {dim} dimensions, "
+                                f"but the vector store holds {len(sample['embeddings'][0])}-dimensional vectors")
+
+    def _clear_themes(self, target: str) -> None:
+        """Drop the themes of the target session's own analysis run."""
+        if self.index is None:
+            return
+        old = [theme["theme_id"] for theme in self.index.export_run(target)["themes"]]
+        self.index.import_run(target, [], [])
+        if old:
+            with VECTOR_STORE_SECONDS.time(operation="delete"), span("storage.delete"):
+                self.theme_collection.delete(ids=old)
+
+    def _import_themes(self, header: Dict[str, Any], target: str, rename) -> int:
+        themes: List[Dict[str, Any]] = [dict(theme, theme_id=rename(theme["theme_id"])) for theme in header["themes"]]
+        if not themes:
+            return 0
+        memberships = [[rename(theme_id), rename(document_id), target]
+                       for theme_id, document_id, _ in header["memberships"]]
+        if self.index is not None:
+            self.index.import_run(target, themes, memberships)
+        with VECTOR_STORE_SECONDS.time(operation="upsert"), span("storage.upsert"):
+            self.theme_collection.upsert(
+                ids=[theme["theme_id"] for theme in themes],
+                documents=[theme.get("description", "") for theme in themes],
+                metadatas=[{"name": theme.get("name", ""), "timestamp": target, "evidence": theme.get("evidence", "")}
+                           for theme in themes]
+            )
+        return len(themes)
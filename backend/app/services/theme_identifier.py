@@ -1,83 +1,133 @@
-from typing import List, Dict, Any
-import openai
-import google.generativeai as genai
+from typing import List, Dict, Any, Optional
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from .llm_router import llm_router
+from .llm_scheduler import BATCH
+from .theme_index import theme_index
+from .dedup import group_duplicates
+from .digests import digest_store, format_digest
 from ..core.config import settings
-from groq import Groq
+from ..core.deadline import Deadline
+from ..core.profiling import span
+from ..core.metrics import VECTOR_STORE_SECONDS
+import asyncio
+import logging
 import re
 
+logger = logging.getLogger(__name__)
+
+THEME_SYSTEM_PROMPT = (
+    "You are a theme identification expert. Analyze documents and identify common themes with supporting evidence."
+)
+
 class ThemeIdentifier:
-    def __init__(self, doc_collection, theme_collection):
+    def __init__(self, doc_collection, theme_collection, llm=llm_router, index=theme_index,
+                 collapse_duplicates: bool = settings.DEDUP_COLLAPSE, digests=digest_store):
         self.doc_collection = doc_collection
         self.theme_collection = theme_collection
-
-        # Initialize OpenAI client
-        if settings.OPENAI_API_KEY:
-            openai.api_key = settings.OPENAI_API_KEY
-        
-        # Initialize Google AI client
-        if settings.GOOGLE_API_KEY:
-            genai.configure(api_key=settings.GOOGLE_API_KEY)
-
-        # Initialize GROQ AI client
-        if settings.GROQ_API_KEY:
-            self.client = Groq(api_key=settings.GROQ_API_KEY)
+        self.llm = llm
+        self.index = index
+        self.collapse_duplicates = collapse_duplicates
+        self.digests = digests
 
     def get_documents_by_timestamp(self, timestamp: str) -> Dict[str, list]:
+        return self.get_documents_by_timestamps([timestamp])
+
+    def get_documents_by_timestamps(self, timestamps: List[str]) -> Dict[str, list]:
+        """Documents of all the given sessions in one filtered read, as parallel lists ordered by session."""
+        timestamps = list(dict.fromkeys(timestamps))
+        if not timestamps:
+            raise HTTPException(status_code=400, detail="At least one timestamp is required")
         try:
-            results = self.doc_collection.get(
-                where={"timestamp": timestamp},
-                include=["documents", "metadatas"]
-            )
+            where = {"timestamp": timestamps[0]} if len(timestamps) == 1 else {"timestamp": {"$in": timestamps}}
+            with VECTOR_STORE_SECONDS.time(operation="get"), span("storage.get", sessions=len(timestamps)):
+                results = self.doc_collection.get(
+                    where=where,
+                    include=["documents", "metadatas"]
+                )
 
             if not results["documents"]:
                 raise HTTPException(status_code=404, detail="No documents found for the given timestamp")
 
-            document_texts = results["documents"]
-            document_ids = [
-                meta.get("document_id", f"DOC{idx+1:03}")
-                for idx, meta in enumerate(results["metadatas"])
-            ]
+            session_order = {timestamp: i for i, timestamp in enumerate(timestamps)}
+            rows = sorted(
+                zip(results["ids"], results["documents"], results["metadatas"]),
+                key=lambda row: session_order.get(row[2].get("timestamp"), len(timestamps))
+            )
 
             return {
-                "document_texts": document_texts,
-                "document_ids": document_ids
+                "document_texts": [text for _, text, _ in rows],
+                "document_ids": [meta.get("doc_id", f"DOC{idx+1:03}") for idx, (_, _, meta) in enumerate(rows)],
+                "document_keys": [key for key, _, _ in rows],
+                "document_sessions": [meta.get("timestamp") for _, _, meta in rows],
+                "duplicate_of": [meta.get("duplicate_of") for _, _, meta in rows]
             }
 
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error fetching documents: {str(e)}")
 
-
-    async def identify_themes(self, timestamp: str) -> Dict[str, Any]:
+    async def identify_themes(self, timestamp: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """Identify common themes across multiple documents using LLM."""
         
-        documents_raw = self.get_documents_by_timestamp(timestamp)
+        documents_raw = await run_in_threadpool(self.get_documents_by_timestamp, timestamp)
+        if self.collapse_duplicates:
+            documents_raw = self.collapse_duplicate_documents(documents_raw)
 
         documents = [
-            {"text": text, "id": doc_id}
-            for text, doc_id in zip(documents_raw["document_texts"], documents_raw["document_ids"])
+            {"text": text, "id": doc_id, "key": key, "session": timestamp}
+            for text, doc_id, key in zip(documents_raw["document_texts"], documents_raw["document_ids"],
+                                         documents_raw["document_keys"])
         ]
 
         # Prepare the prompt
-        context = self._prepare_context(documents)
+        with span("prompt.build", documents=len(documents)):
+            self._attach_digests(documents)
+            context = self._prepare_context(documents)
         
         try:
-            if settings.OPENAI_API_KEY:
-                return await self._identify_themes_openai(context, timestamp)
-            elif settings.GOOGLE_API_KEY:
-                return await self._identify_themes_gemini(context, timestamp)
-            elif settings.GROQ_API_KEY:
-                return await self._identify_themes_groq(context, timestamp)
-            else:
-                raise ValueError("No LLM API key configured")
+            return await self._identify_themes(context, timestamp, documents, deadline)
         except Exception as e:
             raise Exception(f"Error identifying themes: {str(e)}")
     
+    def collapse_duplicate_documents(self, documents: Dict[str, list]) -> Dict[str, list]:
+        """Drop all but one representative of each near-duplicate cluster from parallel document lists.
+
+        `documents` is shaped like `get_documents_by_timestamp` output (possibly merged across sessions).
+        """
+        groups = group_duplicates(documents["document_keys"], documents["duplicate_of"])
+        keep = [i for i, key in enumerate(documents["document_keys"]) if key in groups]
+        if len(keep) < len(documents["document_keys"]):
+            logger.info(f"Collapsed {len(documents['document_keys'])} documents into {len(keep)} "
+                        f"near-duplicate clusters for theme analysis")
+        return {name: [values[i] for i in keep] for name, values in documents.items()}
+
+    def _attach_digests(self, documents: List[Dict[str, Any]]) -> None:
+        """Attach precomputed digests to documents that have one (those with a stored `key`)."""
+        keys = [doc["key"] for doc in documents if doc.get("key")]
+        if self.digests is None or not keys:
+            return
+        try:
+            found = self.digests.get_many(keys)
+        except Exception as e:
+            logger.warning(f"Digests unavailable, analyzing raw excerpts: {str(e)}")
+            return
+        for doc in documents:
+            if doc.get("key") in found:
+                doc["digest"] = found[doc["key"]]
+        logger.debug("Using digests for %d of %d documents", len(found), len(documents))
+
     def _prepare_context(self, documents: List[Dict[str, Any]]) -> str:
         """Prepare context from documents for LLM processing."""
         context = "Analyze the following document excerpts and identify common themes:\n\n"
         
         for i, doc in enumerate(documents, 1):
-            context += f"Document {i}:\n{doc['text'][:1000]}...\n\n"
+            # A digest is a fixed-size view of the whole document; fall back to its opening text
+            if doc.get("digest"):
+                context += f"Document {i}:\n{format_digest(doc['digest'])}\n\n"
+            else:
+                context += f"Document {i}:\n{doc['text'][:1000]}...\n\n"
         
         context += (
             "Identify and explain the main themes present across these documents. For each theme:\n"
@@ -100,49 +150,45 @@ class ThemeIdentifier:
         
         return context
         
-    async def _identify_themes_openai(self, context: str, timestamp: str) -> Dict[str, Any]:
-        """Use OpenAI to identify themes."""
-        response = await openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a theme identification expert. Analyze documents and identify common themes with supporting evidence."},
-                {"role": "user", "content": context}
-            ],
-            temperature=0.3,
-            max_tokens=1000
-        )
-        
-        return {
-            "themes": self._parse_themes(response.choices[0].message.content, timestamp),
-            "model": "gpt-4"
-        }
+    async def _identify_themes(self, context: str, timestamp: str,
+                               documents: Optional[List[Dict[str, Any]]] = None,
+                               deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Identify themes with whichever provider the router picks.
+
+        The analysis is one LLM call, so running out of `deadline` yields no themes and a truncated run.
+        """
+        if deadline is not None and deadline.expired:
+            deadline.truncate()
+            return {"themes": [], "model": None}
+        with span("ThemeIdentifier.identify"):
+            # Analyses are bulk work: they queue behind interactive queries and leave them quota
+            try:
+                response, model = await asyncio.wait_for(
+                    self.llm.complete(THEME_SYSTEM_PROMPT, context, temperature=0.3, max_tokens=1000,
+                                      priority=BATCH),
+                    deadline.remaining() if deadline else None
+                )
+            except asyncio.TimeoutError:
+                # A provider timeout re-raised by the router is a failure, not the request's deadline
+                if deadline is None or not deadline.expired:
+                    raise
+                deadline.truncate()
+                logger.info(f"Deadline reached before themes were identified for {timestamp}")
+                return {"themes": [], "model": None}
+        with span("parse.themes"):
+            themes = self._parse_themes(response, timestamp)
+
+        if self.index is not None and documents:
+            try:
+                # Embedding the themes is CPU-bound; keep it off the event loop
+                with span("index.themes", themes=len(themes)):
+                    await run_in_threadpool(self.index.record_run, timestamp, themes, documents)
+            except Exception as e:
+                logger.error(f"Could not update the theme index for {timestamp}: {str(e)}")
 
-    async def _identify_themes_groq(self, context: str, timestamp: str) -> Dict[str, Any]:
-
-        """Use Groq-llama-3.3-70b-versatile to identify themes."""
-        response = self.client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are a theme identification expert. Analyze documents and identify common themes with supporting evidence."},
-                {"role": "user", "content": context}
-            
-            ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.3,
-            )
-        
-        return {
-            "themes": self._parse_themes(response.choices[0].message.content, timestamp),
-            "model": "llama-3.3-70b-versatile"
-        }
-    
-    async def _identify_themes_gemini(self, context: str, timestamp: str) -> Dict[str, Any]:
-        """Use Google's Gemini to identify themes."""
-        model = genai.GenerativeModel('gemini-pro')
-        response = await model.generate_content(context)
-        
         return {
-            "themes": self._parse_themes(response.text, timestamp),
-            "model": "gemini-pro"
+            "themes": themes,
+            "model": model
         }
     
     def _parse_themes(self, response: str, timestamp: str) -> List[Dict[str, Any]]:
@@ -162,15 +208,16 @@ class ThemeIdentifier:
                     themes.append(current_theme)
 
                     # Store theme in ChromaDB
-                    self.theme_collection.add(
-                        ids=[theme_id],
-                        documents=[current_theme.get("description", "")],
-                        metadatas=[{
-                            "name": current_theme.get("name", ""),
-                            "timestamp": timestamp,
-                            "evidence": "\n".join(current_theme.get("evidence", []))  # Convert list to string
-                        }]
-                    )
+                    with VECTOR_STORE_SECONDS.time(operation="upsert"), span("storage.upsert"):
+                        self.theme_collection.upsert(
+                            ids=[theme_id],
+                            documents=[current_theme.get("description", "")],
+                            metadatas=[{
+                                "name": current_theme.get("name", ""),
+                                "timestamp": timestamp,
+                                "evidence": "\n".join(current_theme.get("evidence", []))  # Convert list to string
+                            }]
+                        )
                     theme_counter += 1
 
                 current_theme = {'name': line.split(':', 1)[1].strip()}
@@ -191,17 +238,18 @@ class ThemeIdentifier:
             current_theme['documents'] = self._extract_documents_from_evidence(current_theme.get('evidence', []))
             themes.append(current_theme)
 
-            self.theme_collection.add(
-                ids=[theme_id],
-                documents=[current_theme.get("description", "")],
-                metadatas=[{
-                    "name": current_theme.get("name", ""),
-                    "timestamp": timestamp,
-                    "evidence": "\n".join(current_theme.get("evidence", []))  # Convert list to string
-                }]
-            )
+            with VECTOR_STORE_SECONDS.time(operation="upsert"), span("storage.upsert"):
+                self.theme_collection.upsert(
+                    ids=[theme_id],
+                    documents=[current_theme.get("description", "")],
+                    metadatas=[{
+                        "name": current_theme.get("name", ""),
+                        "timestamp": timestamp,
+                        "evidence": "\n".join(current_theme.get("evidence", []))  # Convert list to string
+                    }]
+                )
 
-        print("Themes_processor:", themes)
+        logger.debug("Parsed %d themes for %s", len(themes), timestamp)
         return themes
 
     def _extract_documents_from_evidence(self, evidence_list):
@@ -213,21 +261,26 @@ class ThemeIdentifier:
                 doc_ids.add(match.group(1).strip())
         return list(doc_ids)
 
-    async def identify_themes_for_documents(self, document_texts: list, document_ids: list, timestamps: list) -> dict:
-        """Identify themes across a provided set of documents (multi-timestamp support)."""
+    async def identify_themes_for_documents(self, document_texts: list, document_ids: list, timestamps: list,
+                                            document_keys: Optional[list] = None,
+                                            document_sessions: Optional[list] = None,
+                                            deadline: Optional[Deadline] = None) -> dict:
+        """Identify themes across a provided set of documents (multi-timestamp support).
+
+        With `document_keys` (stored IDs) and `document_sessions`, the run is also recorded in the theme index.
+        """
         documents = [
             {"text": text, "id": doc_id}
             for text, doc_id in zip(document_texts, document_ids)
         ]
-        context = self._prepare_context(documents)
+        if document_keys is not None:
+            for doc, key, session in zip(documents, document_keys, document_sessions or [None] * len(documents)):
+                doc.update(key=key, session=session)
+        with span("prompt.build", documents=len(documents)):
+            self._attach_digests(documents)
+            context = self._prepare_context(documents)
         try:
-            if settings.OPENAI_API_KEY:
-                return await self._identify_themes_openai(context, ','.join(timestamps))
-            elif settings.GOOGLE_API_KEY:
-                return await self._identify_themes_gemini(context, ','.join(timestamps))
-            elif settings.GROQ_API_KEY:
-                return await self._identify_themes_groq(context, ','.join(timestamps))
-            else:
-                raise ValueError("No LLM API key configured")
+            return await self._identify_themes(context, ','.join(timestamps),
+                                               documents if document_keys is not None else None, deadline)
         except Exception as e:
             raise Exception(f"Error identifying themes: {str(e)}")
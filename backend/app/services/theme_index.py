@@ -0,0 +1,248 @@
+from typing import List, Dict, Any, Optional
+from contextlib import contextmanager
+import logging
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from scipy import sparse
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ThemeIndex:
+    """Document x theme membership matrix and theme embeddings, persisted across runs.
+
+    Every theme analysis run replaces its own themes in a SQLite file shared by all workers.
+    Each worker keeps an in-memory copy - a sparse membership matrix (documents x themes) and a
+    normalized float32 matrix of theme embeddings - and reloads it whenever the file has been
+    written since, so membership, co-occurrence and similarity queries never touch the LLM.
+    """
+
+    def __init__(self, path: str, embedder=None):
+        self.path = path
+        self.embedder = embedder
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._transaction() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS themes ("
+                "theme_id TEXT PRIMARY KEY, run TEXT NOT NULL, name TEXT, description TEXT, embedding BLOB)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS memberships ("
+                "theme_id TEXT NOT NULL, document_id TEXT NOT NULL, session TEXT, "
+                "PRIMARY KEY (theme_id, document_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS memberships_document ON memberships (document_id)")
+        self._data_version = None
+        self._current: Optional["_Snapshot"] = None
+        self._snapshot()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            with self._conn:  # commits on success, rolls back on error
+                yield self._conn
+
+    def _embedder(self):
+        if self.embedder is None:
+            from .embeddings import embedding_service
+            self.embedder = embedding_service
+        return self.embedder
+
+    # --- Loading ---
+
+    def _snapshot(self, force: bool = False) -> "_Snapshot":
+        """Current matrices, rebuilt first if any connection has written the file since the last load."""
+        with self._lock:
+            # data_version only moves for commits made through other connections
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if force or version != self._data_version or self._current is None:
+                themes = self._conn.execute(
+                    "SELECT theme_id, run, name, description, embedding FROM themes ORDER BY theme_id"
+                ).fetchall()
+                memberships = self._conn.execute("SELECT theme_id, document_id, session FROM memberships").fetchall()
+                self._current = _Snapshot(themes, memberships)
+                self._data_version = version
+            return self._current
+
+    # --- Writing ---
+
+    def record_run(self, run: str, themes: List[Dict[str, Any]], documents: List[Dict[str, str]]) -> None:
+        """Replace the themes of one analysis run.
+
+        `themes` are parsed themes (name, description, theme_id, documents); `documents` are the
+        run's inputs in prompt order, each with the stored document `key` and its `session`, so
+        "Document 3" in the evidence resolves to the third input.
+        """
+        by_position = {f"document {i}": doc for i, doc in enumerate(documents, 1)}
+        by_short_id = {doc["id"].lower(): doc for doc in documents if doc.get("id")}
+
+        texts = [f"{theme.get('name', '')}. {theme.get('description', '')}" for theme in themes]
+        vectors = self._embedder().embed(texts) if texts else []
+
+        theme_rows, membership_rows = [], []
+        for theme, vector in zip(themes, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector = vector / norm
+            theme_rows.append((theme["theme_id"], run, theme.get("name", ""), theme.get("description", ""),
+                               vector.tobytes()))
+            for reference in theme.get("documents", []):
+                doc = by_position.get(reference.lower()) or by_short_id.get(reference.lower())
+                if doc is not None:
+                    membership_rows.append((theme["theme_id"], doc["key"], doc.get("session")))
+
+        self._replace_run(run, theme_rows, membership_rows)
+        logger.debug("Indexed %d themes and %d memberships for run %s", len(theme_rows), len(membership_rows), run)
+
+    def export_run(self, run: str) -> Dict[str, list]:
+        """Themes (with their embeddings) and memberships of one run, for session snapshots."""
+        with self._lock:
+            themes = self._conn.execute(
+                "SELECT theme_id, name, description, embedding FROM themes WHERE run = ? ORDER BY theme_id", (run,)
+            ).fetchall()
+            memberships = self._conn.execute(
+                "SELECT m.theme_id, m.document_id, m.session FROM memberships m "
+                "JOIN themes t ON t.theme_id = m.theme_id WHERE t.run = ?", (run,)
+            ).fetchall()
+        return {
+            "themes": [
+                {"theme_id": row[0], "name": row[1], "description": row[2],
+                 "embedding": np.frombuffer(row[3], dtype=np.float32).tolist() if row[3] else None}
+                for row in themes
+            ],
+            "memberships": [list(row) for row in memberships],
+        }
+
+    def import_run(self, run: str, themes: List[Dict[str, Any]], memberships: List[list]) -> None:
+        """Replace one run with exported rows, reusing their embeddings."""
+        theme_rows = [
+            (theme["theme_id"], run, theme.get("name", ""), theme.get("description", ""),
+             np.asarray(theme["embedding"], dtype=np.float32).tobytes() if theme.get("embedding") else None)
+            for theme in themes
+        ]
+        self._replace_run(run, theme_rows, [tuple(row) for row in memberships])
+
+    def _replace_run(self, run: str, theme_rows: List[tuple], membership_rows: List[tuple]) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM memberships WHERE theme_id IN (SELECT theme_id FROM themes WHERE run = ?)", (run,))
+            conn.execute("DELETE FROM themes WHERE run = ?", (run,))
+            conn.executemany("INSERT OR REPLACE INTO themes VALUES (?, ?, ?, ?, ?)", theme_rows)
+            conn.executemany("INSERT OR IGNORE INTO memberships VALUES (?, ?, ?)", membership_rows)
+        self._snapshot(force=True)
+
+    def remove_document(self, document_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM memberships WHERE document_id = ?", (document_id,))
+        self._snapshot(force=True)
+
+    # --- Queries ---
+
+    def get_theme(self, theme_id: str) -> Optional[Dict[str, Any]]:
+        return self._snapshot().themes.get(theme_id)
+
+    def documents_for_theme(self, theme_id: str) -> Optional[List[Dict[str, str]]]:
+        snap = self._snapshot()
+        column = snap.theme_rows.get(theme_id)
+        if column is None:
+            return None
+        rows = snap.by_theme.indices[snap.by_theme.indptr[column]:snap.by_theme.indptr[column + 1]]
+        return [{"document_id": snap.document_ids[row], "session": snap.document_sessions[row]}
+                for row in sorted(rows)]
+
+    def themes_for_document(self, document_id: str) -> List[Dict[str, Any]]:
+        snap = self._snapshot()
+        row = snap.document_rows.get(document_id)
+        if row is None:
+            return []
+        columns = snap.by_document.indices[snap.by_document.indptr[row]:snap.by_document.indptr[row + 1]]
+        return [snap.themes[snap.theme_ids[column]] for column in sorted(columns)]
+
+    def cooccurring_themes(self, theme_id: str, n: int = 10) -> Optional[List[Dict[str, Any]]]:
+        """Themes sharing documents with `theme_id`, ranked by Jaccard overlap of their document sets."""
+        snap = self._snapshot()
+        column = snap.theme_rows.get(theme_id)
+        if column is None:
+            return None
+        # One sparse product gives the shared-document count against every theme
+        shared = np.asarray((snap.by_theme.T @ snap.by_theme[:, column]).todense()).ravel()
+        shared[column] = 0
+        candidates = np.nonzero(shared)[0]
+        jaccard = shared[candidates] / (snap.sizes[column] + snap.sizes[candidates] - shared[candidates])
+        order = np.argsort(-jaccard, kind="stable")[:n]
+        return [
+            dict(snap.themes[snap.theme_ids[candidates[i]]], shared_documents=int(shared[candidates[i]]),
+                 jaccard=float(jaccard[i]))
+            for i in order
+        ]
+
+    def similar_themes(self, theme_id: str, n: int = 5, other_runs_only: bool = True) -> Optional[List[Dict[str, Any]]]:
+        """Nearest themes by embedding cosine similarity, by default only from other analysis runs."""
+        snap = self._snapshot()
+        row = snap.theme_rows.get(theme_id)
+        if row is None:
+            return None
+        similarities = snap.embeddings @ snap.embeddings[row]
+        similarities[row] = -np.inf
+        if other_runs_only:
+            similarities[snap.runs == snap.runs[row]] = -np.inf
+        order = [i for i in np.argsort(-similarities, kind="stable")[:n] if np.isfinite(similarities[i])]
+        return [dict(snap.themes[snap.theme_ids[i]], similarity=float(similarities[i])) for i in order]
+
+    def stats(self) -> Dict[str, int]:
+        snap = self._snapshot()
+        return {"themes": len(snap.theme_ids), "documents": len(snap.document_ids),
+                "memberships": int(snap.by_document.nnz)}
+
+
+class _Snapshot:
+    """Immutable in-memory view of the index, swapped in whole so readers never see a partial load."""
+
+    def __init__(self, themes: List[tuple], memberships: List[tuple]):
+        self.theme_ids = [row[0] for row in themes]
+        self.theme_rows = {theme_id: i for i, theme_id in enumerate(self.theme_ids)}
+        self.themes = {
+            row[0]: {"theme_id": row[0], "sessions": row[1].split(","), "name": row[2], "description": row[3]}
+            for row in themes
+        }
+        self.runs = np.array([row[1] for row in themes], dtype=object)
+
+        dims = {len(row[4]) // 4 for row in themes if row[4]}
+        dim = dims.pop() if len(dims) == 1 else 0
+        self.embeddings = np.zeros((len(themes), dim), dtype=np.float32)
+        for i, row in enumerate(themes):
+            if dim and row[4]:
+                self.embeddings[i] = np.frombuffer(row[4], dtype=np.float32)
+
+        self.document_ids: List[str] = []
+        self.document_sessions: List[Optional[str]] = []
+        self.document_rows: Dict[str, int] = {}
+        rows, cols = [], []
+        for theme_id, document_id, session in memberships:
+            if theme_id not in self.theme_rows:
+                continue
+            if document_id not in self.document_rows:
+                self.document_rows[document_id] = len(self.document_ids)
+                self.document_ids.append(document_id)
+                self.document_sessions.append(session)
+            rows.append(self.document_rows[document_id])
+            cols.append(self.theme_rows[theme_id])
+
+        shape = (len(self.document_ids), len(self.theme_ids))
+        membership = sparse.coo_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=shape)
+        # Row slices answer "themes of a document", column slices "documents of a theme"
+        self.by_document = membership.tocsr()
+        self.by_theme = membership.tocsc()
+        self.sizes = np.asarray(self.by_theme.sum(axis=0)).ravel()
+
+
+theme_index = ThemeIndex(settings.THEME_INDEX_PATH)
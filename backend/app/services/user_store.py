@@ -0,0 +1,59 @@
+from typing import Dict, Any, Optional
+from contextlib import contextmanager
+import os
+import sqlite3
+
+
+class UserStore:
+    """User accounts in a SQLite file shared by every worker process on the host.
+
+    Each call opens its own short-lived connection, so the store is safe to use from the
+    threadpool and from several uvicorn workers at once; WAL mode lets readers proceed while
+    a registration is being written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "username TEXT PRIMARY KEY, hashed_password TEXT NOT NULL, "
+                "email TEXT, disabled INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:  # commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT username, hashed_password, email, disabled FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"username": row[0], "hashed_password": row[1], "email": row[2], "disabled": bool(row[3])}
+
+    def exists(self, username: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone() is not None
+
+    def create(self, username: str, hashed_password: str, email: Optional[str] = None) -> bool:
+        """Insert a user; returns False if the username is already taken (by any worker)."""
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO users (username, hashed_password, email, disabled) VALUES (?, ?, ?, 0)",
+                    (username, hashed_password, email)
+                )
+            return True
+        except sqlite3.IntegrityError:
+            return False
@@ -0,0 +1,533 @@
+"""Vector storage behind DocumentProcessor, QueryProcessor and ThemeIdentifier.
+
+Services talk to a `VectorStore`: the subset of the Chroma collection API this app uses (add,
+upsert, get, query, delete, count) with the same arguments and result shapes, so the backend is
+a deployment choice (`VECTOR_STORE_BACKEND`):
+
+- `chroma`: a Chroma persistent collection (`ChromaStore`).
+- `numpy`: `LocalVectorStore` with exact brute-force search over a memory-mapped float32 file.
+- `hnsw`: `LocalVectorStore` with an approximate HNSW graph (hnswlib) over the same file.
+
+The local backends keep records (IDs, text, metadata) in a SQLite file and vectors in a flat
+float32 file next to it, both shared by all workers. Every worker maps the vector file and, once
+another process has written the database, reads only the rows appended and tombstoned since its
+last look. Metadata filters are translated to SQL (`where_sql`) and evaluated by SQLite.
+"""
+from typing import List, Dict, Any, Optional, Sequence, Callable, Tuple
+from contextlib import contextmanager
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+VECTOR_STORE_BACKENDS = ("chroma", "numpy", "hnsw")
+
+_SQL_COMPARISONS = {"$eq": "IS", "$ne": "IS NOT", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def where_sql(where: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Translate a Chroma-style metadata filter ({"field": value}, operators, $and/$or) into a SQL
+    condition on `records`, so filtering never decodes metadata in Python.
+
+    `timestamp` is served by the indexed `session` column; other fields by `json_extract`. A missing
+    field compares like None: it never matches $gt/$lt and always matches $ne/$nin.
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_sql(clause) for clause in condition]
+            if not parts:
+                clauses.append("1" if key == "$and" else "0")
+                continue
+            clauses.append("(" + (" AND " if key == "$and" else " OR ").join(clause for clause, _ in parts) + ")")
+            for _, part_params in parts:
+                params.extend(part_params)
+            continue
+        if key == "timestamp":
+            column, column_params = "session", []
+        else:
+            if '"' in key:
+                raise ValueError(f"Unsupported metadata field name: {key}")
+            column, column_params = "json_extract(metadata, ?)", [f'$."{key}"']
+        for op, operand in (condition.items() if isinstance(condition, dict) else [("$eq", condition)]):
+            if op in _SQL_COMPARISONS:
+                clauses.append(f"{column} {_SQL_COMPARISONS[op]} ?")
+                params.extend(column_params + [operand])
+            elif op in ("$in", "$nin"):
+                values = list(operand)
+                placeholders = ",".join("?" * len(values))
+                if op == "$in":
+                    clauses.append(f"{column} IN ({placeholders})" if values else "0")
+                    params.extend(column_params + values if values else [])
+                elif values:
+                    clauses.append(f"({column} IS NULL OR {column} NOT IN ({placeholders}))")
+                    params.extend(column_params + column_params + values)
+                else:
+                    clauses.append("1")
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+    return " AND ".join(clauses) or "1", params
+
+
+class VectorStore:
+    """A collection of records (ID, embedding, metadata, document). Subclasses implement every method."""
+
+    name = "base"
+
+    def add(self, ids: List[str], embeddings=None, metadatas=None, documents=None) -> None:
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], embeddings=None, metadatas=None, documents=None) -> None:
+        raise NotImplementedError
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, include: Sequence[str] = ("metadatas", "documents")) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ("metadatas", "documents", "distances")) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class ChromaStore(VectorStore):
+    name = "chroma"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def add(self, ids, embeddings=None, metadatas=None, documents=None):
+        self.collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None):
+        self.collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def get(self, ids=None, where=None, limit=None, include=("metadatas", "documents")):
+        return self.collection.get(ids=ids, where=where, limit=limit, include=list(include))
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("metadatas", "documents", "distances")):
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where,
+                                     include=list(include))
+
+    def delete(self, ids=None, where=None):
+        self.collection.delete(ids=ids, where=where)
+
+    def count(self):
+        return self.collection.count()
+
+
+class _Rows:
+    """Immutable per-worker view of the row table and vector file."""
+
+    def __init__(self, ids: np.ndarray, alive: np.ndarray, vectors: np.ndarray, norms: np.ndarray):
+        self.ids = ids  # view of an append-only buffer: entries below len(ids) never change
+        self.alive = alive
+        self.vectors = vectors  # (rows, dim) memmap; rows are append-only, so older views stay valid
+        self.norms = norms  # squared L2 norm per row
+
+
+class LocalVectorStore(VectorStore):
+    """In-process vector store: SQLite records plus a memory-mapped float32 vector file.
+
+    Rows are append-only; deleting or replacing a record tombstones its row. Distances are squared
+    L2, like a default Chroma collection. With `index="hnsw"`, unfiltered and broadly filtered
+    queries use an hnswlib graph (`m`, `ef_construction`, `ef_search` trade recall for latency);
+    queries whose filter leaves at most `brute_force_limit` rows are answered exactly.
+    """
+
+    def __init__(self, directory: str, name: str, embedding_function: Optional[Callable] = None,
+                 index: str = "numpy", m: int = 16, ef_construction: int = 200, ef_search: int = 64,
+                 brute_force_limit: int = 2048):
+        if index not in ("numpy", "hnsw"):
+            raise ValueError(f"Unsupported local index: {index}")
+        os.makedirs(directory, exist_ok=True)
+        self.name = index
+        self.collection_name = name
+        self.embedding_function = embedding_function
+        self.index = index
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.brute_force_limit = brute_force_limit
+        self.vector_path = os.path.join(directory, f"{name}.f32")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, f"{name}.db"), timeout=30,
+                                     check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "row INTEGER PRIMARY KEY, id TEXT NOT NULL, session TEXT, document TEXT, metadata TEXT, "
+                "alive INTEGER NOT NULL DEFAULT 1)"
+            )
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS records_live_id ON records (id) WHERE alive = 1")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS records_session ON records (session) WHERE alive = 1")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+            # Rows tombstoned since a worker's last load are read from here instead of rescanning `records`
+            self._conn.execute("CREATE TABLE IF NOT EXISTS tombstones (seq INTEGER PRIMARY KEY AUTOINCREMENT, row INTEGER)")
+        if not os.path.exists(self.vector_path):
+            open(self.vector_path, "ab").close()
+        self._data_version = None
+        self._current: Optional[_Rows] = None
+        self._tombstone_seq = 0
+        self._id_buffer = np.empty(0, dtype=object)
+        self._reload_lock = threading.Lock()
+        self._graph = None
+        self._graph_labels = 0  # rows added to the graph so far
+        self._graph_deleted = set()
+        self._graph_lock = threading.Lock()
+
+    # --- Writing ---
+
+    @contextmanager
+    def _write_transaction(self):
+        with self._lock:
+            # IMMEDIATE takes the database write lock up front, serializing writers across workers
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _dimension(self, conn, dim: int) -> int:
+        row = conn.execute("SELECT value FROM settings WHERE key = 'dimension'").fetchone()
+        if row is None:
+            conn.execute("INSERT INTO settings (key, value) VALUES ('dimension', ?)", (str(dim),))
+            return dim
+        if int(row[0]) != dim:
+            raise ValueError(f"Collection {self.collection_name} stores {row[0]}-dimensional vectors, got {dim}")
+        return dim
+
+    def _write(self, ids, embeddings, metadatas, documents, replace: bool) -> None:
+        ids = list(ids)
+        if not ids:
+            return
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate IDs in one write")
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        if embeddings is None:
+            if self.embedding_function is None:
+                raise ValueError("Embeddings are required when the store has no embedding function")
+            embeddings = self.embedding_function([document or "" for document in documents])
+        vectors = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+
+        with self._write_transaction() as conn:
+            dim = self._dimension(conn, vectors.shape[1])
+            placeholders = ",".join("?" * len(ids))
+            existing = {row_id for (row_id,) in conn.execute(
+                f"SELECT id FROM records WHERE alive = 1 AND id IN ({placeholders})", ids)}
+            if existing and replace:
+                self._tombstone(conn, ids)
+            elif existing:
+                # Chroma ignores adds of existing IDs; so do we
+                logger.warning(f"Skipping {len(existing)} existing IDs in {self.collection_name}")
+                keep = [i for i, row_id in enumerate(ids) if row_id not in existing]
+                ids, vectors = [ids[i] for i in keep], vectors[keep]
+                metadatas, documents = [metadatas[i] for i in keep], [documents[i] for i in keep]
+                if not ids:
+                    return
+
+            start = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM records").fetchone()[0]
+            # Vectors land before the rows that reference them commit, so readers never see a row
+            # without its vector; a rolled-back write leaves a tail the next writer overwrites
+            with open(self.vector_path, "r+b") as f:
+                f.seek(start * dim * 4)
+                f.write(vectors.tobytes())
+            conn.executemany(
+                "INSERT INTO records (row, id, session, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [(start + i, row_id, (meta or {}).get("timestamp"), document, json.dumps(meta) if meta else None)
+                 for i, (row_id, meta, document) in enumerate(zip(ids, metadatas, documents))]
+            )
+        self._rows(force=True)
+
+    def add(self, ids, embeddings=None, metadatas=None, documents=None):
+        self._write(ids, embeddings, metadatas, documents, replace=False)
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None):
+        self._write(ids, embeddings, metadatas, documents, replace=True)
+
+    def delete(self, ids=None, where=None):
+        if ids is None and where is None:
+            return
+        if where is not None:
+            ids = [row_id for row_id in self.get(ids=ids, where=where, include=[])["ids"]]
+        if not ids:
+            return
+        with self._write_transaction() as conn:
+            for start in range(0, len(ids), 500):
+                self._tombstone(conn, ids[start:start + 500])
+        self._rows(force=True)
+
+    def _tombstone(self, conn, ids: List[str]) -> None:
+        placeholders = ",".join("?" * len(ids))
+        conn.execute(f"INSERT INTO tombstones (row) SELECT row FROM records WHERE alive = 1 AND id IN ({placeholders})",
+                     ids)
+        conn.execute(f"UPDATE records SET alive = 0 WHERE alive = 1 AND id IN ({placeholders})", ids)
+
+    # --- Loading ---
+
+    def _rows(self, force: bool = False) -> _Rows:
+        """Current row view, brought up to date first if any connection has written the database since.
+
+        Only rows appended and rows tombstoned since the last load are read, so the cost of a
+        reload follows the size of the change, not of the collection.
+        """
+        with self._reload_lock:
+            with self._lock:
+                # data_version only moves for commits made through other connections
+                version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                if not force and version == self._data_version and self._current is not None:
+                    return self._current
+                previous = self._current
+                loaded = len(previous.ids) if previous is not None else 0
+                # One read transaction, so appended rows and tombstones come from the same snapshot
+                self._conn.execute("BEGIN")
+                try:
+                    appended = self._conn.execute(
+                        "SELECT row, id, alive FROM records WHERE row >= ? ORDER BY row", (loaded,)).fetchall()
+                    tombstoned = self._conn.execute(
+                        "SELECT seq, row FROM tombstones WHERE seq > ? ORDER BY seq", (self._tombstone_seq,)
+                    ).fetchall()
+                    dim_row = self._conn.execute("SELECT value FROM settings WHERE key = 'dimension'").fetchone()
+                finally:
+                    self._conn.execute("COMMIT")
+                self._data_version = version
+
+            count = appended[-1][0] + 1 if appended else loaded
+            if count > len(self._id_buffer):
+                # Grow geometrically; earlier views keep slices of the old buffer
+                buffer = np.empty(max(count, 2 * len(self._id_buffer), 1024), dtype=object)
+                buffer[:loaded] = self._id_buffer[:loaded]
+                self._id_buffer = buffer
+            alive = np.zeros(count, dtype=bool)
+            if previous is not None:
+                alive[:loaded] = previous.alive
+            died = []
+            for row, row_id, is_alive in appended:
+                self._id_buffer[row] = row_id
+                alive[row] = bool(is_alive)
+                if not is_alive:
+                    died.append(row)
+            for _, row in tombstoned:
+                if row < count:
+                    alive[row] = False
+                    died.append(row)
+            if tombstoned:
+                self._tombstone_seq = tombstoned[-1][0]
+
+            dim = int(dim_row[0]) if dim_row else 0
+            if count and dim:
+                vectors = np.memmap(self.vector_path, dtype=np.float32, mode="r", shape=(count, dim))
+            else:
+                vectors = np.zeros((count, dim), dtype=np.float32)
+
+            # Rows never change once written, so only new rows need their norms computed
+            reused = min(len(previous.norms), count) if previous is not None else 0
+            norms = np.empty(count, dtype=np.float32)
+            if reused:
+                norms[:reused] = previous.norms[:reused]
+            for start in range(reused, count, 65536):
+                block = np.asarray(vectors[start:start + 65536])
+                norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+
+            current = _Rows(self._id_buffer[:count], alive, vectors, norms)
+            if self.index == "hnsw":
+                self._update_graph(current, died)
+            with self._lock:
+                self._current = current
+            return current
+
+    def _update_graph(self, rows: _Rows, died: List[int]) -> None:
+        """Add rows appended since the last update and mark `died` (rows newly tombstoned) deleted."""
+        import hnswlib
+
+        with self._graph_lock:
+            count, dim = rows.vectors.shape
+            if not dim:
+                return
+            if self._graph is None:
+                self._graph = hnswlib.Index(space="l2", dim=dim)
+                self._graph.init_index(max_elements=max(1024, count * 2), ef_construction=self.ef_construction,
+                                       M=self.m)
+                self._graph.set_ef(self.ef_search)
+                self._graph_labels = 0
+            if count > self._graph_labels:
+                if count > self._graph.get_max_elements():
+                    self._graph.resize_index(count * 2)
+                labels = np.arange(self._graph_labels, count)
+                self._graph.add_items(np.asarray(rows.vectors[self._graph_labels:count]), labels)
+                self._graph_labels = count
+            for row in died:
+                if row not in self._graph_deleted:
+                    self._graph.mark_deleted(row)
+                    self._graph_deleted.add(row)
+
+    def set_ef_search(self, ef: int) -> None:
+        """Change the HNSW search breadth at runtime (recall/latency trade-off)."""
+        self.ef_search = ef
+        with self._graph_lock:
+            if self._graph is not None:
+                self._graph.set_ef(ef)
+
+    # --- Reading ---
+
+    def _records(self, rows: List[int], include: Sequence[str]) -> Dict[int, tuple]:
+        """(document, metadata) per row, read only when the caller asked for them."""
+        if not rows or not ({"documents", "metadatas"} & set(include)):
+            return {}
+        records = {}
+        with self._lock:
+            for start in range(0, len(rows), 500):
+                chunk = rows[start:start + 500]
+                for row, document, metadata in self._conn.execute(
+                        f"SELECT row, document, metadata FROM records WHERE row IN ({','.join('?' * len(chunk))})",
+                        chunk):
+                    records[row] = (document, json.loads(metadata) if metadata else None)
+        return records
+
+    def _eligible(self, rows: _Rows, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Rows of this view that are alive and pass `where`, as a boolean mask."""
+        mask = rows.alive.copy()
+        if not where:
+            return mask
+        clause, params = where_sql(where)
+        with self._lock:
+            selected = [row for (row,) in self._conn.execute(
+                f"SELECT row FROM records WHERE alive = 1 AND row < ? AND {clause}", [len(rows.ids)] + params)]
+        passing = np.zeros(len(mask), dtype=bool)
+        passing[np.asarray(selected, dtype=np.int64)] = True
+        return mask & passing
+
+    def _result_fields(self, rows: _Rows, selected: List[int], include: Sequence[str]) -> Dict[str, Any]:
+        records = self._records(selected, include)
+        return {
+            "ids": [rows.ids[row] for row in selected],
+            "documents": [records[row][0] for row in selected] if "documents" in include else None,
+            "metadatas": [records[row][1] for row in selected] if "metadatas" in include else None,
+            "embeddings": ([np.asarray(rows.vectors[row]).tolist() for row in selected]
+                           if "embeddings" in include else None),
+        }
+
+    def get(self, ids=None, where=None, limit=None, include=("metadatas", "documents")):
+        rows = self._rows()
+        mask = self._eligible(rows, where)
+        if ids is not None:
+            # Looked up through the unique index on live IDs rather than scanning the view
+            positions = {}
+            with self._lock:
+                for start in range(0, len(ids), 500):
+                    chunk = list(ids[start:start + 500])
+                    positions.update(self._conn.execute(
+                        f"SELECT id, row FROM records WHERE alive = 1 AND row < ? "
+                        f"AND id IN ({','.join('?' * len(chunk))})", [len(rows.ids)] + chunk))
+            selected = [positions[row_id] for row_id in ids if row_id in positions and mask[positions[row_id]]]
+        else:
+            selected = np.flatnonzero(mask).tolist()
+        if limit is not None:
+            selected = selected[:limit]
+        return self._result_fields(rows, selected, include)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("metadatas", "documents", "distances")):
+        rows = self._rows()
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries.reshape(len(queries), -1)
+        mask = self._eligible(rows, where)
+        candidates = np.flatnonzero(mask)
+        k = min(n_results, len(candidates))
+
+        results = {"ids": [], "documents": [], "metadatas": [], "embeddings": [], "distances": []}
+        for query in queries:
+            if k == 0:
+                selected, distances = [], []
+            elif self.index == "hnsw" and len(candidates) > self.brute_force_limit:
+                try:
+                    selected, distances = self._graph_search(query, k, mask)
+                except RuntimeError:
+                    # The graph found fewer than k rows passing the filter; answer exactly instead
+                    selected, distances = self._exact_search(rows, query, k, candidates)
+            else:
+                selected, distances = self._exact_search(rows, query, k, candidates)
+            fields = self._result_fields(rows, selected, include)
+            for name in ("ids", "documents", "metadatas", "embeddings"):
+                results[name].append(fields[name])
+            results["distances"].append(distances)
+        for name in ("documents", "metadatas", "embeddings", "distances"):
+            if name not in include:
+                results[name] = None
+        return results
+
+    def _exact_search(self, rows: _Rows, query: np.ndarray, k: int, candidates: np.ndarray):
+        distances = np.empty(len(candidates), dtype=np.float32)
+        # Blocked so a whole-collection scan never copies more than a slice of the mapped file
+        for start in range(0, len(candidates), 65536):
+            block = candidates[start:start + 65536]
+            distances[start:start + len(block)] = (
+                rows.norms[block] - 2.0 * (np.asarray(rows.vectors[block]) @ query)
+            )
+        distances += float(query @ query)
+        top = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(len(distances))
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [int(candidates[i]) for i in top], [max(0.0, float(distances[i])) for i in top]
+
+    def _graph_search(self, query: np.ndarray, k: int, mask: np.ndarray):
+        with self._graph_lock:
+            labels, distances = self._graph.knn_query(
+                query, k=k, filter=None if mask.all() else (lambda label: bool(mask[label]))
+            )
+        return [int(label) for label in labels[0]], [float(distance) for distance in distances[0]]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records WHERE alive = 1").fetchone()[0]
+
+
+_stores: Dict[str, VectorStore] = {}
+_stores_lock = threading.Lock()
+_chroma_client = None
+
+
+def _open(name: str) -> VectorStore:
+    backend = settings.VECTOR_STORE_BACKEND
+    if backend == "chroma":
+        global _chroma_client
+        if _chroma_client is None:
+            import chromadb
+            _chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY)
+        return ChromaStore(_chroma_client.get_or_create_collection(name))
+    if backend in ("numpy", "hnsw"):
+        from .embeddings import embedding_service
+        return LocalVectorStore(
+            settings.VECTOR_STORE_DIRECTORY, name,
+            # Records stored without vectors (themes) are embedded like Chroma's default function would
+            embedding_function=embedding_service.embed,
+            index=backend,
+            m=settings.HNSW_M,
+            ef_construction=settings.HNSW_EF_CONSTRUCTION,
+            ef_search=settings.HNSW_EF_SEARCH,
+            brute_force_limit=settings.HNSW_BRUTE_FORCE_LIMIT
+        )
+    raise ValueError(f"VECTOR_STORE_BACKEND must be one of: {', '.join(VECTOR_STORE_BACKENDS)}")
+
+
+def open_collection(name: str) -> VectorStore:
+    """The named collection in the configured backend, shared by every router in this process."""
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = _open(name)
+        return _stores[name]
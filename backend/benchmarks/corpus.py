@@ -0,0 +1,115 @@
+"""Deterministic synthetic corpus for the benchmark suite.
+
+Generates three kinds of input that exercise the different ingestion paths of
+`DocumentProcessor`:
+- text PDFs (direct text extraction with PyMuPDF)
+- scanned PDFs rendered as images at a given DPI (OCR fallback)
+- standalone images (OCR)
+"""
+from typing import List, Dict, Any, Sequence
+import os
+import random
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw, ImageFont
+
+TOPICS = {
+    "penalties": ["penalty", "fine", "levied", "sanction", "imposed", "violation", "regulator", "compliance"],
+    "disclosure": ["disclosure", "investor", "statement", "filing", "material", "omission", "prospectus"],
+    "governance": ["board", "director", "oversight", "committee", "audit", "independence", "meeting"],
+    "privacy": ["data", "privacy", "consent", "breach", "personal", "processing", "notification"],
+}
+FILLER = ["the", "of", "and", "to", "in", "was", "for", "on", "that", "with", "by", "under", "order", "section"]
+
+PAGE_WIDTH_INCHES = 8.5
+PAGE_HEIGHT_INCHES = 11
+
+
+def make_paragraphs(rng: random.Random, doc_index: int, pages: int, paragraphs_per_page: int = 4) -> List[List[str]]:
+    """Topic-flavoured filler text, one list of paragraphs per page, with a unique case id per document."""
+    topic_names = sorted(TOPICS)
+    topic = topic_names[doc_index % len(topic_names)]
+    case_id = f"CR-{1000 + doc_index}-{2015 + doc_index % 10}"
+    result = []
+    for page in range(pages):
+        paragraphs = []
+        for para in range(paragraphs_per_page):
+            words = [rng.choice(TOPICS[topic] if rng.random() < 0.3 else FILLER) for _ in range(rng.randint(40, 70))]
+            if page == 0 and para == 0:
+                words[:0] = ["Case", case_id]
+            paragraphs.append(" ".join(words).capitalize() + ".")
+        result.append(paragraphs)
+    return result
+
+
+def _write_text_pdf(path: str, pages: List[List[str]]) -> None:
+    doc = fitz.open()
+    for paragraphs in pages:
+        page = doc.new_page(width=PAGE_WIDTH_INCHES * 72, height=PAGE_HEIGHT_INCHES * 72)
+        page.insert_textbox(fitz.Rect(54, 54, page.rect.width - 54, page.rect.height - 54),
+                            "\n\n".join(paragraphs), fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def _render_page(paragraphs: List[str], dpi: int) -> Image.Image:
+    width, height = int(PAGE_WIDTH_INCHES * dpi), int(PAGE_HEIGHT_INCHES * dpi)
+    image = Image.new("L", (width, height), color=255)
+    draw = ImageDraw.Draw(image)
+    font_size = max(8, dpi // 7)
+    try:
+        font = ImageFont.load_default(size=font_size)
+    except TypeError:
+        font = ImageFont.load_default()
+
+    margin, y = dpi // 2, dpi // 2
+    line_height = int(font_size * 1.4)
+    chars_per_line = max(20, int((width - 2 * margin) / (font_size * 0.55)))
+    for paragraph in paragraphs:
+        line = ""
+        for word in paragraph.split():
+            if len(line) + len(word) + 1 > chars_per_line:
+                draw.text((margin, y), line, fill=0, font=font)
+                y += line_height
+                line = ""
+            line = f"{line} {word}".strip()
+        draw.text((margin, y), line, fill=0, font=font)
+        y += line_height * 2
+        if y > height - margin:
+            break
+    return image
+
+
+def _write_scanned_pdf(path: str, pages: List[List[str]], dpi: int) -> None:
+    images = [_render_page(paragraphs, dpi) for paragraphs in pages]
+    images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+
+
+def generate_corpus(output_dir: str, text_pdfs: int = 4, scanned_pdfs: int = 2, images: int = 2,
+                    pages_per_doc: int = 2, dpis: Sequence[int] = (150, 300), seed: int = 1234) -> List[Dict[str, Any]]:
+    """Write the corpus to `output_dir` and return a manifest entry per file."""
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    manifest = []
+    doc_index = 0
+
+    for _ in range(text_pdfs):
+        path = os.path.join(output_dir, f"text_{doc_index:03d}.pdf")
+        _write_text_pdf(path, make_paragraphs(rng, doc_index, pages_per_doc))
+        manifest.append({"path": path, "kind": "text_pdf", "pages": pages_per_doc, "dpi": None})
+        doc_index += 1
+
+    for dpi in dpis:
+        for _ in range(scanned_pdfs):
+            path = os.path.join(output_dir, f"scanned_{dpi}dpi_{doc_index:03d}.pdf")
+            _write_scanned_pdf(path, make_paragraphs(rng, doc_index, pages_per_doc), dpi)
+            manifest.append({"path": path, "kind": f"scanned_pdf_{dpi}dpi", "pages": pages_per_doc, "dpi": dpi})
+            doc_index += 1
+
+    for _ in range(images):
+        path = os.path.join(output_dir, f"image_{doc_index:03d}.png")
+        _render_page(make_paragraphs(rng, doc_index, 1)[0], dpis[0]).save(path)
+        manifest.append({"path": path, "kind": "image", "pages": 1, "dpi": dpis[0]})
+        doc_index += 1
+
+    return manifest
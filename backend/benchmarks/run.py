@@ -0,0 +1,284 @@
+"""Reproducible offline benchmark for the ingestion, retrieval, query and theme pipelines.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.run --out bench.json
+    python -m benchmarks.run --out new.json --compare bench.json
+
+The LLM is replaced by a deterministic stub, so runs need no network access and are
+repeatable. Collections are opened through `open_collection` in a temporary directory, using
+the backend given by `--backend` (default: `VECTOR_STORE_BACKEND`).
+"""
+from typing import List, Dict, Any, Optional
+from contextlib import contextmanager
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from .corpus import generate_corpus
+from .stub_llm import StubProvider
+
+QUERIES = [
+    "What penalties were imposed?",
+    "Which fines were levied on the company?",
+    "CR-1002-2017",
+    "board oversight and audit committee independence",
+    "data breach notification and consent",
+]
+SEARCH_MODES = ("keyword", "vector", "hybrid")
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Linear-interpolated percentile, `q` in [0, 100]."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        try:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, "peak_wset", info.rss)
+        except ImportError:
+            return None
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Recorder:
+    """Collects wall-clock samples per stage."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    @contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage: {
+                "count": len(samples),
+                "mean_ms": 1000 * sum(samples) / len(samples),
+                "p50_ms": 1000 * percentile(samples, 50),
+                "p90_ms": 1000 * percentile(samples, 90),
+                "p95_ms": 1000 * percentile(samples, 95),
+                "p99_ms": 1000 * percentile(samples, 99),
+                "max_ms": 1000 * max(samples),
+            }
+            for stage, samples in sorted(self.samples.items())
+        }
+
+
+@contextmanager
+def temporary_vector_store(backend: str):
+    """Point `open_collection` at `backend` in a temporary directory for the duration."""
+    from app.core.config import settings
+
+    keys = ("VECTOR_STORE_BACKEND", "VECTOR_STORE_DIRECTORY", "CHROMA_PERSIST_DIRECTORY")
+    previous = {key: getattr(settings, key) for key in keys}
+    with tempfile.TemporaryDirectory() as directory:
+        settings.VECTOR_STORE_BACKEND = backend
+        settings.VECTOR_STORE_DIRECTORY = os.path.join(directory, "vectors")
+        settings.CHROMA_PERSIST_DIRECTORY = os.path.join(directory, "chroma")
+        try:
+            yield
+        finally:
+            for key, value in previous.items():
+                setattr(settings, key, value)
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.core.config import settings
+
+    args.backend = args.backend or settings.VECTOR_STORE_BACKEND
+    with temporary_vector_store(args.backend):
+        return await _run_pipelines(args)
+
+
+async def _run_pipelines(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.services.document_processor import DocumentProcessor
+    from app.services.llm_router import LLMRouter
+    from app.services.query_processor import QueryProcessor
+    from app.services.theme_identifier import ThemeIdentifier
+    from app.services.vector_store import open_collection
+
+    suffix = uuid.uuid4().hex[:8]
+    doc_collection = open_collection(f"bench_documents_{suffix}")
+    theme_collection = open_collection(f"bench_themes_{suffix}")
+
+    # Route every LLM call to the stub, whichever keys happen to be in the environment
+    stub = StubProvider(latency_seconds=args.llm_latency)
+    llm = LLMRouter([stub])
+    # Every query is measured end to end, so the semantic query cache stays out of the way; the
+    # single process has no other workers to hear about through the shared change log
+    document_processor = DocumentProcessor(doc_collection, query_cache=None, changes=None)
+    query_processor = QueryProcessor(doc_collection, llm=llm, cache=None)
+    theme_identifier = ThemeIdentifier(doc_collection, theme_collection, llm=llm)
+
+    recorder = Recorder()
+    sessions = [f"bench-{i}" for i in range(args.sessions)]
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        manifest = generate_corpus(corpus_dir, text_pdfs=args.text_pdfs, scanned_pdfs=args.scanned_pdfs,
+                                   images=args.images, pages_per_doc=args.pages,
+                                   dpis=args.dpis, seed=args.seed)
+
+        # --- Ingestion ---
+        by_kind: Dict[str, Dict[str, float]] = {}
+        batches: Dict[str, List[tuple]] = {session: [] for session in sessions}
+        ingest_start = time.perf_counter()
+        for index, entry in enumerate(manifest):
+            start = time.perf_counter()
+            with recorder.time(f"extract.{entry['kind']}"):
+                content = document_processor.process_document(entry["path"])
+            kind = by_kind.setdefault(entry["kind"], {"documents": 0, "pages": 0, "seconds": 0.0})
+            kind["documents"] += 1
+            kind["pages"] += content["pages"]
+            kind["seconds"] += time.perf_counter() - start
+            batches[sessions[index % len(sessions)]].append((f"DOC{index + 1:03d}", content))
+
+        for session, items in batches.items():
+            with recorder.time("store.batch"):
+                document_processor.store_documents(items, session)
+        ingest_seconds = time.perf_counter() - ingest_start
+
+    total_pages = sum(kind["pages"] for kind in by_kind.values())
+    for kind in by_kind.values():
+        kind["pages_per_second"] = kind["pages"] / kind["seconds"] if kind["seconds"] else 0.0
+
+    # --- Retrieval ---
+    for _ in range(args.repeats):
+        for query in QUERIES:
+            for mode in SEARCH_MODES:
+                with recorder.time(f"search.{mode}"):
+                    document_processor.search_documents(query, n_results=5, mode=mode, timestamps=sessions)
+
+    # --- Query pipeline ---
+    for query in QUERIES:
+        with recorder.time("query.end_to_end"):
+            with recorder.time("query.process_sessions"):
+                results = await query_processor.process_sessions(query, sessions)
+            with recorder.time("query.synthesize"):
+                await query_processor.synthesize_combined_answer(query, results)
+
+    # --- Theme pipeline ---
+    for _ in range(args.repeats):
+        with recorder.time("themes.identify"):
+            docs = theme_identifier.get_documents_by_timestamps(sessions)
+            await theme_identifier.identify_themes_for_documents(docs["document_texts"], docs["document_ids"], sessions)
+
+    return {
+        "version": 1,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "git_commit": git_commit(),
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("out", "compare")},
+        "ingestion": {
+            "documents": len(manifest),
+            "pages": total_pages,
+            "seconds": ingest_seconds,
+            "pages_per_second": total_pages / ingest_seconds if ingest_seconds else 0.0,
+            "by_kind": by_kind,
+        },
+        "stages": recorder.summary(),
+        "llm": stub.usage(),
+        "embedding": document_processor.embedder.stats(),
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def _metric_pairs(report: Dict[str, Any]) -> Dict[str, float]:
+    """Flatten the comparable numbers of a report into `name -> value`."""
+    metrics = {
+        "ingestion.pages_per_second": report["ingestion"]["pages_per_second"],
+        "llm.total_calls": report["llm"]["total_calls"],
+    }
+    if report.get("peak_rss_bytes"):
+        metrics["peak_rss_mb"] = report["peak_rss_bytes"] / (1024 * 1024)
+    for stage, stats in report["stages"].items():
+        metrics[f"{stage}.p50_ms"] = stats["p50_ms"]
+        metrics[f"{stage}.p95_ms"] = stats["p95_ms"]
+    return metrics
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    old, new = _metric_pairs(baseline), _metric_pairs(current)
+    rows = []
+    for name in sorted(set(old) | set(new)):
+        before, after = old.get(name), new.get(name)
+        change = (after - before) / before * 100 if before and after is not None else None
+        rows.append({"metric": name, "baseline": before, "current": after, "change_pct": change})
+    return rows
+
+
+def _format(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark for the document pipelines")
+    parser.add_argument("--out", default="bench_report.json", help="Where to write the JSON report")
+    parser.add_argument("--compare", help="Baseline report to compare against")
+    parser.add_argument("--text-pdfs", type=int, default=6)
+    parser.add_argument("--scanned-pdfs", type=int, default=2, help="Scanned PDFs per DPI")
+    parser.add_argument("--images", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=2, help="Pages per generated PDF")
+    parser.add_argument("--dpis", type=lambda value: [int(v) for v in value.split(",")], default=[150, 300])
+    parser.add_argument("--sessions", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per stub LLM call")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--backend", choices=["chroma", "numpy", "hnsw"],
+                        help="Vector store backend (default: VECTOR_STORE_BACKEND)")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(args))
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"{'metric':<40} {'baseline':>12} {'current':>12} {'change %':>10}")
+        for row in compare_reports(baseline, report):
+            print(f"{row['metric']:<40} {_format(row['baseline']):>12} {_format(row['current']):>12} "
+                  f"{_format(row['change_pct']):>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
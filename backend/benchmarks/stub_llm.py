@@ -0,0 +1,63 @@
+"""Deterministic offline stand-in for the LLM providers.
+
+`StubProvider` plugs into `LLMRouter` like any real provider, returns answers
+derived only from the prompt, and counts every call so the benchmark can
+report LLM usage without network access or API spend.
+"""
+from typing import Dict, Any, Optional
+import asyncio
+import hashlib
+import re
+import threading
+
+from app.services.llm_router import LLMProvider
+
+
+class StubProvider(LLMProvider):
+    name = "stub"
+
+    def __init__(self, latency_seconds: float = 0.0):
+        super().__init__("stub")
+        self.latency_seconds = latency_seconds
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {"query": 0, "synthesis": 0, "themes": 0}
+        self.prompt_chars = 0
+
+    def _classify(self, prompt: str) -> str:
+        if prompt.startswith("Analyze the following document excerpts"):
+            return "themes"
+        if "Document-wise Answers:" in prompt:
+            return "synthesis"
+        return "query"
+
+    async def complete(self, system: str, prompt: str, temperature: float, max_tokens: Optional[int]) -> str:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return self.respond(prompt)
+
+    def respond(self, prompt: str) -> str:
+        kind = self._classify(prompt)
+        with self._lock:
+            self.calls[kind] += 1
+            self.prompt_chars += len(prompt)
+
+        digest = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+        if kind == "themes":
+            documents = sorted(set(re.findall(r"^Document (\d+):", prompt, re.MULTILINE)), key=int)
+            themes = []
+            for t in range(1 + digest % 3):
+                evidence = "\n".join(f"- Document {d}: stub evidence {t}" for d in documents[t::2] or documents[:1])
+                themes.append(f"Theme: Stub Theme {t + 1}\nDeterministic description {t + 1}.\nEvidence:\n{evidence}")
+            return "\n\n".join(themes)
+        if kind == "synthesis":
+            return f"Combined stub answer {digest % 10000}."
+        page, para = 1 + digest % 3, 1 + digest % 5
+        return f"Stub answer {digest % 10000} (page {page}, para {para}; page {page}, para {para + 1})."
+
+    def usage(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "total_calls": sum(self.calls.values()),
+                "prompt_chars": self.prompt_chars
+            }
@@ -0,0 +1,192 @@
+"""Vector store benchmark: Chroma against the in-process numpy and HNSW backends.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.vector_store --out vectors.json
+    python -m benchmarks.vector_store --documents 50000 --ef 16,64,256
+
+Clustered synthetic vectors stand in for document embeddings (no model is loaded). Each backend
+is filled in a temporary directory; the report has insert throughput, session fetch latency,
+query latency percentiles with and without a session filter, and recall@k against exact search.
+For the local backends it also times session queries that each follow a small add and delete
+made through a second store on the same files, as another worker would.
+"""
+from typing import List, Dict, Any, Optional
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .run import percentile, peak_rss_bytes, git_commit
+
+
+def synthetic_corpus(documents: int, dim: int, sessions: int, clusters: int, seed: int):
+    """Unit vectors drawn around `clusters` centers, spread over `sessions` sessions."""
+    rng = np.random.RandomState(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.randint(clusters, size=documents)] + 0.35 * rng.normal(size=(documents, dim))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    session_of = [f"bench-{i % sessions}" for i in range(documents)]
+    return vectors, session_of
+
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int, rows: Optional[np.ndarray] = None):
+    """Ground-truth top-k row numbers by squared L2 distance, optionally within `rows`."""
+    rows = np.arange(len(vectors)) if rows is None else rows
+    candidates = vectors[rows]
+    distances = (np.einsum("ij,ij->i", candidates, candidates)[None, :] - 2.0 * queries @ candidates.T)
+    top = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    return [set(rows[row] for row in query_top) for query_top in top]
+
+
+def open_backend(backend: str, directory: str, args: argparse.Namespace):
+    from app.services.vector_store import ChromaStore, LocalVectorStore
+
+    if backend == "chroma":
+        import chromadb
+        client = chromadb.PersistentClient(path=directory)
+        return ChromaStore(client.get_or_create_collection("bench"))
+    return LocalVectorStore(directory, "bench", index=backend, m=args.m, ef_construction=args.ef_construction,
+                            brute_force_limit=args.brute_force_limit)
+
+
+def measure(store, vectors: np.ndarray, session_of: List[str], queries: np.ndarray, truth: Dict[str, list],
+            args: argparse.Namespace, filter_session: str) -> Dict[str, Any]:
+    ids = [f"doc-{i}" for i in range(len(vectors))]
+    start = time.perf_counter()
+    for begin in range(0, len(vectors), args.batch_size):
+        end = begin + args.batch_size
+        store.add(
+            ids=ids[begin:end],
+            embeddings=vectors[begin:end].tolist(),
+            metadatas=[{"timestamp": session} for session in session_of[begin:end]],
+            documents=[f"document {i}" for i in range(begin, min(end, len(vectors)))]
+        )
+    insert_seconds = time.perf_counter() - start
+
+    fetch = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        store.get(where={"timestamp": filter_session}, include=["documents", "metadatas"])
+        fetch.append(time.perf_counter() - start)
+
+    results = {
+        "insert_documents_per_second": len(vectors) / insert_seconds if insert_seconds else 0.0,
+        "session_get_p50_ms": percentile(fetch, 50) * 1000,
+    }
+    settings_to_sweep = args.ef if store.name == "hnsw" else [None]
+    for ef in settings_to_sweep:
+        if ef is not None:
+            store.set_ef_search(ef)
+        suffix = f"@ef{ef}" if ef is not None else ""
+        for scope, where in (("global", None), ("session", {"timestamp": filter_session})):
+            latencies, hits = [], 0
+            for query, expected in zip(queries, truth[scope]):
+                start = time.perf_counter()
+                found = store.query(query_embeddings=[query.tolist()], n_results=args.k, where=where,
+                                    include=["distances"])
+                latencies.append(time.perf_counter() - start)
+                hits += len(expected & {int(row_id.split("-")[1]) for row_id in found["ids"][0]})
+            results[f"query_{scope}{suffix}"] = {
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                f"recall@{args.k}": hits / (len(queries) * args.k),
+            }
+    return results
+
+
+def measure_after_writes(store, writer, vectors: np.ndarray, queries: np.ndarray, args: argparse.Namespace,
+                         filter_session: str) -> Dict[str, float]:
+    """Session query latency when `writer`, another store on the same files, wrote just before."""
+    rng = np.random.RandomState(args.seed + 2)
+    latencies = []
+    for i, query in enumerate(queries):
+        rows = rng.randint(len(vectors), size=args.write_batch)
+        ids = [f"extra-{i}-{j}" for j in range(len(rows))]
+        writer.add(
+            ids=ids,
+            embeddings=vectors[rows].tolist(),
+            metadatas=[{"timestamp": filter_session} for _ in rows],
+            documents=[f"extra document {i}-{j}" for j in range(len(rows))]
+        )
+        writer.delete(ids=ids[:len(ids) // 2])
+        start = time.perf_counter()
+        store.query(query_embeddings=[query.tolist()], n_results=args.k, where={"timestamp": filter_session},
+                    include=["distances"])
+        latencies.append(time.perf_counter() - start)
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    vectors, session_of = synthetic_corpus(args.documents, args.dim, args.sessions, args.clusters, args.seed)
+    rng = np.random.RandomState(args.seed + 1)
+    queries = vectors[rng.randint(len(vectors), size=args.queries)] + 0.1 * rng.normal(size=(args.queries, args.dim))
+    queries = queries.astype(np.float32)
+
+    filter_session = "bench-0"
+    session_rows = np.array([i for i, session in enumerate(session_of) if session == filter_session])
+    truth = {
+        "global": exact_neighbours(vectors, queries, args.k),
+        "session": exact_neighbours(vectors, queries, args.k, session_rows),
+    }
+
+    backends = {}
+    for backend in args.backends:
+        with tempfile.TemporaryDirectory() as directory:
+            store = open_backend(backend, directory, args)
+            backends[backend] = measure(store, vectors, session_of, queries, truth, args, filter_session)
+            if backend != "chroma":
+                # Measured last: the extra rows are not part of the recall ground truth
+                writer = open_backend(backend, directory, args)
+                backends[backend]["query_session_after_write"] = measure_after_writes(
+                    store, writer, vectors, queries, args, filter_session)
+            print(f"{backend}: {json.dumps(backends[backend])}")
+
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "platform": {"python": platform.python_version(), "machine": platform.machine()},
+        "config": {key: value for key, value in vars(args).items() if key != "out"},
+        "backends": backends,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the vector store backends against each other")
+    parser.add_argument("--out", default="vector_store_report.json", help="Where to write the JSON report")
+    parser.add_argument("--backends", type=lambda value: value.split(","), default=["chroma", "numpy", "hnsw"])
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384, help="all-MiniLM-L6-v2 embeddings are 384-dimensional")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=20, help="Session fetches to time")
+    parser.add_argument("--m", type=int, default=16, help="HNSW graph degree")
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef", type=lambda value: [int(v) for v in value.split(",")], default=[16, 64, 256],
+                        help="HNSW search breadths to sweep")
+    parser.add_argument("--brute-force-limit", type=int, default=2048)
+    parser.add_argument("--write-batch", type=int, default=10,
+                        help="Vectors another store adds (and half of which it deletes) before each timed query")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
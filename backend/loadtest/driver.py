@@ -0,0 +1,183 @@
+"""Load driver replaying mixed upload / query / theme traffic against a running backend.
+
+Start the simulator and the API (with LLM_SIMULATOR_URL set), then:
+
+    python -m loadtest.driver --base-url http://localhost:3000 --concurrency 16 \
+        --duration 120 --mix upload=1,query=8,themes=1 --out load.json
+
+Reports requests/sec and latency percentiles per endpoint.
+"""
+from typing import List, Dict, Any, Optional
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.run import QUERIES, percentile
+
+ENDPOINTS = {
+    "upload": "/api/documents/upload_multiple",
+    "query": "/api/query/query_documents",
+    "themes": "/api/themes/analyze",
+}
+# Uploads tried before the run, to create a session to load, before giving up
+SEED_UPLOAD_ATTEMPTS = 3
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown operation in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LoadDriver:
+    def __init__(self, base_url: str, corpus: List[str], mix: Dict[str, float], concurrency: int,
+                 docs_per_upload: int, request_timeout: float, seed: int):
+        self.base_url = base_url.rstrip("/")
+        self.corpus = corpus
+        self.mix = mix
+        self.concurrency = concurrency
+        self.docs_per_upload = docs_per_upload
+        self.request_timeout = request_timeout
+        self.rng = random.Random(seed)
+        self.sessions: List[str] = []
+        self.samples: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.errors: Dict[str, int] = {name: 0 for name in ENDPOINTS}
+        self.last_error: Optional[str] = None
+
+    async def _upload(self, client: httpx.AsyncClient) -> bool:
+        paths = self.rng.sample(self.corpus, min(self.docs_per_upload, len(self.corpus)))
+        files = [("files", (os.path.basename(path), open(path, "rb"), "application/pdf")) for path in paths]
+        try:
+            response = await client.post(ENDPOINTS["upload"], files=files)
+        finally:
+            for _, (_, handle, _) in files:
+                handle.close()
+        if response.status_code == 200:
+            self.sessions.append(response.json()["timestamp_folder"])
+        else:
+            self.last_error = f"upload returned HTTP {response.status_code}: {response.text[:200]}"
+        return response.status_code == 200
+
+    async def _query(self, client: httpx.AsyncClient) -> bool:
+        sessions = self.rng.sample(self.sessions, min(len(self.sessions), self.rng.randint(1, 2)))
+        response = await client.get(ENDPOINTS["query"], params={"q": self.rng.choice(QUERIES), "timestamp": ",".join(sessions)})
+        # The query route reports failures in the body with a 200 status
+        return response.status_code == 200 and "error" not in response.json()
+
+    async def _themes(self, client: httpx.AsyncClient) -> bool:
+        response = await client.get(ENDPOINTS["themes"], params={"timestamp": self.rng.choice(self.sessions)})
+        return response.status_code == 200
+
+    async def _run_one(self, client: httpx.AsyncClient, operation: str) -> None:
+        handler = {"upload": self._upload, "query": self._query, "themes": self._themes}[operation]
+        start = time.perf_counter()
+        try:
+            ok = await handler(client)
+        except httpx.HTTPError as e:
+            self.last_error = f"{operation} failed: {e!r}"
+            ok = False
+        self.samples[operation].append(time.perf_counter() - start)
+        if not ok:
+            self.errors[operation] += 1
+
+    async def run(self, duration: float, max_requests: Optional[int]) -> Dict[str, Any]:
+        timeout = httpx.Timeout(self.request_timeout)
+        limits = httpx.Limits(max_connections=self.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=timeout, limits=limits) as client:
+            # Queries and themes need at least one session to target
+            for _ in range(SEED_UPLOAD_ATTEMPTS):
+                await self._run_one(client, "upload")
+                if self.sessions:
+                    break
+            else:
+                raise RuntimeError(f"No session to load: {SEED_UPLOAD_ATTEMPTS} uploads to {self.base_url} "
+                                   f"failed (last error: {self.last_error})")
+
+            operations = list(self.mix)
+            weights = [self.mix[name] for name in operations]
+            deadline = time.perf_counter() + duration
+            issued = 0
+
+            async def worker():
+                nonlocal issued
+                while time.perf_counter() < deadline and (max_requests is None or issued < max_requests):
+                    issued += 1
+                    await self._run_one(client, self.rng.choices(operations, weights)[0])
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+            elapsed = time.perf_counter() - start
+
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        endpoints = {}
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+            endpoints[ENDPOINTS[name]] = {
+                "requests": len(samples),
+                "errors": self.errors[name],
+                "throughput_rps": len(samples) / elapsed,
+                "p50_ms": 1000 * percentile(samples, 50),
+                "p90_ms": 1000 * percentile(samples, 90),
+                "p95_ms": 1000 * percentile(samples, 95),
+                "p99_ms": 1000 * percentile(samples, 99),
+                "max_ms": 1000 * max(samples),
+            }
+        total = sum(len(samples) for samples in self.samples.values())
+        return {
+            "concurrency": self.concurrency,
+            "mix": self.mix,
+            "elapsed_seconds": elapsed,
+            "total_requests": total,
+            "throughput_rps": total / elapsed if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Mixed-traffic load driver for the backend API")
+    parser.add_argument("--base-url", default="http://localhost:3000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to generate load for")
+    parser.add_argument("--max-requests", type=int, help="Stop after this many requests")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("upload=1,query=8,themes=1"))
+    parser.add_argument("--docs-per-upload", type=int, default=3)
+    parser.add_argument("--corpus-size", type=int, default=12, help="Synthetic text PDFs to draw uploads from")
+    parser.add_argument("--request-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--out", help="Write the JSON report here as well as printing it")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        manifest = generate_corpus(corpus_dir, text_pdfs=args.corpus_size, scanned_pdfs=0, images=0, seed=args.seed)
+        driver = LoadDriver(args.base_url, [entry["path"] for entry in manifest], args.mix, args.concurrency,
+                            args.docs_per_upload, args.request_timeout, args.seed)
+        try:
+            report = asyncio.run(driver.run(args.duration, args.max_requests))
+        except RuntimeError as e:
+            print(f"Load run aborted: {e}", file=sys.stderr)
+            return 1
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
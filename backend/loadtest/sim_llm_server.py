@@ -0,0 +1,134 @@
+"""Local OpenAI-compatible chat-completions server with simulated latency and failures.
+
+Point the backend at it with `LLM_SIMULATOR_URL=http://localhost:9000/v1`, then:
+
+    python -m loadtest.sim_llm_server --port 9000 --latency lognormal:1.2,0.5 \
+        --tokens-per-second 60 --error-rate 0.02 --rate-limit-rate 0.01
+
+Latency distributions (seconds, for time to first token):
+    fixed:<s>  uniform:<low>,<high>  exponential:<mean>  lognormal:<median>,<sigma>
+"""
+from typing import Callable, Dict, Any
+import argparse
+import asyncio
+import math
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from benchmarks.stub_llm import StubProvider
+
+
+def parse_distribution(spec: str) -> Callable[[random.Random], float]:
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1 / values[0])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return max(1, len(text) // 4)
+
+
+def create_app(latency: str = "lognormal:1.0,0.5", tokens_per_second: float = 50.0, error_rate: float = 0.0,
+               rate_limit_rate: float = 0.0, hang_rate: float = 0.0, retry_after: float = 2.0,
+               seed: int = 0) -> FastAPI:
+    app = FastAPI(title="Simulated LLM server")
+    sample_latency = parse_distribution(latency)
+    rng = random.Random(seed)
+    responder = StubProvider()
+    counters: Dict[str, int] = {"requests": 0, "errors": 0, "rate_limited": 0, "hung": 0}
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "simulated", "object": "model", "owned_by": "loadtest"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body: Dict[str, Any] = await request.json()
+        counters["requests"] += 1
+        prompt = body["messages"][-1]["content"]
+
+        roll = rng.random()
+        if roll < rate_limit_rate:
+            counters["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": str(retry_after)},
+                content={"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}}
+            )
+        roll -= rate_limit_rate
+        if roll < error_rate:
+            counters["errors"] += 1
+            await asyncio.sleep(sample_latency(rng) / 4)
+            return JSONResponse(status_code=500, content={"error": {"message": "Simulated failure", "type": "server_error"}})
+        roll -= error_rate
+        if roll < hang_rate:
+            # Never answers in time; exercises client timeouts and failover
+            counters["hung"] += 1
+            await asyncio.sleep(3600)
+
+        content = responder.respond(prompt)
+        completion_tokens = estimate_tokens(content)
+        if body.get("max_tokens"):
+            completion_tokens = min(completion_tokens, body["max_tokens"])
+        await asyncio.sleep(sample_latency(rng) + completion_tokens / tokens_per_second)
+
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in body["messages"])
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "simulated"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return counters
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Simulated OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default="lognormal:1.0,0.5", help="Time-to-first-token distribution")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction answered with HTTP 429")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction that never complete")
+    parser.add_argument("--retry-after", type=float, default=2.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.tokens_per_second, args.error_rate, args.rate_limit_rate,
+                     args.hang_rate, args.retry_after, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
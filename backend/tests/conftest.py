@@ -0,0 +1,45 @@
+"""Keeps the test run's files out of the working directory.
+
+Module-level singletons (theme index, digests, change log) open their SQLite files when `app` is
+first imported, so their paths are pointed at a scratch directory before any test module loads.
+Each test also gets its own copies of those paths under `tmp_path`.
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+_PATHS = {
+    "USER_DB_PATH": "users.db",
+    "THEME_INDEX_PATH": "themes.db",
+    "DIGEST_PATH": "digests.db",
+    "DOCUMENT_CHANGES_PATH": "document_changes.db",
+    "LLM_RATE_STATE_PATH": "llm_rate_limits.db",
+    "VECTOR_STORE_DIRECTORY": "vectors",
+    "CHROMA_PERSIST_DIRECTORY": "chroma",
+    "UPLOAD_DIRECTORY": "uploads",
+}
+_scratch = None
+
+
+def pytest_configure(config):
+    global _scratch
+    _scratch = tempfile.mkdtemp(prefix="backend-tests-")
+    for key, name in _PATHS.items():
+        os.environ[key] = os.path.join(_scratch, name)
+
+
+def pytest_unconfigure(config):
+    if _scratch is not None:
+        shutil.rmtree(_scratch, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def isolated_paths(tmp_path, monkeypatch):
+    """Per-test storage paths, for stores a test constructs from settings."""
+    from app.core.config import settings
+
+    for key, name in _PATHS.items():
+        monkeypatch.setattr(settings, key, str(tmp_path / name))
+    return tmp_path
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from app.core.deadline import Deadline
+from app.services.query_processor import QueryProcessor
+from app.services.theme_identifier import ThemeIdentifier
+
+DOC_RESULTS = [{"doc_id": "DOC001", "response": "An answer."}]
+
+
+class TimingOutLLM:
+    """Stands in for LLMRouter re-raising a provider's LLM_TIMEOUT_SECONDS timeout."""
+    providers = ["fake"]
+
+    async def complete(self, *args, **kwargs):
+        raise asyncio.TimeoutError()
+
+
+class SlowLLM:
+    providers = ["fake"]
+
+    async def complete(self, *args, **kwargs):
+        await asyncio.sleep(5)
+        return "Theme: Never", "fake-model"
+
+
+def test_synthesis_provider_timeout_without_deadline_is_raised():
+    processor = QueryProcessor(None, llm=TimingOutLLM(), cache=None)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(processor.synthesize_combined_answer("q", DOC_RESULTS))
+
+
+def test_synthesis_provider_timeout_within_deadline_is_not_truncation():
+    processor = QueryProcessor(None, llm=TimingOutLLM(), cache=None)
+    deadline = Deadline(60)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(processor.synthesize_combined_answer("q", DOC_RESULTS, deadline=deadline))
+    assert not deadline.truncated
+
+
+def test_synthesis_deadline_truncates():
+    processor = QueryProcessor(None, llm=SlowLLM(), cache=None)
+    deadline = Deadline(0.05)
+    assert asyncio.run(processor.synthesize_combined_answer("q", DOC_RESULTS, deadline=deadline)) is None
+    assert deadline.truncated
+
+
+def test_themes_provider_timeout_without_deadline_is_raised():
+    identifier = ThemeIdentifier(None, None, llm=TimingOutLLM(), index=None, digests=None)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(identifier._identify_themes("context", "2024-01-01T00-00-00"))
+
+
+def test_themes_provider_timeout_within_deadline_is_not_truncation():
+    identifier = ThemeIdentifier(None, None, llm=TimingOutLLM(), index=None, digests=None)
+    deadline = Deadline(60)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(identifier._identify_themes("context", "2024-01-01T00-00-00", deadline=deadline))
+    assert not deadline.truncated
+
+
+def test_themes_deadline_truncates():
+    identifier = ThemeIdentifier(None, None, llm=SlowLLM(), index=None, digests=None)
+    deadline = Deadline(0.05)
+    result = asyncio.run(identifier._identify_themes("context", "2024-01-01T00-00-00", deadline=deadline))
+    assert result == {"themes": [], "model": None}
+    assert deadline.truncated
+
+
+def test_capped_deadline():
+    assert Deadline.capped(None, 60).remaining() == pytest.approx(60, abs=1)
+    assert Deadline.capped(10, 60).remaining() == pytest.approx(10, abs=1)
+    assert Deadline.capped(120, 60).remaining() == pytest.approx(60, abs=1)
+    # A server limit of 0 disables the cap but keeps the client's deadline
+    assert Deadline.capped(10, 0).remaining() == pytest.approx(10, abs=1)
+    assert Deadline.capped(None, 0).remaining() is None
@@ -0,0 +1,63 @@
+from app.core.config import settings
+from app.services.dedup import NearDuplicateIndex, group_duplicates
+from app.services.query_processor import QueryProcessor
+from app.services.theme_identifier import ThemeIdentifier
+
+ORIGINAL = ("The regulator imposed a penalty of 40000 on the company for failing to report the breach "
+            "within the statutory period and ordered an independent audit of its data handling practices "
+            "covering retention, consent records and vendor access over the previous three financial years.")
+AMENDED = ORIGINAL.replace("previous three financial years.", "previous three financial years, as amended.")
+UNRELATED = "Board minutes on audit committee independence and the appointment of two new directors."
+
+
+def test_group_duplicates():
+    groups = group_duplicates(["a", "b", "c", "d", "e"], [None, "a", None, "a", "gone"])
+    assert groups == {"a": ["b", "d"], "c": [], "e": []}
+    assert list(groups) == ["a", "c", "e"]
+
+
+def test_group_duplicates_representative_not_requested():
+    assert group_duplicates(["b", "c"], ["a", "a"]) == {"b": [], "c": []}
+
+
+def test_amended_copy_points_at_earliest():
+    index = NearDuplicateIndex(threshold=0.8)
+    assert index.add("s1/DOC001", ORIGINAL) is None
+    assert index.add("s1/DOC002", UNRELATED) is None
+    representative, similarity = index.add("s2/DOC001", AMENDED)
+    assert representative == "s1/DOC001"
+    assert similarity >= 0.8
+
+
+def test_collapse_is_off_by_default():
+    assert settings.DEDUP_COLLAPSE is False
+    assert QueryProcessor(None, llm=None, cache=None).collapse_duplicates is False
+
+
+def _document(key, duplicate_of=None):
+    return {"key": key, "doc_id": key.split("/")[1], "content": key, "metadata": {"duplicate_of": duplicate_of}}
+
+
+def test_query_collapse_keeps_representative():
+    processor = QueryProcessor(None, llm=None, cache=None, collapse_duplicates=True)
+    documents = [_document("s1/DOC001"), _document("s1/DOC002"), _document("s2/DOC001", "s1/DOC001")]
+    collapsed = processor._collapse_duplicates(documents)
+    assert [doc["key"] for doc in collapsed] == ["s1/DOC001", "s1/DOC002"]
+    assert collapsed[0]["duplicates"] == ["s2/DOC001"]
+    assert collapsed[1]["duplicates"] == []
+
+
+def test_theme_collapse_filters_parallel_lists():
+    identifier = ThemeIdentifier(None, None, llm=None, index=None, digests=None, collapse_duplicates=True)
+    documents = {
+        "document_keys": ["s1/DOC001", "s2/DOC001", "s2/DOC002"],
+        "document_ids": ["DOC001", "DOC001", "DOC002"],
+        "document_texts": ["original", "amended", "other"],
+        "duplicate_of": [None, "s1/DOC001", None],
+    }
+    assert identifier.collapse_duplicate_documents(documents) == {
+        "document_keys": ["s1/DOC001", "s2/DOC002"],
+        "document_ids": ["DOC001", "DOC002"],
+        "document_texts": ["original", "other"],
+        "duplicate_of": [None, None],
+    }
@@ -0,0 +1,44 @@
+from app.services.document_changes import DocumentChangeLog, ADD, DELETE
+
+
+def test_other_writers_entries_are_replayed(tmp_path):
+    path = str(tmp_path / "changes.db")
+    first, second = DocumentChangeLog(path), DocumentChangeLog(path)
+    assert second.changed()  # first check
+    assert not second.changed()
+
+    first.record(ADD, ["s1_DOC001", "s1_DOC002"], "s1")
+    first.record(DELETE, ["s1_DOC001"], "s1")
+    assert second.changed()
+    entries, position = second.since(0)
+    assert [(op, document_id, session) for _, op, document_id, session in entries] == [
+        (ADD, "s1_DOC001", "s1"), (ADD, "s1_DOC002", "s1"), (DELETE, "s1_DOC001", "s1")
+    ]
+    assert position == second.latest() == 3
+    assert second.since(position) == ([], position)
+
+
+def test_own_entries_are_filtered_out(tmp_path):
+    path = str(tmp_path / "changes.db")
+    first, second = DocumentChangeLog(path), DocumentChangeLog(path)
+    first.record(ADD, ["s1_DOC001"], "s1")
+    second.record(ADD, ["s2_DOC001"], "s2")
+    entries, position = second.since(0)
+    assert [document_id for _, _, document_id, _ in entries] == ["s1_DOC001"]
+    assert position == 2
+    entries, _ = first.since(0)
+    assert [document_id for _, _, document_id, _ in entries] == ["s2_DOC001"]
+
+
+def test_since_returns_none_once_trimmed(tmp_path):
+    path = str(tmp_path / "changes.db")
+    first, second = DocumentChangeLog(path, retain=10), DocumentChangeLog(path, retain=10)
+    first.record(ADD, [f"s1_DOC{i:04d}" for i in range(999)], "s1")
+    assert second.since(0)[0] is not None  # no multiple of 1000 crossed yet
+
+    first.record(ADD, ["s1_DOC0999", "s1_DOC1000"], "s1")
+    entries, position = second.since(0)
+    assert entries is None and position == 1001
+    entries, _ = second.since(991)
+    assert [document_id for _, _, document_id, _ in entries][-1] == "s1_DOC1000"
+    assert len(entries) == 10
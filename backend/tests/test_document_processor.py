@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("paddleocr")  # document_processor builds its OCR model on import
+
+from app.core.config import settings
+from app.services.document_changes import DocumentChangeLog, ADD
+from app.services.document_processor import DocumentProcessor
+from app.services.vector_store import LocalVectorStore
+
+QUERY = "penalty CR-45-2019"
+TEXTS = {
+    "DOC001": "The penalty in CR-45-2019 was a fine; the penalty was paid.",
+    "DOC002": "A penalty is mentioned once among many other unrelated words in this filing.",
+    "DOC003": "Board minutes on audit committee independence.",
+}
+VECTORS = {"DOC001": (0.0, 1.0, 0.0), "DOC002": (1.0, 0.0, 0.0), "DOC003": (0.8, 0.6, 0.0)}
+
+
+class FakeEmbedder:
+    """Vectors chosen per text so the vector ranking differs from the keyword ranking."""
+
+    def embed(self, texts):
+        by_text = {text: VECTORS[doc_id] for doc_id, text in TEXTS.items()}
+        return [list(by_text.get(text, (0.0, 0.0, 1.0))) for text in texts]
+
+    def embed_query(self, query):
+        return [1.0, 0.0, 0.0]
+
+
+def content(text):
+    return {"text": text, "pages": 1, "confidence": 1.0, "word_count": len(text.split())}
+
+
+def worker(tmp_path, changes=None):
+    store = LocalVectorStore(str(tmp_path / "vectors"), "documents")
+    changes = changes or DocumentChangeLog(str(tmp_path / "changes.db"))
+    return DocumentProcessor(store, embedder=FakeEmbedder(), query_cache=None, changes=changes)
+
+
+def test_hybrid_search_fuses_rankings(tmp_path):
+    processor = worker(tmp_path)
+    processor.store_documents([(doc_id, content(text)) for doc_id, text in TEXTS.items()], "s1")
+
+    keyword = processor.search_documents(QUERY, mode="keyword")
+    assert [hit["doc_id"] for hit in keyword] == ["DOC001", "DOC002"]
+    vector = processor.search_documents(QUERY, mode="vector")
+    assert [hit["doc_id"] for hit in vector] == ["DOC002", "DOC003", "DOC001"]
+
+    hybrid = processor.search_documents(QUERY, mode="hybrid")
+    k = settings.SEARCH_RRF_K
+    assert [hit["doc_id"] for hit in hybrid] == ["DOC002", "DOC001", "DOC003"]
+    assert hybrid[0]["score"] == pytest.approx(1 / (k + 2) + 1 / (k + 1))
+    assert hybrid[1]["score"] == pytest.approx(1 / (k + 1) + 1 / (k + 3))
+    assert hybrid[2]["score"] == pytest.approx(1 / (k + 2))
+    assert all(hit["timestamp"] == "s1" and hit["id"] == f"s1_{hit['doc_id']}" for hit in hybrid)
+
+
+def test_worker_replays_other_workers_changes(tmp_path):
+    first, second = worker(tmp_path), worker(tmp_path)
+    first.store_documents([("DOC001", content(TEXTS["DOC001"]))], "s1")
+    assert [hit["id"] for hit in second.search_documents(QUERY, mode="keyword")] == ["s1_DOC001"]
+
+    first.store_documents([("DOC002", content(TEXTS["DOC002"]))], "s2")
+    first.delete_document("DOC001", "s1")
+    assert [hit["id"] for hit in second.search_documents(QUERY, mode="keyword")] == ["s2_DOC002"]
+    # Seen by the other worker's duplicate index too
+    assert "s2_DOC002" in second.duplicate_index and "s1_DOC001" not in second.duplicate_index
+
+
+def test_worker_behind_trimmed_log_reloads(tmp_path):
+    path = str(tmp_path / "changes.db")
+    first = worker(tmp_path, DocumentChangeLog(path, retain=10))
+    second = worker(tmp_path, DocumentChangeLog(path, retain=10))
+    assert second.search_documents(QUERY, mode="keyword") == []
+
+    first.store_documents([("DOC001", content(TEXTS["DOC001"]))], "s1")
+    # Push the entry above out of the retained tail of the log
+    first.changes.record(ADD, [f"s9_DOC{i:04d}" for i in range(1000)], "s9")
+    assert [hit["id"] for hit in second.search_documents(QUERY, mode="keyword")] == ["s1_DOC001"]
@@ -0,0 +1,22 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services.llm_router import GeminiProvider
+
+
+class RecordingGeminiModel:
+    def __init__(self):
+        self.contents = None
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self.contents = contents
+        return SimpleNamespace(text=" answer ", usage_metadata=None)
+
+
+def test_gemini_keeps_system_prompt():
+    provider = GeminiProvider.__new__(GeminiProvider)
+    provider.model = "gemini-pro"
+    provider.client = RecordingGeminiModel()
+    text = asyncio.run(provider.complete("Cite as [DOC001, p. 2].", "What penalties?", 0.0, None))
+    assert text == "answer"
+    assert provider.client.contents == "Cite as [DOC001, p. 2].\n\nWhat penalties?"
@@ -0,0 +1,129 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.llm_scheduler import (
+    LLMScheduler, RateLimitState, INTERACTIVE, BATCH, parse_rate_limits, retry_after_seconds
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def scheduler(limits, clock, state=None, **kwargs):
+    return LLMScheduler(parse_rate_limits(limits), batch_reserve=0.2, state=state, clock=clock,
+                        poll_seconds=0.01, **kwargs)
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("openai=500:30000, groq=30") == {"openai": (500.0, 30000.0), "groq": (30.0, 0.0)}
+    assert parse_rate_limits("") == {}
+
+
+def test_request_bucket_refills_over_time():
+    clock = FakeClock()
+    limiter = scheduler("openai=60:0", clock)
+    for _ in range(60):
+        asyncio.run(limiter.acquire("openai", 10))
+    assert limiter.delay("openai", 10) == pytest.approx(1.0)
+    clock.now += 1.0
+    assert limiter.delay("openai", 10) == 0.0
+
+
+def test_token_bucket_limits_large_calls():
+    clock = FakeClock()
+    limiter = scheduler("openai=0:600", clock)
+    asyncio.run(limiter.acquire("openai", 500))
+    # 100 tokens left, refilling at 10 a second
+    assert limiter.delay("openai", 300) == pytest.approx(20.0)
+    assert limiter.delay("unlisted", 10 ** 6) == 0.0
+
+
+def test_batch_leaves_reserve_for_interactive():
+    clock = FakeClock()
+    limiter = scheduler("openai=10:0", clock)
+    for _ in range(8):
+        asyncio.run(limiter.acquire("openai", 1, BATCH))
+    assert limiter.delay("openai", 1, BATCH) > 0
+    assert limiter.delay("openai", 1, INTERACTIVE) == 0.0
+
+
+def test_interactive_goes_ahead_of_earlier_batch():
+    clock = FakeClock()
+    limiter = scheduler("openai=600:0", clock)
+    limiter.penalize("openai", 5.0)
+    order = []
+
+    async def call(name, priority):
+        await limiter.acquire("openai", 1, priority)
+        order.append(name)
+
+    async def main():
+        tasks = [asyncio.create_task(call("batch", BATCH))]
+        await asyncio.sleep(0.02)
+        tasks.append(asyncio.create_task(call("interactive", INTERACTIVE)))
+        await asyncio.sleep(0.02)
+        assert order == []
+        clock.now += 5.0
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+
+    asyncio.run(main())
+    assert order == ["interactive", "batch"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    clock = FakeClock()
+    limiter = scheduler("openai=600:0", clock)
+    limiter.penalize("openai", 5.0)
+
+    async def main():
+        task = asyncio.create_task(limiter.acquire("openai", 1))
+        await asyncio.sleep(0.02)
+        assert limiter.stats()["providers"]["openai"]["queued"][INTERACTIVE] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert limiter.stats()["providers"]["openai"]["queued"][INTERACTIVE] == 0
+
+    asyncio.run(main())
+
+
+def test_limits_and_holds_are_shared_between_workers(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "rate.db")
+    first = scheduler("openai=2:0", clock, RateLimitState(path))
+    second = scheduler("openai=2:0", clock, RateLimitState(path))
+    asyncio.run(first.acquire("openai", 1))
+    asyncio.run(second.acquire("openai", 1))
+    # Both workers drew from the same two-request allowance
+    assert first.delay("openai", 1) == pytest.approx(30.0)
+    assert second.stats()["providers"]["openai"]["requests_available"] == 0
+
+    first.penalize("groq", 12.0)
+    assert second.delay("groq", 1) == pytest.approx(12.0)
+    # A shorter hold does not cut an existing one short
+    second.penalize("groq", 3.0)
+    assert first.delay("groq", 1) == pytest.approx(12.0)
+    clock.now += 12.0
+    assert second.delay("groq", 1) == 0.0
+
+
+def _error(status=None, headers=None, name="APIError"):
+    error_type = type(name, (Exception,), {})
+    error = error_type()
+    error.response = SimpleNamespace(status_code=status, headers=headers or {})
+    return error
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(_error(429, {"retry-after-ms": "1500"}), 10.0) == 1.5
+    assert retry_after_seconds(_error(429, {"retry-after": "7"}), 10.0) == 7.0
+    assert retry_after_seconds(_error(429, {"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"}), 10.0) == 10.0
+    assert retry_after_seconds(_error(name="RateLimitError"), 10.0) == 10.0
+    assert retry_after_seconds(_error(500), 10.0) is None
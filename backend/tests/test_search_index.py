@@ -0,0 +1,45 @@
+import math
+
+from app.services.search_index import BM25Index, tokenize
+
+
+def test_tokenize_keeps_compound_identifiers_and_parts():
+    tokens = tokenize("Order CR-45-2019 under s.12(3), file 2021/00123.")
+    for token in ("cr-45-2019", "cr", "45", "2019", "s.12", "s", "12", "3", "2021/00123", "2021", "00123"):
+        assert token in tokens
+    assert tokens[:2] == ["order", "cr-45-2019"]
+
+
+def test_exact_identifier_outranks_shared_parts():
+    index = BM25Index()
+    index.add("s1_DOC001", "Penalty imposed in case CR-45-2019 by the regulator.", session="s1")
+    index.add("s1_DOC002", "Penalty imposed in case CR-46-2019 by the regulator.", session="s1")
+    index.add("s1_DOC003", "Board minutes on audit committee independence.", session="s1")
+    hits = index.search("CR-45-2019")
+    assert [hit["id"] for hit in hits] == ["s1_DOC001", "s1_DOC002"]
+    assert hits[0]["score"] > hits[1]["score"]
+
+
+def test_bm25_score():
+    index = BM25Index(k1=1.5, b=0.75)
+    index.add("a", "fine fine breach")
+    index.add("b", "audit report")
+    (hit,) = index.search("fine")
+    # One of two documents holds the term twice; document length 3 against an average of 2.5
+    idf = math.log(1 + (2 - 1 + 0.5) / (1 + 0.5))
+    norm = 1.5 * (1 - 0.75 + 0.75 * 3 / 2.5)
+    assert hit["id"] == "a"
+    assert math.isclose(hit["score"], idf * 2 * 2.5 / (2 + norm))
+
+
+def test_sessions_replace_and_remove():
+    index = BM25Index()
+    index.add("s1_DOC001", "consent withdrawn", session="s1")
+    index.add("s2_DOC001", "consent recorded", session="s2")
+    assert [hit["id"] for hit in index.search("consent", sessions=["s2"])] == ["s2_DOC001"]
+
+    index.add("s1_DOC001", "retention schedule", session="s1")
+    assert [hit["id"] for hit in index.search("consent")] == ["s2_DOC001"]
+    index.remove("s2_DOC001")
+    assert index.search("consent") == []
+    assert len(index) == 1 and index.session_of("s1_DOC001") == "s1"
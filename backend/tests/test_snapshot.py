@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from app.services.snapshot import SessionSnapshotter, SnapshotError
+from app.services.theme_index import ThemeIndex
+from app.services.vector_store import LocalVectorStore
+
+EMBEDDER = SimpleNamespace(backend="onnx", model_name="all-MiniLM-L6-v2", quantize=False)
+
+
+class Documents:
+    """The parts of DocumentProcessor a snapshot import uses, over a local vector store."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def delete_session(self, timestamp):
+        ids = self.collection.get(where={"timestamp": timestamp}, include=[])["ids"]
+        self.collection.delete(ids=ids)
+        return len(ids)
+
+    def add_stored_documents(self, full_doc_ids, texts, embeddings, metadatas, timestamp):
+        self.collection.add(ids=full_doc_ids, embeddings=embeddings, metadatas=metadatas, documents=texts)
+
+
+def server(directory, embedder=EMBEDDER):
+    documents = LocalVectorStore(str(directory / "vectors"), "documents")
+    themes = LocalVectorStore(str(directory / "vectors"), "themes",
+                              embedding_function=lambda texts: [[1.0, 0.0] for _ in texts])
+    index = ThemeIndex(str(directory / "themes.db"))
+    return SessionSnapshotter(Documents(documents), themes, index=index, embedder=embedder)
+
+
+def store(snapshotter, session, dim, count=2):
+    ids = [f"{session}_DOC{i + 1:03d}" for i in range(count)]
+    snapshotter.documents.collection.add(
+        ids=ids,
+        embeddings=[[float(i + 1)] + [0.0] * (dim - 1) for i in range(count)],
+        metadatas=[{"timestamp": session, "doc_id": key[len(session) + 1:]} for key in ids],
+        documents=[f"text of {key}" for key in ids]
+    )
+    return ids
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    source = server(tmp_path / "source")
+    store(source, "s1", dim=3)
+    path = str(tmp_path / "s1.arrow")
+    source.export_session("s1", path)
+    return path
+
+
+def test_dimension_mismatch_leaves_target_intact(tmp_path, snapshot_path):
+    target = server(tmp_path / "target")
+    ids = store(target, "s1", dim=4)
+    with pytest.raises(SnapshotError, match="dimensions"):
+        target.import_session(snapshot_path, replace=True)
+    assert target.documents.collection.get(where={"timestamp": "s1"}, include=[])["ids"] == ids
+
+
+def test_replace_clears_old_themes_without_new_ones(tmp_path, snapshot_path):
+    target = server(tmp_path / "target")
+    store(target, "s1", dim=3, count=3)
+    target.index.import_run("s1", [{"theme_id": "s1_theme_1", "name": "Fines", "description": "Penalties"}],
+                            [["s1_theme_1", "s1_DOC003", "s1"]])
+    target.theme_collection.upsert(ids=["s1_theme_1"], documents=["Penalties"],
+                                   metadatas=[{"name": "Fines", "timestamp": "s1"}])
+
+    result = target.import_session(snapshot_path, replace=True)
+    assert result["documents"] == 2 and result["themes"] == 0
+    assert target.index.export_run("s1") == {"themes": [], "memberships": []}
+    assert target.theme_collection.get(ids=["s1_theme_1"])["ids"] == []
+    assert sorted(target.documents.collection.get(where={"timestamp": "s1"}, include=[])["ids"]) == [
+        "s1_DOC001", "s1_DOC002"
+    ]
+
+
+def test_quantization_mismatch_is_refused(tmp_path, snapshot_path):
+    quantized = SimpleNamespace(backend="onnx", model_name="all-MiniLM-L6-v2", quantize=True)
+    target = server(tmp_path / "target", embedder=quantized)
+    with pytest.raises(SnapshotError, match="int8"):
+        target.import_session(snapshot_path)
+    assert target.documents.collection.count() == 0
@@ -0,0 +1,117 @@
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+from app.services.vector_store import LocalVectorStore, where_sql
+
+METADATA = {
+    0: {"timestamp": "s1", "duplicate_of": "s0/DOC001", "pages": 3},
+    1: {"timestamp": "s1", "pages": 10},
+    2: {"timestamp": "s2", "duplicate_of": "s1/DOC002"},
+    3: {"timestamp": "s3", "pages": 1},
+    4: None,
+}
+
+
+@pytest.fixture
+def records():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE records (row INTEGER PRIMARY KEY, session TEXT, metadata TEXT)")
+    conn.executemany("INSERT INTO records VALUES (?, ?, ?)",
+                     [(row, (meta or {}).get("timestamp"), json.dumps(meta) if meta else None)
+                      for row, meta in METADATA.items()])
+    yield conn
+    conn.close()
+
+
+def matching(conn, where):
+    clause, params = where_sql(where)
+    return {row for (row,) in conn.execute(f"SELECT row FROM records WHERE {clause}", params)}
+
+
+@pytest.mark.parametrize("where, expected", [
+    ({"timestamp": "s1"}, {0, 1}),
+    ({"timestamp": {"$in": ["s1", "s3"]}}, {0, 1, 3}),
+    ({"timestamp": {"$in": []}}, set()),
+    # Missing fields compare like None: they pass $ne and $nin but never $gt or $in
+    ({"timestamp": {"$ne": "s1"}}, {2, 3, 4}),
+    ({"timestamp": {"$nin": ["s1", "s2"]}}, {3, 4}),
+    ({"duplicate_of": {"$nin": ["s0/DOC001"]}}, {1, 2, 3, 4}),
+    ({"duplicate_of": {"$ne": "s1/DOC002"}}, {0, 1, 3, 4}),
+    ({"duplicate_of": {"$in": ["s0/DOC001", "s1/DOC002"]}}, {0, 2}),
+    ({"pages": {"$gt": 2}}, {0, 1}),
+    ({"pages": {"$gte": 1, "$lt": 10}}, {0, 3}),
+    ({"$and": [{"timestamp": "s1"}, {"pages": {"$lte": 3}}]}, {0}),
+    ({"$or": [{"timestamp": "s2"}, {"pages": 1}]}, {2, 3}),
+    ({"$or": [{"$and": [{"timestamp": "s1"}, {"pages": 10}]}, {"timestamp": {"$eq": "s3"}}]}, {1, 3}),
+    ({"$and": []}, {0, 1, 2, 3, 4}),
+])
+def test_where_sql(records, where, expected):
+    assert matching(records, where) == expected
+
+
+def test_where_sql_rejects_unknown_operator():
+    with pytest.raises(ValueError):
+        where_sql({"pages": {"$like": "1%"}})
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+@pytest.mark.parametrize("index", ["numpy", "hnsw"])
+def test_second_store_sees_other_writers(tmp_path, index):
+    writer = LocalVectorStore(str(tmp_path), "documents", index=index, brute_force_limit=0)
+    reader = LocalVectorStore(str(tmp_path), "documents", index=index, brute_force_limit=0)
+    assert reader.count() == 0 and reader.get()["ids"] == []
+
+    writer.add(ids=["a", "b", "c"], embeddings=[unit(1, 0, 0), unit(0, 1, 0), unit(0, 0, 1)],
+               metadatas=[{"timestamp": "s1"}, {"timestamp": "s1"}, {"timestamp": "s2"}],
+               documents=["alpha", "beta", "gamma"])
+    assert reader.get(where={"timestamp": "s1"})["ids"] == ["a", "b"]
+    assert reader.query(query_embeddings=[unit(0, 0.9, 0.1)], n_results=1)["ids"] == [["b"]]
+
+    writer.upsert(ids=["b"], embeddings=[unit(0, 0, -1)], metadatas=[{"timestamp": "s2"}], documents=["beta v2"])
+    found = reader.get(ids=["b", "a"])
+    assert found["ids"] == ["b", "a"]
+    assert found["documents"] == ["beta v2", "alpha"]
+    assert reader.get(where={"timestamp": "s1"})["ids"] == ["a"]
+    assert reader.query(query_embeddings=[unit(0, 0, -1)], n_results=1)["ids"] == [["b"]]
+    assert reader.query(query_embeddings=[unit(0, 1, 0)], n_results=3)["ids"][0][-1] == "b"
+
+    writer.delete(ids=["a"])
+    assert reader.count() == 2
+    assert reader.get(ids=["a"])["ids"] == []
+    assert "a" not in reader.query(query_embeddings=[unit(1, 0, 0)], n_results=3)["ids"][0]
+
+    # And back the other way, including a delete by filter
+    reader.add(ids=["d"], embeddings=[unit(1, 1, 0)], metadatas=[{"timestamp": "s3"}], documents=["delta"])
+    writer.delete(where={"timestamp": "s2"})
+    assert writer.get()["ids"] == ["d"]
+    assert reader.get()["ids"] == ["d"]
+    assert reader.query(query_embeddings=[unit(0, 0, 1)], n_results=5)["ids"] == [["d"]]
+
+
+def test_hnsw_matches_exact_search(tmp_path):
+    rng = np.random.RandomState(7)
+    vectors = rng.normal(size=(400, 16)).astype(np.float32)
+    ids = [f"doc-{i}" for i in range(len(vectors))]
+    metadatas = [{"timestamp": f"s{i % 4}"} for i in range(len(vectors))]
+    stores = {
+        index: LocalVectorStore(str(tmp_path / index), "documents", index=index, ef_search=400, brute_force_limit=0)
+        for index in ("numpy", "hnsw")
+    }
+    for store in stores.values():
+        store.add(ids=ids, embeddings=vectors.tolist(), metadatas=metadatas)
+        store.delete(ids=ids[::5])
+
+    queries = rng.normal(size=(20, 16)).astype(np.float32).tolist()
+    for where in (None, {"timestamp": "s1"}):
+        exact = stores["numpy"].query(query_embeddings=queries, n_results=5, where=where)
+        approximate = stores["hnsw"].query(query_embeddings=queries, n_results=5, where=where)
+        assert approximate["ids"] == exact["ids"]
+        np.testing.assert_allclose(approximate["distances"], exact["distances"], rtol=1e-4, atol=1e-4)
+        assert not set(ids[::5]) & {row_id for result in approximate["ids"] for row_id in result}